@@ -0,0 +1,269 @@
+"""
+Cohort analytics over the attempt store.
+
+Evaluated attempts are loaded into NumPy columns (categorical fields encoded as
+integer codes, item scores as an attempts x items uint8 matrix). Per-group
+running sums (attempts, overall and diagnosis totals, passes, item score sums
+and Not Done counts) are kept for every specialty, chief complaint and student,
+and updated from only the evaluations written since the last refresh, so a
+dashboard render costs a small delta query plus O(groups) arithmetic instead
+of a rescan of history. A re-evaluated attempt replaces its earlier row: its
+old contribution is subtracted before the new one is added. Evaluations whose
+scoring failed (status 'error' in the store) are left out.
+"""
+import json, os, sqlite3, threading
+import numpy as np
+from attempt_store import DEFAULT_STORE_PATH
+from checklist_scores import (ChecklistScores, ITEMS, N_ITEMS, SECTIONS, SECTION_OFFSETS,
+                              section_totals, unpack_many)
+
+# Overall percentage from which an attempt counts as passed (Borderline or better on the mark sheet)
+PASS_MARK = 60
+
+# Fields the summary is grouped by; "all" has a single group holding every attempt
+GROUP_FIELDS = ("all", "specialty", "chief", "student")
+
+# Attempts in the moving average of a student's trend
+TREND_WINDOW = 5
+
+_DELTA_QUERY = (
+    "SELECT e.rowid, e.attempt_id, a.specialty, a.chief, a.student, a.started_at, "
+    "e.overall_pct, e.diagnosis_pct, e.scores, CASE WHEN e.scores IS NULL THEN e.raw_scores END "
+    "FROM evaluations e JOIN attempts a ON a.id = e.attempt_id "
+    "WHERE e.rowid > ? AND e.status = 'ok' ORDER BY e.rowid"
+)
+
+_SECTION_MAX = np.array([5 * (end - start) for start, end in (SECTION_OFFSETS[s] for s in SECTIONS)])
+_ITEM_SECTION = [section for section in SECTIONS for _ in range(*SECTION_OFFSETS[section])]
+
+class _GroupSummary:
+    """Running per-group sums for one field, indexed by group code"""
+
+    def __init__(self):
+        self.count = np.zeros(0, dtype=np.int64)
+        self.passed = np.zeros(0, dtype=np.int64)
+        self.overall_sum = np.zeros(0, dtype=np.float64)
+        self.dx_sum = np.zeros(0, dtype=np.float64)
+        self.item_sum = np.zeros((0, N_ITEMS), dtype=np.int64)
+        self.not_done = np.zeros((0, N_ITEMS), dtype=np.int64)
+
+    def _grow(self, n_groups):
+        extra = n_groups - len(self.count)
+        if extra <= 0:
+            return
+        for name in ("count", "passed", "overall_sum", "dx_sum", "item_sum", "not_done"):
+            current = getattr(self, name)
+            setattr(self, name, np.concatenate([current, np.zeros((extra,) + current.shape[1:], current.dtype)]))
+
+    def add(self, codes, overall, dx, scores, sign=1):
+        """Add (sign=1) or remove (sign=-1) the contribution of a batch of attempts"""
+        if not len(codes):
+            return
+        self._grow(int(codes.max()) + 1)
+        n = len(self.count)
+        self.count += sign * np.bincount(codes, minlength=n)
+        self.passed += sign * np.bincount(codes, weights=overall >= PASS_MARK, minlength=n).astype(np.int64)
+        self.overall_sum += sign * np.bincount(codes, weights=overall, minlength=n)
+        self.dx_sum += sign * np.bincount(codes, weights=dx, minlength=n)
+
+        # Row sums per group: sort by group, then one reduceat over each run of equal codes
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(sorted_codes)) + 1])
+        groups = sorted_codes[starts]
+        sorted_scores = scores[order]
+        self.item_sum[groups] += sign * np.add.reduceat(sorted_scores, starts, axis=0, dtype=np.int64)
+        self.not_done[groups] += sign * np.add.reduceat(sorted_scores == 0, starts, axis=0, dtype=np.int64)
+
+class Cohort:
+    """
+    Columnar, incrementally refreshed view of the evaluated attempts in an attempt store.
+    Call refresh() before reading to pick up new evaluations.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.n = 0
+        self.labels = {field: [] for field in GROUP_FIELDS}
+        self.summary = {field: _GroupSummary() for field in GROUP_FIELDS}
+        self._codes = {field: {} for field in GROUP_FIELDS}
+        self._row_of = {}      # attempt id -> row
+        self._watermark = 0    # highest evaluations rowid loaded
+        self._columns = {}
+        self._lock = threading.Lock()
+        self._resize(1024)
+        self._encode("all", ["all"])
+
+    def _resize(self, capacity):
+        specs = {"all": (np.int32, ()), "specialty": (np.int32, ()), "chief": (np.int32, ()),
+                 "student": (np.int32, ()), "started_at": (np.float64, ()), "overall": (np.float32, ()),
+                 "dx": (np.float32, ()), "scores": (np.uint8, (N_ITEMS,))}
+        for name, (dtype, shape) in specs.items():
+            column = np.zeros((capacity,) + shape, dtype=dtype)
+            if name in self._columns:
+                column[:self.n] = self._columns[name][:self.n]
+            self._columns[name] = column
+
+    def _encode(self, field, values):
+        """Integer codes of categorical values, adding new labels as they appear"""
+        codes = self._codes[field]
+        labels = self.labels[field]
+        for value in sorted(set(values).difference(codes)):
+            codes[value] = len(labels)
+            labels.append(value)
+        return np.fromiter(map(codes.__getitem__, values), dtype=np.int32, count=len(values))
+
+    def column(self, name):
+        """A column of the loaded attempts (view, don't modify)"""
+        return self._columns[name][:self.n]
+
+    def refresh(self):
+        """
+        Load the evaluations written since the last refresh and update the summaries.
+
+        Returns:
+            Number of evaluations loaded
+        """
+        if not os.path.exists(self.path):
+            return 0
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(_DELTA_QUERY, (self._watermark,)).fetchall()
+        except sqlite3.OperationalError:
+            # Store not initialized yet
+            return 0
+        finally:
+            conn.close()
+        if not rows:
+            return 0
+
+        # Only the latest evaluation of an attempt re-evaluated within this batch counts
+        latest = {row[1]: row for row in rows}
+        batch = list(latest.values())
+        rowids, attempt_ids, specialty, chief, student, started_at, overall, dx, blobs, raw = zip(*batch)
+        blobs = [blob if blob is not None else ChecklistScores.from_raw(json.loads(raw_scores or "{}")).to_bytes()
+                 for blob, raw_scores in zip(blobs, raw)]
+
+        with self._lock:
+            values = {
+                "all": np.zeros(len(batch), dtype=np.int32),
+                "specialty": self._encode("specialty", [s or "" for s in specialty]),
+                "chief": self._encode("chief", [c or "" for c in chief]),
+                "student": self._encode("student", [s or "" for s in student]),
+                "started_at": np.array(started_at, dtype=np.float64),
+                "overall": np.array([o or 0 for o in overall], dtype=np.float32),
+                "dx": np.array([d or 0 for d in dx], dtype=np.float32),
+                "scores": unpack_many(blobs)
+            }
+
+            # Re-evaluated attempts overwrite their row; the old values leave the summaries first
+            rows_out = np.empty(len(batch), dtype=np.int64)
+            replaced = []
+            for i, attempt_id in enumerate(attempt_ids):
+                row = self._row_of.get(attempt_id)
+                if row is None:
+                    row = self._row_of[attempt_id] = self.n + i - len(replaced)
+                else:
+                    replaced.append(row)
+                rows_out[i] = row
+            if replaced:
+                old = np.array(replaced)
+                for field in GROUP_FIELDS:
+                    self.summary[field].add(self._columns[field][old], self._columns["overall"][old],
+                                            self._columns["dx"][old], self._columns["scores"][old], sign=-1)
+
+            new_n = self.n + len(batch) - len(replaced)
+            if new_n > len(self._columns["overall"]):
+                self._resize(max(new_n, 2 * len(self._columns["overall"])))
+            for name, column_values in values.items():
+                self._columns[name][rows_out] = column_values
+            self.n = new_n
+            for field in GROUP_FIELDS:
+                self.summary[field].add(values[field], values["overall"], values["dx"], values["scores"])
+            self._watermark = max(rowids)
+        return len(rows)
+
+    ### ---- Reports ---- ###
+
+    def overview(self):
+        """Attempt count, mean overall and diagnosis percentages and pass rate of the whole cohort"""
+        return self.group_table("all")[0] if self.n else {"attempts": 0}
+
+    def group_table(self, field):
+        """
+        One summary row per group of field (specialty, chief or student), most attempts first.
+
+        Returns:
+            List of dicts with the group label, attempts, mean overall, pass rate,
+            mean diagnosis score and mean percentage per section
+        """
+        with self._lock:
+            summary = self.summary[field]
+            count = summary.count.astype(np.float64)
+            labels = list(self.labels[field])
+            present = np.flatnonzero(count > 0)
+            safe = np.maximum(count, 1)[:, None]
+            section_pct = section_totals(summary.item_sum) / _SECTION_MAX / safe * 100
+            table = {
+                "attempts": summary.count,
+                "mean_overall_pct": summary.overall_sum / safe[:, 0],
+                "pass_rate_pct": summary.passed / safe[:, 0] * 100,
+                "mean_diagnosis_pct": summary.dx_sum / safe[:, 0]
+            }
+            table.update({f"{section}_pct": section_pct[:, i] for i, section in enumerate(SECTIONS)})
+            order = present[np.argsort(-summary.count[present], kind="stable")]
+
+        rows = []
+        for g in order:
+            row = {field: labels[g]}
+            row.update({name: int(values[g]) if name == "attempts" else round(float(values[g]), 1)
+                        for name, values in table.items()})
+            rows.append(row)
+        return rows
+
+    def item_difficulty(self, field="all", label="all"):
+        """
+        Per-item facility (mean score as a percentage of Well Done) and Not Done rate
+        within one group, hardest items first.
+        """
+        with self._lock:
+            code = self._codes[field].get(label)
+            summary = self.summary[field]
+            if code is None or code >= len(summary.count) or summary.count[code] == 0:
+                return []
+            count = summary.count[code]
+            facility = summary.item_sum[code] / (5 * count) * 100
+            not_done = summary.not_done[code] / count * 100
+        return [
+            {"item": int(i) + 1, "section": _ITEM_SECTION[i], "text": ITEMS[i],
+             "facility_pct": round(float(facility[i]), 1), "not_done_pct": round(float(not_done[i]), 1)}
+            for i in np.argsort(facility, kind="stable")
+        ]
+
+    def student_trend(self, student, window=TREND_WINDOW):
+        """
+        A student's evaluated attempts in time order with a moving average of the
+        overall percentage over the last `window` attempts.
+        """
+        with self._lock:
+            code = self._codes["student"].get(student)
+            if code is None:
+                return []
+            rows = np.flatnonzero(self.column("student") == code)
+            rows = rows[np.argsort(self.column("started_at")[rows], kind="stable")]
+            started_at = self.column("started_at")[rows]
+            overall = self.column("overall")[rows].astype(np.float64)
+            section_pct = section_totals(self.column("scores")[rows]) / _SECTION_MAX * 100
+            specialty = [self.labels["specialty"][c] for c in self.column("specialty")[rows]]
+            chief = [self.labels["chief"][c] for c in self.column("chief")[rows]]
+
+        cumulative = np.concatenate([[0.0], np.cumsum(overall)])
+        idx = np.arange(1, len(overall) + 1)
+        start = np.maximum(idx - window, 0)
+        moving = (cumulative[idx] - cumulative[start]) / (idx - start)
+        return [
+            dict({"started_at": float(started_at[i]), "specialty": specialty[i], "chief": chief[i],
+                  "overall_pct": round(float(overall[i]), 1), "moving_avg_pct": round(float(moving[i]), 1)},
+                 **{f"{section}_pct": round(float(section_pct[i, j]), 1) for j, section in enumerate(SECTIONS)})
+            for i in range(len(overall))
+        ]
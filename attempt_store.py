@@ -0,0 +1,282 @@
+"""
+Durable store of exam attempts.
+
+Every station a student sits is one attempt: the case, the transcript, per-turn
+timing, the hints shown and the evaluation. Attempts live in a SQLite file in
+WAL mode, so dashboards can read while the app writes.
+
+Writes never touch the database on the request path: they are queued and a
+background thread commits them in batches (one transaction per batch), so a
+chat turn only pays for a queue put.
+"""
+import json, os, queue, sqlite3, threading, time, uuid
+from persona import case_hash
+from checklist_scores import ChecklistScores
+
+DEFAULT_STORE_PATH = os.getenv("OSCE_ATTEMPT_STORE_PATH", os.path.join("data", "attempts.sqlite3"))
+
+# Write-behind batching: commit when this many writes are queued or the oldest
+# queued write is this old, whichever comes first
+FLUSH_BATCH_SIZE = 200
+FLUSH_INTERVAL_S = 0.5
+
+# Case keys added during an exam that are stored in their own tables
+_EXAM_KEYS = {"result", "transcript", "student_dx", "generated_timestamp"}
+
+# Evaluation fields stored as columns (raw_scores and missed_items are also stored as JSON,
+# and the item scores packed by ChecklistScores.to_bytes in the scores column). An
+# evaluation whose scoring failed is stored with status 'error' (see record_evaluation).
+EVALUATION_COLUMNS = ["overall_pct", "checklist_pct", "history_pct", "exam_pct", "lab_pct",
+                      "management_pct", "interaction_pct", "diagnosis_pct", "correct_dx", "comments"]
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS cases ("
+    "id TEXT PRIMARY KEY, lang TEXT, chief TEXT, diagnosis TEXT, case_json TEXT NOT NULL)",
+
+    "CREATE TABLE IF NOT EXISTS attempts ("
+    "id TEXT PRIMARY KEY, exam_id TEXT, station INTEGER, student TEXT NOT NULL DEFAULT '', "
+    "specialty TEXT NOT NULL DEFAULT '', chief TEXT NOT NULL DEFAULT '', lang TEXT, "
+    "case_id TEXT REFERENCES cases (id), student_dx TEXT, ddx TEXT, "
+    "started_at REAL NOT NULL, finished_at REAL)",
+
+    "CREATE TABLE IF NOT EXISTS transcripts ("
+    "attempt_id TEXT PRIMARY KEY REFERENCES attempts (id), transcript TEXT, messages_json TEXT)",
+
+    "CREATE TABLE IF NOT EXISTS turn_timing ("
+    "attempt_id TEXT NOT NULL REFERENCES attempts (id), turn INTEGER, ttft REAL, total REAL, "
+    "prefetched INTEGER)",
+
+    "CREATE TABLE IF NOT EXISTS evaluations ("
+    "attempt_id TEXT PRIMARY KEY REFERENCES attempts (id), overall_pct REAL, checklist_pct REAL, "
+    "history_pct REAL, exam_pct REAL, lab_pct REAL, management_pct REAL, interaction_pct REAL, "
+    "diagnosis_pct REAL, correct_dx TEXT, comments TEXT, raw_scores TEXT, missed_items TEXT, "
+    "scores BLOB, status TEXT NOT NULL DEFAULT 'ok', evaluated_at REAL NOT NULL)",
+
+    "CREATE TABLE IF NOT EXISTS hints ("
+    "attempt_id TEXT NOT NULL REFERENCES attempts (id), turn INTEGER, hint TEXT, created_at REAL NOT NULL)",
+
+    "CREATE INDEX IF NOT EXISTS idx_attempts_student ON attempts (student, started_at)",
+    "CREATE INDEX IF NOT EXISTS idx_attempts_specialty ON attempts (specialty, started_at)",
+    "CREATE INDEX IF NOT EXISTS idx_attempts_started ON attempts (started_at)",
+    "CREATE INDEX IF NOT EXISTS idx_turn_timing_attempt ON turn_timing (attempt_id)",
+    "CREATE INDEX IF NOT EXISTS idx_hints_attempt ON hints (attempt_id)"
+]
+
+def clean_case(case):
+    """The case without runtime and exam keys"""
+    return {k: v for k, v in case.items() if not k.startswith("_") and k not in _EXAM_KEYS}
+
+class AttemptStore:
+    """
+    SQLite attempt store with a write-behind queue.
+
+    The record_* methods only enqueue; a background thread commits queued
+    writes in batches, in the order they were made. flush() waits until
+    everything queued so far is committed.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, batch_size=FLUSH_BATCH_SIZE, flush_interval=FLUSH_INTERVAL_S):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._closed = False
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+            # Stores created before packed scores or evaluation status were added
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(evaluations)")}
+            if "scores" not in columns:
+                self._conn.execute("ALTER TABLE evaluations ADD COLUMN scores BLOB")
+            if "status" not in columns:
+                self._conn.execute("ALTER TABLE evaluations ADD COLUMN status TEXT NOT NULL DEFAULT 'ok'")
+        # Separate connection for reads, so queries don't wait on a batch commit
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._reader.row_factory = sqlite3.Row
+        self._reader_lock = threading.Lock()
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name="attempt-store")
+        self._writer.start()
+
+    ### ---- Writes (queued) ---- ###
+
+    def _enqueue(self, sql, params):
+        if self._closed:
+            raise RuntimeError("Attempt store is closed")
+        self._queue.put((sql, params))
+
+    def start_attempt(self, case, lang="en", student="", specialty="", exam_id=None, station=0):
+        """
+        Record that a student started a station.
+
+        Returns:
+            The new attempt id
+        """
+        attempt_id = uuid.uuid4().hex
+        clean = clean_case(case)
+        case_id = case_hash(clean)
+        self._enqueue(
+            "INSERT OR IGNORE INTO cases (id, lang, chief, diagnosis, case_json) VALUES (?, ?, ?, ?, ?)",
+            (case_id, lang, clean.get("chiefComplaint", ""), clean.get("answer_key", {}).get("main_diagnosis", ""),
+             json.dumps(clean, ensure_ascii=False))
+        )
+        self._enqueue(
+            "INSERT INTO attempts (id, exam_id, station, student, specialty, chief, lang, case_id, started_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (attempt_id, exam_id, station, student or "", specialty or "", clean.get("chiefComplaint", ""),
+             lang, case_id, time.time())
+        )
+        return attempt_id
+
+    def finish_attempt(self, attempt_id, transcript, messages=(), student_dx="", ddx="", turn_timing=()):
+        """Record the end of a station: diagnosis, transcript and per-turn timing"""
+        self._enqueue(
+            "UPDATE attempts SET student_dx = ?, ddx = ?, finished_at = ? WHERE id = ?",
+            (student_dx, ddx, time.time(), attempt_id)
+        )
+        self._enqueue(
+            "INSERT OR REPLACE INTO transcripts (attempt_id, transcript, messages_json) VALUES (?, ?, ?)",
+            (attempt_id, transcript, json.dumps(list(messages), ensure_ascii=False))
+        )
+        for timing in turn_timing:
+            self._enqueue(
+                "INSERT INTO turn_timing (attempt_id, turn, ttft, total, prefetched) VALUES (?, ?, ?, ?, ?)",
+                (attempt_id, timing.get("turn"), timing.get("ttft"), timing.get("total"),
+                 int(bool(timing.get("prefetched"))))
+            )
+
+    def record_evaluation(self, attempt_id, result):
+        """
+        Record (or replace) the evaluation object of an attempt.
+
+        A result whose scoring failed (evaluator._error_result, flagged "error")
+        is stored with status 'error' and never replaces a successful evaluation.
+        A replaced evaluation gets a new rowid, which analytics.Cohort relies on
+        to pick up re-evaluations.
+        """
+        columns = EVALUATION_COLUMNS + ["raw_scores", "missed_items", "scores", "status", "evaluated_at"]
+        raw_scores = result.get("raw_scores", {})
+        values = [result.get(column) for column in EVALUATION_COLUMNS] + [
+            json.dumps(raw_scores),
+            json.dumps(result.get("missed_items", []), ensure_ascii=False),
+            ChecklistScores.from_raw(raw_scores).to_bytes(),
+            "error" if result.get("error") else "ok",
+            time.time()
+        ]
+        self._enqueue(
+            f"INSERT OR REPLACE INTO evaluations (attempt_id, {', '.join(columns)}) "
+            f"SELECT ?, {', '.join('?' * len(columns))} "
+            f"WHERE ? = 'ok' OR NOT EXISTS (SELECT 1 FROM evaluations WHERE attempt_id = ? AND status = 'ok')",
+            (attempt_id, *values, values[-2], attempt_id)
+        )
+
+    def record_hint(self, attempt_id, hint, turn=None):
+        """Record a hint shown during an attempt"""
+        self._enqueue(
+            "INSERT INTO hints (attempt_id, turn, hint, created_at) VALUES (?, ?, ?, ?)",
+            (attempt_id, turn, hint, time.time())
+        )
+
+    def _write_loop(self):
+        """Background writer body: collect a batch, commit it, repeat"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+            self._commit(batch)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _commit(self, batch):
+        """Run a batch in one transaction; runs of the same statement go through executemany"""
+        try:
+            with self._conn:
+                start = 0
+                while start < len(batch):
+                    end = start + 1
+                    while end < len(batch) and batch[end][0] == batch[start][0]:
+                        end += 1
+                    self._conn.executemany(batch[start][0], [params for _, params in batch[start:end]])
+                    start = end
+            self.written += len(batch)
+        except sqlite3.Error as e:
+            self.failed += len(batch)
+            print(f"Error writing {len(batch)} attempt store records: {str(e)}")
+
+    def flush(self):
+        """Block until every write queued so far is committed"""
+        self._queue.join()
+
+    def close(self):
+        """Commit the queued writes and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        self._conn.close()
+        with self._reader_lock:
+            self._reader.close()
+
+    ### ---- Reads ---- ###
+
+    def query(self, sql, params=()):
+        """Run a read-only query and return the rows as dicts"""
+        with self._reader_lock:
+            return [dict(row) for row in self._reader.execute(sql, params)]
+
+    def attempts(self, student=None, specialty=None, since=None, until=None, limit=None):
+        """
+        Attempts with their evaluation and its status (None fields if not evaluated yet), newest first.
+
+        Args:
+            student: Only this student's attempts
+            specialty: Only attempts from this specialty
+            since, until: Unix time bounds on when the attempt started
+            limit: Maximum number of attempts
+        """
+        clauses, params = [], []
+        for clause, value in [("a.student = ?", student), ("a.specialty = ?", specialty),
+                              ("a.started_at >= ?", since), ("a.started_at < ?", until)]:
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        sql = (
+            "SELECT a.*, " + ", ".join(f"e.{column}" for column in EVALUATION_COLUMNS) + ", e.raw_scores, e.status "
+            "FROM attempts a LEFT JOIN evaluations e ON e.attempt_id = a.id"
+            + (" WHERE " + " AND ".join(clauses) if clauses else "")
+            + " ORDER BY a.started_at DESC"
+            + (" LIMIT ?" if limit else "")
+        )
+        rows = self.query(sql, params + ([limit] if limit else []))
+        for row in rows:
+            row["raw_scores"] = json.loads(row["raw_scores"]) if row["raw_scores"] else None
+        return rows
+
+    def stats(self):
+        """Queued, written and failed write counts"""
+        return {"queued": self._queue.qsize(), "written": self.written, "failed": self.failed}
@@ -0,0 +1,288 @@
+"""
+Calibration of the diagnosis matcher thresholds.
+
+Every labeled pair is a student diagnosis, an answer-key term and the grade a
+clinician would give it:
+    full    - the same diagnosis (spelling slips, word order, abbreviations, synonyms)
+    partial - the right disease named imprecisely or incompletely
+    none    - a different disease, however alike the spelling
+
+The matcher decides most pairs by comparing their words; the cosine thresholds
+only grade the pairs it leaves undecided. The script sweeps MAIN_FULL_MATCH /
+MAIN_PARTIAL_MATCH (keeping a partial band at least MIN_PARTIAL_BAND wide) and
+DIFFERENTIAL_MATCH (full or partial = credited) over the fitting pairs only,
+then reports the accuracy of the fitted and the current thresholds on the
+fitting pairs and on held-out pairs that took no part in the fit, with every
+pair they get wrong.
+
+Usage:
+    python benchmarks/dx_calibration.py [--input pairs.jsonl] [--output report.json]
+
+Each input line is {"student": "...", "term": "...", "label": "full" | "partial" | "none",
+"split": "fit" | "held_out"}; without a split, one pair in four is held out.
+"""
+import argparse, json, os, sys, zlib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dx_matcher
+from dx_matcher import similarities, word_matches, match_levels, FULL_MATCH, PARTIAL_MATCH
+
+# Narrowest partial band the sweep may choose
+MIN_PARTIAL_BAND = 0.1
+
+LABELED_PAIRS = [
+    # Same diagnosis
+    ("Myocardial infraction", "Myocardial infarction", "full"),
+    ("myocardial infarct", "Myocardial infarction", "full"),
+    ("Heart attack", "Myocardial infarction", "full"),
+    ("STEMI", "Myocardial infarction", "full"),
+    ("ACS", "Acute coronary syndrome", "full"),
+    ("acute coronary syndrom", "Acute coronary syndrome", "full"),
+    ("Pulmonary embolus", "Pulmonary embolism", "full"),
+    ("PE", "Pulmonary embolism", "full"),
+    ("DVT", "Deep vein thrombosis", "full"),
+    ("deep venous thrombosis", "Deep vein thrombosis", "full"),
+    ("GERD", "Gastroesophageal reflux disease", "full"),
+    ("gastro-oesophageal reflux disease", "Gastroesophageal reflux disease", "full"),
+    ("Pneumothorax", "Spontaneous pneumothorax", "full"),
+    ("Community-acquired pneumonia", "Community acquired pneumonia", "full"),
+    ("COPD exacerbation", "Acute exacerbation of COPD", "full"),
+    ("CHF", "Congestive heart failure", "full"),
+    ("Atrial fibrilation", "Atrial fibrillation", "full"),
+    ("Appendicitis", "Acute appendicitis", "full"),
+    ("acute apendicitis", "Acute appendicitis", "full"),
+    ("Cholecystitis", "Acute cholecystitis", "full"),
+    ("Gastroenteritis", "Acute gastroenteritis", "full"),
+    ("Renal colic", "Renal colic (ureteric stone)", "full"),
+    ("Pyelonephritis", "Acute pyelonephritis", "full"),
+    ("UTI", "Urinary tract infection", "full"),
+    ("IBS", "Irritable bowel syndrome", "full"),
+    ("Pancreatitis", "Acute pancreatitis", "full"),
+    ("Ectopic pregnancy", "Ruptured ectopic pregnancy", "full"),
+    ("Migrane", "Migraine", "full"),
+    ("Tension headache", "Tension-type headache", "full"),
+    ("SAH", "Subarachnoid hemorrhage", "full"),
+    ("subarachnoid haemorrhage", "Subarachnoid hemorrhage", "full"),
+    ("Bacterial meningitis", "Meningitis", "full"),
+    ("TIA", "Transient ischemic attack", "full"),
+    ("BPPV", "Benign paroxysmal positional vertigo", "full"),
+    ("Iron deficiency anaemia", "Iron deficiency anemia", "full"),
+    ("type 2 diabetes", "Type 2 diabetes mellitus", "full"),
+    ("DKA", "Diabetic ketoacidosis", "full"),
+    ("Hypothyroid", "Hypothyroidism", "full"),
+    ("Primary hypothyroidism", "Hypothyroidism", "full"),
+    ("Rheumatoid arthritis", "Rheumatoid arthritis", "full"),
+    ("Osteoarthritis of the knee", "Osteoarthritis", "full"),
+    ("Septic arthritis of the knee", "Septic arthritis", "full"),
+    ("SLE", "Systemic lupus erythematosus", "full"),
+    ("Slipped disc", "Lumbar disc herniation", "full"),
+    ("Cellulitis of the leg", "Cellulitis", "full"),
+    ("Major depression", "Major depressive disorder", "full"),
+    ("Generalised anxiety disorder", "Generalized anxiety disorder", "full"),
+    ("احتشاء عضلة القلب", "Myocardial infarction", "full"),
+    ("الربو", "الربو", "full"),
+    ("التهاب الزائده الدوديه", "التهاب الزائدة الدودية", "full"),
+    ("Spinal stenosis", "Lumbar spinal stenosis", "full"),
+    ("Pulmonary embolism with infarction", "Pulmonary embolism", "full"),
+    ("gastro-oesophageal reflux", "Gastroesophageal reflux disease", "full"),
+    ("Acid reflux", "Gastroesophageal reflux disease", "full"),
+    ("Deep venous thrombosis of the leg", "Deep vein thrombosis", "full"),
+
+    # Right disease, named imprecisely or incompletely
+    ("myocardial", "Myocardial infarction", "none"),
+    ("infarction", "Myocardial infarction", "partial"),
+    ("angina", "Unstable angina", "partial"),
+    ("pneumonia", "Community acquired pneumonia", "partial"),
+    ("heart failure", "Congestive heart failure", "partial"),
+    ("diabetes", "Type 2 diabetes mellitus", "partial"),
+    ("Thyroid disease", "Hypothyroidism", "partial"),
+    ("Anxiety disorder", "Generalized anxiety disorder", "partial"),
+    ("Depression", "Major depressive disorder", "partial"),
+    ("Colitis", "Ulcerative colitis", "partial"),
+    ("disc herniation", "Lumbar disc herniation", "partial"),
+    ("Iron deficiency", "Iron deficiency anemia", "partial"),
+    ("Peptic ulcer", "Perforated peptic ulcer", "full"),
+
+    # Different diseases
+    ("Osteoporosis", "Osteoarthritis", "none"),
+    ("Rheumatoid arthritis", "Osteoarthritis", "none"),
+    ("Septic arthritis", "Gout", "none"),
+    ("Type 1 diabetes", "Type 2 diabetes mellitus", "none"),
+    ("Gestational diabetes", "Type 2 diabetes mellitus", "none"),
+    ("Diabetes insipidus", "Type 2 diabetes mellitus", "none"),
+    ("Chronic pancreatitis", "Acute pancreatitis", "none"),
+    ("Ulcerative colitis", "Crohn disease", "none"),
+    ("Health anxiety", "Generalized anxiety disorder", "none"),
+    ("Panic disorder", "Generalized anxiety disorder", "none"),
+    ("Bipolar disorder", "Major depressive disorder", "none"),
+    ("Hypothyroidism", "Hyperthyroidism", "none"),
+    ("Hypertension", "Hypotension", "none"),
+    ("Stable angina", "Unstable angina", "none"),
+    ("Gastritis", "Gastroenteritis", "none"),
+    ("Cholecystitis", "Cholangitis", "none"),
+    ("Cholecystitis", "Pancreatitis", "none"),
+    ("UTI", "Pyelonephritis", "none"),
+    ("Tension headache", "Migraine", "none"),
+    ("Cluster headache", "Tension-type headache", "none"),
+    ("Meningitis", "Encephalitis", "none"),
+    ("Pneumonia", "Pneumothorax", "none"),
+    ("Pulmonary embolism", "Pulmonary edema", "none"),
+    ("Pericarditis", "Myocarditis", "none"),
+    ("Bronchitis", "Bronchiectasis", "none"),
+    ("Asthma", "COPD", "none"),
+    ("Acute bronchitis", "Acute asthma", "none"),
+    ("Acute cholecystitis", "Acute appendicitis", "none"),
+    ("Acute pancreatitis", "Acute appendicitis", "none"),
+    ("Gastroenteritis", "Acute appendicitis", "none"),
+    ("Diverticulitis", "Appendicitis", "none"),
+    ("Hyperthyroidism", "Hyperparathyroidism", "none"),
+    ("Iron deficiency anemia", "Vitamin B12 deficiency anemia", "none"),
+    ("Psoriasis", "Psoriatic arthritis", "none"),
+    ("Urticaria", "Cellulitis", "none"),
+    ("Sinusitis", "Cellulitis", "none"),
+    ("Ischemic stroke", "Hemorrhagic stroke", "none"),
+    ("Heart failure", "Renal failure", "none"),
+    ("Miscarriage", "Ectopic pregnancy", "none"),
+    ("Vestibular neuritis", "BPPV", "none"),
+    ("Atrial flutter", "Atrial fibrillation", "none"),
+    ("Lobar pneumonia", "Community acquired pneumonia", "partial"),
+    ("Viral pneumonia", "Aspiration pneumonia", "none"),
+]
+
+# Written separately from the pairs above and never used to fit the thresholds
+HELD_OUT_PAIRS = [
+    ("kidney stone", "Nephrolithiasis", "full"),
+    ("Renal calculi", "Nephrolithiasis", "full"),
+    ("Gallstones", "Cholelithiasis", "full"),
+    ("Asthma", "Acute asthma exacerbation", "full"),
+    ("Left-sided pneumothorax", "Spontaneous pneumothorax", "full"),
+    ("Pulmonary emboli", "Pulmonary embolism", "full"),
+    ("Acute MI", "Myocardial infarction", "full"),
+    ("Diabetic ketoacidosis", "DKA", "full"),
+    ("Cellulitis", "Cellulitis of the left leg", "full"),
+    ("Acute cholecystitis", "Cholecystitis", "full"),
+    ("Bell palsy", "Bell's palsy", "full"),
+    ("Iron-deficiency anemia", "Iron deficiency anemia", "full"),
+    ("Urinary tract infection", "UTI", "full"),
+    ("Septic arthritis", "Septic arthritis of the right knee", "full"),
+    ("Pneumonia", "Community-acquired pneumonia", "partial"),
+    ("Heart failure", "Heart failure with reduced ejection fraction", "partial"),
+    ("Arthritis", "Rheumatoid arthritis", "partial"),
+    ("Hepatitis", "Hepatitis B", "partial"),
+    ("Anemia", "Iron deficiency anemia", "partial"),
+    ("Stroke", "Ischemic stroke", "partial"),
+    ("Colitis", "Ischemic colitis", "partial"),
+    ("Diabetes", "Type 1 diabetes mellitus", "partial"),
+    ("Gastritis", "Gastroenteritis", "none"),
+    ("Hyperthyroidism", "Hyperparathyroidism", "none"),
+    ("Iron deficiency anemia", "B12 deficiency anemia", "none"),
+    ("Folate deficiency anemia", "Iron deficiency anemia", "none"),
+    ("Hepatitis A", "Hepatitis B", "none"),
+    ("Nephritis", "Nephrosis", "none"),
+    ("Hypoglycemia", "Hyperglycemia", "none"),
+    ("Liver failure", "Heart failure", "none"),
+    ("Viral meningitis", "Bacterial meningitis", "none"),
+    ("Pleurisy", "Pleural effusion", "none"),
+    ("Esophagitis", "Gastritis", "none"),
+    ("Cystitis", "Pyelonephritis", "none"),
+    ("Otitis media", "Otitis externa", "none"),
+    ("Ulcerative colitis", "Ischemic colitis", "none"),
+    ("Angina", "Myocardial infarction", "none"),
+    ("Sciatica", "Spinal stenosis", "none"),
+    ("Bronchiolitis", "Bronchitis", "none"),
+    ("Cholangitis", "Cholecystitis", "none"),
+    ("Hemorrhagic stroke", "Ischemic stroke", "none"),
+]
+
+GRADES = {"full": 100, "partial": 75, "none": 0}
+
+def _features(pairs):
+    """Cosine similarity and word-comparison level of every pair"""
+    sims = np.array([float(similarities(student, [term])[0]) for student, term, _ in pairs])
+    decided = np.array([int(word_matches(student, [term])[0]) for student, term, _ in pairs])
+    return sims, decided
+
+def _main_grades(sims, decided, full, partial):
+    levels = match_levels(sims, decided, full, partial)
+    return np.select([levels == FULL_MATCH, levels == PARTIAL_MATCH], [100, 75], default=0)
+
+def sweep(pairs, step=0.01):
+    """
+    Best thresholds for the labeled pairs.
+
+    Full/partial minimize the mean absolute grade error, so crediting a
+    different disease costs more than grading the right one 75 instead of 100;
+    the differential threshold maximizes the correct credited/not-credited
+    calls. Only the pairs the word comparison leaves undecided depend on the
+    thresholds; ties go to the thresholds furthest from their similarities.
+    """
+    sims, decided = _features(pairs)
+    expected = np.array([GRADES[label] for _, _, label in pairs])
+    credited = expected > 0
+    open_sims = sims[decided == dx_matcher.UNDECIDED]
+    grid = np.round(np.arange(0.3, 0.96, step), 2)
+
+    def margin(threshold):
+        return np.abs(open_sims - threshold).min() if len(open_sims) else 1.0
+
+    best_main = max(((f, p) for f in grid for p in grid if f - p >= MIN_PARTIAL_BAND - 1e-9),
+                    key=lambda fp: (-np.abs(_main_grades(sims, decided, *fp) - expected).sum(),
+                                    margin(fp[0]) + margin(fp[1])))
+    best_diff = max(grid, key=lambda t: (((match_levels(sims, decided, t, t) > 0) == credited).sum(), margin(t)))
+    return best_main, best_diff
+
+def evaluate(pairs, full, partial, differential):
+    """Accuracy and misgraded pairs at the given thresholds"""
+    sims, decided = _features(pairs)
+    expected = np.array([GRADES[label] for _, _, label in pairs])
+    grades = _main_grades(sims, decided, full, partial)
+    credited = match_levels(sims, decided, differential, differential) > 0
+    wrong = [{"student": s, "term": t, "label": label, "similarity": round(float(sim), 3),
+              "decided_by_words": bool(d != dx_matcher.UNDECIDED), "grade": int(g)}
+             for (s, t, label), sim, d, g, e in zip(pairs, sims, decided, grades, expected) if g != e]
+    return {
+        "thresholds": {"full": float(full), "partial": float(partial), "differential": float(differential)},
+        "pairs": len(pairs),
+        "decided_by_words_pct": round(100 * float((decided != dx_matcher.UNDECIDED).mean()), 1),
+        "main_accuracy_pct": round(100 * float((grades == expected).mean()), 1),
+        "main_mean_abs_error": round(float(np.abs(grades - expected).mean()), 2),
+        "differential_accuracy_pct": round(100 * float((credited == (expected > 0)).mean()), 1),
+        "misgraded": wrong
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the diagnosis matcher thresholds on labeled pairs")
+    parser.add_argument("--input", help="JSONL file of {student, term, label[, split]} pairs")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        fit, held_out = [], []
+        for r in records:
+            pair = (r["student"], r["term"], r["label"])
+            split = r.get("split") or ("held_out" if zlib.crc32(json.dumps(pair).encode("utf-8")) % 4 == 0
+                                       else "fit")
+            (held_out if split == "held_out" else fit).append(pair)
+    else:
+        fit, held_out = LABELED_PAIRS, HELD_OUT_PAIRS
+
+    (full, partial), differential = sweep(fit)
+    current = (dx_matcher.MAIN_FULL_MATCH, dx_matcher.MAIN_PARTIAL_MATCH, dx_matcher.DIFFERENTIAL_MATCH)
+    report = {
+        "fitted": {"fit": evaluate(fit, full, partial, differential),
+                   "held_out": evaluate(held_out, full, partial, differential) if held_out else None},
+        "current": {"fit": evaluate(fit, *current),
+                    "held_out": evaluate(held_out, *current) if held_out else None}
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
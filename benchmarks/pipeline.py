@@ -0,0 +1,273 @@
+"""
+Benchmark: the full exam pipeline against the in-process fake model.
+
+Every stage of an exam - generate_station, custom_case_generator,
+patient_simulation, generate_hint, evaluate and render_mark_sheet - is run
+against FakeLLM with a configurable latency, across several exam sizes and
+transcript lengths. For each stage the script reports p50/p95/p99 latency,
+throughput, prompt/completion tokens and the peak RSS of the process after
+the stage, as one JSON document that can be diffed between commits.
+
+Usage:
+    python benchmarks/pipeline.py [--latency-ms 200] [--jitter-ms 50]
+                                  [--stations 1,3,5,10] [--turns 4,12,24]
+                                  [--repeats 3] [--rate-limits] [--output report.json]
+                                  [--compare previous_report.json]
+
+With --compare the p50/p95 latency of every stage is printed next to the
+previous report's values.
+"""
+import argparse, json, os, platform, resource, subprocess, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openai_utils
+from fake_llm import FakeLLM
+from llm_backends import FakeBackend
+from prescore_agreement import CountingBackend
+from case_generator import generate_station, generate_stations, custom_case_generator
+from openai_utils import patient_simulation
+from hint_engine import generate_hint
+from evaluator import evaluate, render_mark_sheet
+
+CHIEF_COMPLAINTS = ["Chest pain", "Abdominal pain", "Headache", "Shortness of breath", "Fever",
+                    "Back pain", "Cough", "Dizziness", "Rash", "Joint pain"]
+
+CUSTOM_DESCRIPTIONS = [
+    "A 58-year-old man with crushing chest pain radiating to the left arm",
+    "A 24-year-old woman with sudden severe headache and neck stiffness",
+    "A 70-year-old smoker with a chronic cough and weight loss"
+]
+
+# Student questions cycled to build transcripts of any length
+STUDENT_QUESTIONS = [
+    "Hello, I'm Dr Smith. Can you confirm your name and age?",
+    "What brings you in today?",
+    "When did it start and how has it changed since?",
+    "Can you describe the pain? Does it spread anywhere?",
+    "What makes it better or worse?",
+    "Any fever, weight loss or night sweats?",
+    "Do you have any other medical conditions?",
+    "Are you taking any medications? Any allergies?",
+    "Does anyone in your family have similar problems?",
+    "Do you smoke or drink alcohol? What do you do for work?",
+    "Is it okay if I examine you now?",
+    "I'd like to order some blood tests and imaging."
+]
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def git_commit():
+    """Current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+class StageRecorder:
+    """Collects latencies and token counts per stage"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.stages = {}
+
+    def run(self, stage, fn, *args, items=1, **kwargs):
+        """
+        Call fn, recording its latency and the tokens it used under stage.
+        items is how many units (e.g. stations) the call processed, for throughput.
+        """
+        self.backend.reset()
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        entry = self.stages.setdefault(stage, {"latencies": [], "calls": 0, "prompt_tokens": 0,
+                                               "completion_tokens": 0, "items": 0})
+        entry["latencies"].append(elapsed)
+        entry["calls"] += self.backend.calls
+        entry["prompt_tokens"] += self.backend.prompt_tokens
+        entry["completion_tokens"] += self.backend.completion_tokens
+        entry["items"] += items
+        entry["peak_rss_mb"] = peak_rss_mb()
+        return result
+
+    def report(self):
+        """Summary dict per stage"""
+        report = {}
+        for stage, entry in self.stages.items():
+            latencies = sorted(entry["latencies"])
+            total_time = sum(latencies)
+            runs = len(latencies)
+            report[stage] = {
+                "runs": runs,
+                "p50_ms": round(1000 * percentile(latencies, 50), 2),
+                "p95_ms": round(1000 * percentile(latencies, 95), 2),
+                "p99_ms": round(1000 * percentile(latencies, 99), 2),
+                "mean_ms": round(1000 * total_time / runs, 2),
+                "throughput_per_s": round(entry["items"] / total_time, 2) if total_time else None,
+                "llm_calls": entry["calls"],
+                "prompt_tokens": entry["prompt_tokens"],
+                "completion_tokens": entry["completion_tokens"],
+                "tokens_per_run": round((entry["prompt_tokens"] + entry["completion_tokens"]) / runs, 1),
+                "peak_rss_mb": entry["peak_rss_mb"]
+            }
+        return report
+
+def simulate_consultation(recorder, case, turns, stage):
+    """Run a consultation of the given number of student turns; returns the transcript"""
+    chat_history = []
+    for i in range(turns):
+        question = STUDENT_QUESTIONS[i % len(STUDENT_QUESTIONS)]
+        reply = recorder.run(stage, patient_simulation, case, question, chat_history)
+        chat_history.append({"role": "user", "content": question})
+        chat_history.append({"role": "assistant", "content": reply})
+    return "\n".join(f"{'Student' if m['role'] == 'user' else 'Patient'}: {m['content']}"
+                     for m in chat_history)
+
+def _set_rate_limits(limits):
+    """Replace the async client's per-model rate limits and drop its existing buckets"""
+    openai_utils.MODEL_RATE_LIMITS = limits
+    with openai_utils._buckets_lock:
+        openai_utils._buckets.clear()
+
+def run(stations=(1, 3, 5, 10), turns=(4, 12, 24), repeats=3, lang="en", per_section=True,
+        latency_ms=200, jitter_ms=50, seed=0, rate_limits=False):
+    """
+    Run every scenario and return the report dict.
+
+    Unless rate_limits is set, the async client's OpenAI rate limits are lifted:
+    against a fast fake model they would dominate the timings.
+    """
+    previous_backend = openai_utils.get_backend()
+    previous_limits = openai_utils.MODEL_RATE_LIMITS
+    backend = CountingBackend(FakeBackend(FakeLLM(latency_ms=latency_ms, jitter_ms=jitter_ms, seed=seed)))
+    # Cached responses would hide repeated calls, so run uncached
+    openai_utils.set_cache(None)
+    openai_utils.set_backend(backend)
+    if not rate_limits:
+        _set_rate_limits({model: {"rpm": 10**9, "tpm": 10**12} for model in previous_limits})
+    recorder = StageRecorder(backend)
+    exams = []
+
+    try:
+        for r in range(repeats):
+            case = recorder.run("generate_station", generate_station, lang,
+                                {"chief_complaint": CHIEF_COMPLAINTS[r % len(CHIEF_COMPLAINTS)]})
+            recorder.run("custom_case_generator", custom_case_generator, lang,
+                         CUSTOM_DESCRIPTIONS[r % len(CUSTOM_DESCRIPTIONS)])
+
+            # Per-turn and per-transcript stages at each transcript length
+            for n_turns in turns:
+                transcript = simulate_consultation(recorder, case, n_turns, f"patient_simulation[turns={n_turns}]")
+                recorder.run(f"generate_hint[turns={n_turns}]", generate_hint, lang, transcript)
+                result = recorder.run(f"evaluate[turns={n_turns}]", evaluate, lang, transcript,
+                                      "Acute coronary syndrome", case.get("answer_key", {}),
+                                      case=case, per_section=per_section, prescore=True)
+                for _ in range(100):
+                    recorder.run("render_mark_sheet", render_mark_sheet, result["raw_scores"],
+                                 "Acute coronary syndrome", result["correct_dx"], result["diagnosis_pct"],
+                                 result["overall_pct"], result["comments"])
+
+            # Whole exams: generate every station concurrently, then run each one
+            for n_stations in stations:
+                specs = [{"chief_complaint": CHIEF_COMPLAINTS[i % len(CHIEF_COMPLAINTS)]} for i in range(n_stations)]
+                start = time.perf_counter()
+                cases = recorder.run(f"generate_stations[stations={n_stations}]", generate_stations,
+                                     lang, specs, items=n_stations)
+                for station in cases:
+                    transcript = simulate_consultation(recorder, station, min(turns), "exam_patient_turn")
+                    recorder.run("exam_evaluate", evaluate, lang, transcript, "", station.get("answer_key", {}),
+                                 case=station, per_section=per_section, prescore=True)
+                elapsed = time.perf_counter() - start
+                exams.append({"stations": n_stations, "wall_s": round(elapsed, 3),
+                              "stations_per_s": round(n_stations / elapsed, 3)})
+    finally:
+        openai_utils.set_backend(previous_backend)
+        if not rate_limits:
+            _set_rate_limits(previous_limits)
+
+    by_size = {}
+    for exam in exams:
+        by_size.setdefault(exam["stations"], []).append(exam)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": int(time.time()),
+            "latency_ms": latency_ms,
+            "jitter_ms": jitter_ms,
+            "repeats": repeats,
+            "per_section": per_section,
+            "rate_limits": rate_limits,
+            "lang": lang
+        },
+        "stages": recorder.report(),
+        "exams": {
+            str(size): {
+                "runs": len(runs),
+                "mean_wall_s": round(sum(e["wall_s"] for e in runs) / len(runs), 3),
+                "mean_stations_per_s": round(sum(e["stations_per_s"] for e in runs) / len(runs), 3)
+            }
+            for size, runs in sorted(by_size.items())
+        },
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def compare(report, previous):
+    """Print p50/p95 latency per stage next to a previous report"""
+    print(f"{'stage':<40} {'p50 ms':>18} {'p95 ms':>18}")
+    for stage, stats in report["stages"].items():
+        old = previous.get("stages", {}).get(stage)
+        if old:
+            p50 = f"{old['p50_ms']:.1f} -> {stats['p50_ms']:.1f}"
+            p95 = f"{old['p95_ms']:.1f} -> {stats['p95_ms']:.1f}"
+        else:
+            p50, p95 = f"{stats['p50_ms']:.1f} (new)", f"{stats['p95_ms']:.1f} (new)"
+        print(f"{stage:<40} {p50:>18} {p95:>18}")
+
+def _int_list(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the exam pipeline against a fake model")
+    parser.add_argument("--latency-ms", type=float, default=200, help="Fake model latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="Random extra latency per call")
+    parser.add_argument("--stations", type=_int_list, default=[1, 3, 5, 10], help="Exam sizes, comma separated")
+    parser.add_argument("--turns", type=_int_list, default=[4, 12, 24], help="Transcript lengths in student turns")
+    parser.add_argument("--repeats", type=int, default=3, help="Repetitions of every scenario")
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--single-call", action="store_true", help="Score the checklist in one call instead of per section")
+    parser.add_argument("--rate-limits", action="store_true", help="Keep the async client's OpenAI rate limits")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Previous JSON report to compare latencies against")
+    args = parser.parse_args()
+
+    report = run(stations=args.stations, turns=args.turns, repeats=args.repeats, lang=args.lang,
+                 per_section=not args.single_call, latency_ms=args.latency_ms,
+                 jitter_ms=args.jitter_ms, seed=args.seed, rate_limits=args.rate_limits)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
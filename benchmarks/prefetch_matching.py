@@ -0,0 +1,150 @@
+"""
+Benchmark: prefetched-reply intent matching on paraphrases and near misses.
+
+Every labeled question is a student message and the intent it asks (None for
+a near miss that shares words with a canonical question but asks something
+else). A wrong match serves a canned patient reply to the wrong question, so
+the report counts false positives separately from missed paraphrases (which
+only cost a normal model reply), for the current settings and for a sweep of
+PREFETCH_MATCH_THRESHOLD.
+
+Usage:
+    python benchmarks/prefetch_matching.py [--input questions.jsonl] [--output report.json]
+
+Each input line is {"lang": "en", "message": "...", "intent": "onset" | null}.
+"""
+import argparse, json, os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reply_prefetch
+from reply_prefetch import match_intent
+
+LABELED_QUESTIONS = [
+    # Paraphrases of canonical questions
+    ("en", "What brings you in today?", "presenting"),
+    ("en", "What brings you here today?", "presenting"),
+    ("en", "So what's the problem?", "presenting"),
+    ("en", "When did it start?", "onset"),
+    ("en", "When did the pain start?", "onset"),
+    ("en", "How long have you had it?", "onset"),
+    ("en", "When did this all begin?", "onset"),
+    ("en", "Do you have any allergies?", "allergies"),
+    ("en", "Are you allergic to any medicines?", "allergies"),
+    ("en", "Are you taking any medications?", "medications"),
+    ("en", "Do you take any regular medicines?", "medications"),
+    ("en", "Any medical conditions?", "past_medical"),
+    ("en", "Do you have any chronic illnesses?", "past_medical"),
+    ("en", "Is there any family history of illness?", "family_history"),
+    ("en", "Does anyone in your family have medical problems?", "family_history"),
+    ("en", "Do you smoke?", "smoking"),
+    ("en", "Have you ever smoked cigarettes?", "smoking"),
+    ("en", "Do you drink alcohol?", "alcohol"),
+    ("en", "How much alcohol do you drink?", "alcohol"),
+    ("en", "Have you had any operations before?", "surgical"),
+    ("en", "Any previous surgery?", "surgical"),
+    ("en", "What do you do for work?", "occupation"),
+    ("en", "What is your job?", "occupation"),
+    ("en", "Who do you live with?", "living"),
+    ("en", "Who lives with you at home?", "living"),
+    ("en", "Do you have any concerns?", "concerns"),
+    ("en", "What are you worried it might be?", "concerns"),
+    ("ar", "ما الذي أتى بك اليوم؟", "presenting"),
+    ("ar", "متى بدأ الألم؟", "onset"),
+    ("ar", "منذ متى تعاني من ذلك؟", "onset"),
+    ("ar", "هل لديك حساسية من أي شيء؟", "allergies"),
+    ("ar", "هل تتناول أي أدوية؟", "medications"),
+    ("ar", "هل لديك أمراض مزمنة؟", "past_medical"),
+    ("ar", "هل يوجد تاريخ مرضي في العائلة؟", "family_history"),
+    ("ar", "هل تدخن؟", "smoking"),
+    ("ar", "هل تشرب الكحول؟", "alcohol"),
+    ("ar", "هل أجريت أي عمليات جراحية؟", "surgical"),
+    ("ar", "ما هي وظيفتك؟", "occupation"),
+    ("ar", "مع من تعيش؟", "living"),
+    ("ar", "ما الذي يقلقك؟", "concerns"),
+
+    # Near misses: share words with a canonical question, ask something else
+    ("en", "Does it start when you walk?", None),
+    ("en", "Does the pain start after eating?", None),
+    ("en", "How long does the pain last?", None),
+    ("en", "When did you last eat?", None),
+    ("en", "When did you last open your bowels?", None),
+    ("en", "Does it hurt when you lie down?", None),
+    ("en", "Do you live with your family?", None),
+    ("en", "Does your family know you are here?", None),
+    ("en", "Does it get worse at work?", None),
+    ("en", "Does it hurt when you work out?", None),
+    ("en", "Do you drink enough water?", None),
+    ("en", "Do you drink coffee?", None),
+    ("en", "Have you had any smoke exposure at work?", None),
+    ("en", "Are you allergic? I mean does anything make the rash worse?", None),
+    ("en", "Is the medication helping the pain?", None),
+    ("en", "Did the surgery scar heal well?", None),
+    ("en", "What do you think about the treatment plan?", None),
+    ("en", "How can I help with the pain?", None),
+    ("en", "Have you been in hospital for this pain before?", None),
+    ("en", "Where do you live?", None),
+    ("ar", "هل يبدأ عندما تمشي؟", None),
+    ("ar", "هل تعيش مع عائلتك؟", None),
+    ("ar", "هل تشرب الماء بكثرة؟", None),
+    ("ar", "هل الدواء يخفف الألم؟", None),
+    ("ar", "هل يزداد الألم في العمل؟", None),
+]
+
+def run(questions, thresholds=(0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8)):
+    """Match every question at each threshold and return the report dict"""
+    original = reply_prefetch.PREFETCH_MATCH_THRESHOLD
+
+    def score(threshold):
+        reply_prefetch.PREFETCH_MATCH_THRESHOLD = threshold
+        false_positives, missed, wrong = [], 0, []
+        for lang, message, intent in questions:
+            match = match_intent(message, lang)
+            got = match[0] if match else None
+            if got == intent:
+                continue
+            if got is None:
+                missed += 1
+            else:
+                (false_positives if intent is None else wrong).append(
+                    {"message": message, "expected": intent, "matched": got, "similarity": match[1]})
+        paraphrases = sum(intent is not None for _, _, intent in questions)
+        return {
+            "threshold": threshold,
+            "paraphrase_recall_pct": round(100 * (paraphrases - missed - len(wrong)) / paraphrases, 1)
+                                     if paraphrases else None,
+            "false_positives": false_positives,
+            "wrong_intent": wrong
+        }
+
+    try:
+        sweep = [score(threshold) for threshold in thresholds]
+        current = score(original)
+    finally:
+        reply_prefetch.PREFETCH_MATCH_THRESHOLD = original
+    return {"questions": len(questions), "current": current,
+            "sweep": [{k: v if k == "threshold" or k == "paraphrase_recall_pct" else len(v) for k, v in r.items()}
+                      for r in sweep]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Check prefetched-reply intent matching against near misses")
+    parser.add_argument("--input", help="JSONL file of {lang, message, intent} records")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        questions = [(r.get("lang", "en"), r["message"], r.get("intent")) for r in records]
+    else:
+        questions = LABELED_QUESTIONS
+
+    report = run(questions)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark: local rule-based pre-scoring vs pure-LLM checklist scoring.
+
+For every transcript the checklist is scored twice - once entirely by the LLM and
+once with prescore=True - and the script reports prompt/completion tokens for
+both modes and how often the LLM agrees with the items the rules marked Well Done.
+
+Usage:
+    python benchmarks/prescore_agreement.py [--input transcripts.jsonl] [--output report.json]
+
+Each input line is {"lang": "en", "transcript": "...", "case": {...}} (case optional).
+Without --input a small built-in English/Arabic sample is used. The numbers are
+only meaningful against a real model (OSCE_LLM_BACKEND=openai); the fake backend
+just checks that the pipeline runs.
+"""
+import argparse, json, os, sys, threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openai_utils
+from openai_utils import count_tokens
+from evaluator import checklist_score, prescore_checklist
+
+SAMPLE_TRANSCRIPTS = [
+    {
+        "lang": "en",
+        "transcript": "\n".join([
+            "Hello, my name is Dr Adams, I'm one of the doctors here.",
+            "What brings you in today?",
+            "When did the chest pain start and what does it feel like?",
+            "Does it spread anywhere? Any shortness of breath or sweating?",
+            "Do you have any allergies? Are you taking any medication?",
+            "Does anyone in your family have heart disease?",
+            "Do you smoke? How much alcohol do you drink? What do you do for work?",
+            "Is it okay if I examine you? I'll wash my hands first.",
+            "Let me check your blood pressure, pulse and oxygen saturation.",
+            "I will order blood tests including troponin and an ECG."
+        ]),
+        "case": {"chiefComplaint": "Chest pain", "answer_key": {"main_diagnosis": "Acute coronary syndrome"}}
+    },
+    {
+        "lang": "en",
+        "transcript": "\n".join([
+            "Hi, I'm a medical student.",
+            "Tell me about your headache.",
+            "Over the past two weeks, have you had little interest or pleasure in doing things?",
+            "Have you been feeling down, depressed or hopeless?",
+            "Are your vaccinations up to date? Have you had any screening tests recently?"
+        ]),
+        "case": {"chiefComplaint": "Headache", "answer_key": {"main_diagnosis": "Tension-type headache"}}
+    },
+    {
+        "lang": "ar",
+        "transcript": "\n".join([
+            "مرحبا، اسمي الدكتور علي.",
+            "ما الذي أتى بك اليوم؟",
+            "هل لديك حساسية من أي دواء؟",
+            "هل أحد في العائلة لديه مرض السكري؟",
+            "هل تدخن؟ هل تشرب الكحول؟ ما هي وظيفتك؟",
+            "سأطلب تحاليل فحص دم كاملة."
+        ]),
+        "case": {"chiefComplaint": "Fatigue", "answer_key": {"main_diagnosis": "Iron deficiency anemia"}}
+    }
+]
+
+class CountingBackend:
+    """Wraps the active backend and totals prompt/completion tokens per call"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.requires_api_key = inner.requires_api_key
+        self.uses_aiosession = getattr(inner, "uses_aiosession", False)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _count(self, messages, model, content, usage):
+        if not usage:
+            usage = {
+                "prompt_tokens": sum(count_tokens(m.get("content", ""), model) for m in messages),
+                "completion_tokens": count_tokens(content or "", model)
+            }
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage["prompt_tokens"]
+            self.completion_tokens += usage["completion_tokens"]
+
+    def reset(self):
+        with self._lock:
+            self.prompt_tokens = self.completion_tokens = self.calls = 0
+
+    def complete(self, messages, model, temperature, max_tokens):
+        content, usage = self.inner.complete(messages, model, temperature, max_tokens)
+        self._count(messages, model, content, usage)
+        return content, usage
+
+    def stream(self, messages, model, temperature, max_tokens):
+        return self.inner.stream(messages, model, temperature, max_tokens)
+
+    async def acomplete(self, messages, model, temperature, max_tokens):
+        content, usage = await self.inner.acomplete(messages, model, temperature, max_tokens)
+        self._count(messages, model, content, usage)
+        return content, usage
+
+def run(records, per_section=False):
+    """Score every record in both modes and return the report dict"""
+    # Cached responses would hide the token cost of the second run
+    openai_utils.set_cache(None)
+    backend = CountingBackend(openai_utils.get_backend())
+    openai_utils.set_backend(backend)
+
+    totals = {"llm": {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0},
+              "prescore": {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0}}
+    prescored_items = 0
+    agree_exact = 0
+    agree_done = 0
+    pct_diffs = []
+
+    try:
+        for record in records:
+            lang = record.get("lang", "en")
+            transcript = record["transcript"]
+            case = record.get("case")
+            results = {}
+            for mode in ("llm", "prescore"):
+                backend.reset()
+                results[mode] = checklist_score(lang, transcript, case, per_section=per_section,
+                                                prescore=(mode == "prescore"))
+                totals[mode]["prompt_tokens"] += backend.prompt_tokens
+                totals[mode]["completion_tokens"] += backend.completion_tokens
+                totals[mode]["calls"] += backend.calls
+
+            # Agreement of the pure-LLM scores with the items the rules settled
+            llm_raw = results["llm"].get("raw_scores", {})
+            for section, items in prescore_checklist(lang, transcript).items():
+                for idx in items:
+                    prescored_items += 1
+                    llm_score = llm_raw.get(section, [0] * (idx + 1))[idx]
+                    agree_exact += llm_score == 5
+                    agree_done += llm_score >= 3
+            pct_diffs.append(abs(results["llm"]["total_pct"] - results["prescore"]["total_pct"]))
+    finally:
+        openai_utils.set_backend(backend.inner)
+
+    def reduction(key):
+        before = totals["llm"][key]
+        return round(100 * (before - totals["prescore"][key]) / before, 1) if before else 0.0
+
+    return {
+        "transcripts": len(records),
+        "per_section": per_section,
+        "tokens": totals,
+        "prompt_token_reduction_pct": reduction("prompt_tokens"),
+        "completion_token_reduction_pct": reduction("completion_tokens"),
+        "prescored_items": prescored_items,
+        "agreement_well_done_pct": round(100 * agree_exact / prescored_items, 1) if prescored_items else None,
+        "agreement_done_pct": round(100 * agree_done / prescored_items, 1) if prescored_items else None,
+        "mean_abs_total_pct_diff": round(sum(pct_diffs) / len(pct_diffs), 2) if pct_diffs else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare rule pre-scoring with pure-LLM checklist scoring")
+    parser.add_argument("--input", help="JSONL file of {lang, transcript, case} records")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--per-section", action="store_true", help="Use section-wise scoring in both modes")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    else:
+        records = SAMPLE_TRANSCRIPTS
+
+    report = run(records, per_section=args.per_section)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
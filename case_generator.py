@@ -1,6 +1,10 @@
 import json, random, re
-from openai_utils import chat
-from prompt_templates import CASE_GENERATION_PROMPT, CUSTOM_CASE_PROMPT
+from concurrent.futures import ThreadPoolExecutor
+from openai_utils import chat, chat_stream, count_tokens, route_model
+from prompt_templates import CASE_GENERATION_PROMPT, CUSTOM_CASE_PROMPT, CASE_REPAIR_PROMPT
+from case_schema import CASE_SCHEMA, validate_case, repair_strategy
+from json_stream import IncrementalJSONObjectParser
+from llm_metrics import bind_session
 
 def fix_json_string(json_str):
     """
@@ -18,7 +22,7 @@ def fix_json_string(json_str):
         
     return json_str
 
-def generate_station(lang="en", custom_case=None, specialty=None):
+def generate_station(lang="en", custom_case=None, specialty=None, on_field=None):
     """
     Generate a complete OSCE station with all necessary parameters.
     
@@ -26,6 +30,8 @@ def generate_station(lang="en", custom_case=None, specialty=None):
         lang: Language for the case
         custom_case: Optional dict with custom case parameters provided by the user
         specialty: Optional medical specialty to filter chief complaints
+        on_field: Optional callback (key, value); when given the case is streamed and
+                  each top-level field is passed to it as soon as it is complete
     
     Returns:
         A complete case dictionary with all needed information
@@ -60,82 +66,32 @@ def generate_station(lang="en", custom_case=None, specialty=None):
     usr = {"role": "user", "content": f"Generate a detailed OSCE station for chief complaint: {chief} {case_type}"}
     
     # Using a safe model with temperature 0.4 for creative but medically accurate case generation
+    # Only an unparseable response is regenerated; missing or invalid fields are repaired
     max_attempts = 3
-    required_fields = ["patientInfo", "chiefComplaint", "historyDetails", "labResults", 
-                       "imagingResults", "reviewOfSystems", "answer_key"]
+    usage = {"attempts": 0, "repair_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    case_data = None
     
     for attempt in range(max_attempts):
+        usage["attempts"] += 1
         try:
-            # First, get the raw text response
-            raw_response = chat([sys_msg, usr], model="gpt-3.5-turbo", temperature=0.4)
-            
-            # Try to fix any JSON formatting issues
-            fixed_json = fix_json_string(raw_response)
-            
-            # Parse the fixed JSON
-            try:
-                case_data = json.loads(fixed_json)
-                
-                # Check if we have all required fields
-                missing_fields = [field for field in required_fields if field not in case_data]
-                if missing_fields:
-                    # If we have missing fields and this isn't the last attempt, try again
-                    if attempt < max_attempts - 1:
-                        usr = {"role": "user", "content": f"The case is missing these fields: {', '.join(missing_fields)}. Please regenerate a complete OSCE case with all required fields including: {', '.join(required_fields)}"}
-                        continue
-                    # On last attempt, fill in the missing fields
-                    else:
-                        for field in missing_fields:
-                            if field == "patientInfo":
-                                case_data["patientInfo"] = create_patient_info(patient_age, patient_gender)
-                            elif field == "chiefComplaint":
-                                case_data["chiefComplaint"] = chief
-                            elif field == "historyDetails":
-                                case_data["historyDetails"] = create_default_history()
-                            elif field == "labResults":
-                                case_data["labResults"] = {}
-                            elif field == "imagingResults":
-                                case_data["imagingResults"] = {}
-                            elif field == "reviewOfSystems":
-                                case_data["reviewOfSystems"] = {}
-                            elif field == "answer_key":
-                                case_data["answer_key"] = {
-                                    "main_diagnosis": f"Unspecified {chief.lower()}",
-                                    "differentials": ["Alternative diagnosis 1", "Alternative diagnosis 2"],
-                                    "management": ["Symptomatic treatment", "Follow-up in 2 weeks"]
-                                }
-                
-                # We have a valid case with all required fields, break out of the loop
-                break
-                
-            except json.JSONDecodeError as e:
-                print(f"JSON parse error: {str(e)}")
-                # If still failing, try a more aggressive cleanup
-                # Extract anything that looks like JSON
-                json_match = re.search(r'\{.*\}', fixed_json, re.DOTALL)
-                if json_match:
-                    try:
-                        case_data = json.loads(json_match.group(0))
-                    except Exception as e2:
-                        print(f"Secondary parse error: {str(e2)}")
-                        # If all parsing fails and this is the last attempt, create a minimal case
-                        if attempt == max_attempts - 1:
-                            case_data = create_fallback_case(chief, patient_age, patient_gender, lang)
-                        else:
-                            continue
-                else:
-                    # If no JSON-like structure found and this is the last attempt, create a minimal case
-                    if attempt == max_attempts - 1:
-                        case_data = create_fallback_case(chief, patient_age, patient_gender, lang)
-                    else:
-                        continue
+            if on_field is None:
+                raw_response = _tracked_chat([sys_msg, usr], usage, model=route_model("case_generation"),
+                                             temperature=0.4, tag="case_generation")
+                case_data = parse_case_json(raw_response)
+            else:
+                case_data = _stream_case_json([sys_msg, usr], usage, on_field,
+                                              model=route_model("case_generation", stream=True),
+                                              temperature=0.4, tag="case_generation")
         except Exception as e:
             print(f"Error generating station: {str(e)}")
-            # If this is the last attempt, create a fallback case
-            if attempt == max_attempts - 1:
-                case_data = create_fallback_case(chief, patient_age, patient_gender, lang)
-            else:
-                continue
+        if case_data is not None:
+            break
+    
+    if case_data is None:
+        # If all attempts failed, create a minimal case
+        case_data = create_fallback_case(chief, patient_age, patient_gender, lang)
+    else:
+        repair_case(case_data, chief, patient_age, patient_gender, lang, usage)
     
     # Add timestamp to track when this case was generated
     case_data["generated_timestamp"] = int(random.random() * 10000000)
@@ -143,8 +99,190 @@ def generate_station(lang="en", custom_case=None, specialty=None):
     # Ensure case_data has all required fields
     ensure_required_fields(case_data, chief, patient_age, patient_gender)
     
+    # Record what this case cost to generate
+    case_data["_generation"] = usage
+    
     return case_data
 
+def _tracked_chat(messages, usage, **kwargs):
+    """Call chat() and add the prompt/completion token counts to usage"""
+    model = kwargs.get("model", "gpt-3.5-turbo")
+    result = chat(messages, **kwargs)
+    usage["prompt_tokens"] += sum(count_tokens(m["content"], model) for m in messages)
+    usage["completion_tokens"] += count_tokens(result if isinstance(result, str) else json.dumps(result), model)
+    return result
+
+def _stream_case_json(messages, usage, on_field, model="gpt-3.5-turbo", **kwargs):
+    """
+    Stream a case from the model, parsing it as it arrives.
+    
+    Each completed top-level field is passed to on_field(key, value). Output that
+    can no longer be a JSON object ends the stream at once; a truncated object
+    keeps its completed fields so repair_case only has to fill in the rest.
+    
+    Returns:
+        The case dict (possibly partial), or None if nothing usable arrived
+    """
+    parser = IncrementalJSONObjectParser()
+    pieces = []
+    stream = chat_stream(messages, model=model, **kwargs)
+    try:
+        for piece in stream:
+            if piece.startswith("Error: "):
+                # chat_stream reports failures as a single "Error: ..." piece
+                print(f"Error streaming station: {piece}")
+                break
+            pieces.append(piece)
+            for key, value in parser.feed(piece):
+                try:
+                    on_field(key, value)
+                except Exception as e:
+                    print(f"Error in on_field callback: {str(e)}")
+            if parser.complete or parser.failed:
+                break
+    finally:
+        stream.close()
+    
+    usage["prompt_tokens"] += sum(count_tokens(m["content"], model) for m in messages)
+    usage["completion_tokens"] += count_tokens("".join(pieces), model)
+    
+    if parser.failed:
+        print(f"Streamed case abandoned: {parser.failed}")
+    elif parser.truncated:
+        print(f"Streamed case truncated after {len(parser.members)} fields, repairing the rest")
+    case_data = parser.result()
+    return case_data if case_data else None
+
+def parse_case_json(raw_response):
+    """
+    Parse a model response into a case dict.
+    Returns None if no JSON object can be recovered from it.
+    """
+    if not isinstance(raw_response, str) or raw_response.startswith("Error:"):
+        return None
+    
+    # Try to fix any JSON formatting issues
+    fixed_json = fix_json_string(raw_response)
+    try:
+        case_data = json.loads(fixed_json)
+    except json.JSONDecodeError as e:
+        print(f"JSON parse error: {str(e)}")
+        # Keep the top-level fields that did complete (e.g. output cut off at
+        # max_tokens); repair_case fills in the rest
+        parser = IncrementalJSONObjectParser()
+        parser.feed(raw_response)
+        case_data = parser.members or None
+    return case_data if isinstance(case_data, dict) else None
+
+def _local_default(field, chief, age, gender):
+    """Value used for a field that can't (or couldn't) be generated"""
+    if field == "patientInfo":
+        return create_patient_info(age, gender)
+    if field == "chiefComplaint":
+        return chief
+    if field == "historyDetails":
+        return create_default_history()
+    if field == "answer_key":
+        return {
+            "main_diagnosis": f"Unspecified {chief.lower()}",
+            "differentials": ["Alternative diagnosis 1", "Alternative diagnosis 2"],
+            "management": ["Symptomatic treatment", "Follow-up in 2 weeks"]
+        }
+    return CASE_SCHEMA[field]["type"]()
+
+def repair_case(case_data, chief, age, gender, lang="en", usage=None, llm_repair=True):
+    """
+    Validate a case against CASE_SCHEMA and repair it in place.
+    
+    Fields with a "local" repair strategy are filled without calling the model.
+    Fields with an "llm" strategy are requested together in one small follow-up
+    call that asks only for those keys; anything still invalid falls back to a
+    local default.
+    
+    Returns:
+        Dict of the problems that were found (empty if the case was already valid)
+    """
+    usage = usage if usage is not None else {"repair_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    problems = validate_case(case_data)
+    if not problems:
+        return problems
+    
+    # Partial patient info is merged with generated defaults instead of replaced
+    if isinstance(case_data.get("patientInfo"), dict):
+        defaults = create_patient_info(case_data["patientInfo"].get("age", age), case_data["patientInfo"].get("gender", gender))
+        for key, value in defaults.items():
+            case_data["patientInfo"].setdefault(key, value)
+    
+    llm_fields = [field for field in problems if repair_strategy(field) == "llm"]
+    if llm_fields and llm_repair:
+        diagnosis = case_data.get("answer_key", {}).get("main_diagnosis") if isinstance(case_data.get("answer_key"), dict) else None
+        field_lines = "\n".join(f"- {field} ({CASE_SCHEMA[field]['description']})" for field in llm_fields)
+        repair_msg = {"role": "system", "content": CASE_REPAIR_PROMPT.format(
+            lang=lang, age=age, gender=gender, chief=case_data.get("chiefComplaint") or chief,
+            diagnosis=diagnosis or "not yet decided - choose the most fitting one", fields=field_lines
+        )}
+        usr = {"role": "user", "content": f"Provide only: {', '.join(llm_fields)}"}
+        usage["repair_calls"] += 1
+        try:
+            patch = parse_case_json(_tracked_chat([repair_msg, usr], usage, model=route_model("case_repair"),
+                                                  temperature=0.3, tag="case_repair"))
+        except Exception as e:
+            print(f"Error repairing case: {str(e)}")
+            patch = None
+        if patch:
+            for field in llm_fields:
+                if field not in patch:
+                    continue
+                # An object that only lacked some keys keeps the ones it has
+                if isinstance(case_data.get(field), dict) and isinstance(patch[field], dict):
+                    case_data[field] = {**patch[field], **case_data[field]}
+                else:
+                    case_data[field] = patch[field]
+    
+    # Whatever is still invalid gets a local default; an object missing some keys
+    # only gets those keys, so a valid main_diagnosis is never replaced
+    for field in validate_case(case_data):
+        if field == "patientInfo" and isinstance(case_data.get("patientInfo"), dict):
+            continue
+        default = _local_default(field, chief, age, gender)
+        if isinstance(case_data.get(field), dict) and isinstance(default, dict):
+            for key, value in default.items():
+                case_data[field].setdefault(key, value)
+        else:
+            case_data[field] = default
+    
+    return problems
+
+def generate_stations(lang="en", specs=None, max_concurrency=4):
+    """
+    Generate several OSCE stations concurrently.
+    
+    Each station is generated on a bounded thread pool, so total wall time stays
+    close to the slowest single case instead of the sum of all of them.
+    generate_station retries unparseable responses and falls back to a minimal
+    case on its own, so every spec gets a case.
+    
+    Args:
+        lang: Language for the cases
+        specs: List with one entry per station; each entry is a custom_case dict
+               (chief_complaint, age, gender, case_type) or None for a random case
+        max_concurrency: Maximum number of stations generated at the same time
+    
+    Returns:
+        List of case dictionaries in the same order as specs
+    """
+    specs = list(specs or [])
+    if not specs:
+        return []
+    
+    workers = max(1, min(max_concurrency, len(specs)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(bind_session(generate_station), lang, spec)
+            for spec in specs
+        ]
+        return [f.result() for f in futures]
+
 def create_patient_info(age, gender):
     """Create realistic patient information"""
     # Create proper names based on gender
@@ -258,8 +396,8 @@ def ensure_required_fields(case_data, chief, age, gender):
             else:
                 case_data[field] = {}
 
-def custom_case_generator(lang="en", case_description=""):
-    """Generate a custom case based on user description"""
+def custom_case_generator(lang="en", case_description="", on_field=None):
+    """Generate a custom case based on user description (on_field as in generate_station)"""
     
     sys_msg = {"role": "system", "content": CUSTOM_CASE_PROMPT.format(lang=lang)}
     
@@ -267,18 +405,20 @@ def custom_case_generator(lang="en", case_description=""):
     
     try:
         # Extract basic case parameters
-        params_extraction = chat([sys_msg, usr], model="gpt-3.5-turbo", temperature=0.2)
+        params_extraction = chat([sys_msg, usr], model=route_model("custom_case_params"),
+                                 temperature=0.2, tag="custom_case_params",
+                                 cache_if=lambda raw: parse_case_json(raw) is not None)
         
         # Try to parse as JSON
         try:
             extracted_data = json.loads(fix_json_string(params_extraction))
-            return generate_station(lang, extracted_data)
+            return generate_station(lang, extracted_data, on_field=on_field)
         except json.JSONDecodeError as e:
             print(f"Custom case JSON parse error: {str(e)}")
             # If parsing fails, create a case with just the description as chief complaint
             custom_data = {"chief_complaint": case_description}
-            return generate_station(lang, custom_data)
+            return generate_station(lang, custom_data, on_field=on_field)
     except Exception as e:
         print(f"Error in custom case generation: {str(e)}")
         # Fallback to basic station generation
-        return generate_station(lang, {"chief_complaint": case_description}) 
\ No newline at end of file
+        return generate_station(lang, {"chief_complaint": case_description}, on_field=on_field) 
\ No newline at end of file
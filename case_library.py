@@ -0,0 +1,231 @@
+"""
+Searchable local library of OSCE cases.
+
+Every generated or uploaded case is appended to a JSONL file and indexed in
+memory with an inverted index over chief complaint, specialty, diagnosis,
+gender and language, plus a sorted age list. Stations are served from the
+library first; generate_station is only needed when no unseen case matches.
+"""
+import bisect, copy, json, os, random, threading
+from persona import case_hash
+from case_schema import validate_case
+
+DEFAULT_LIBRARY_PATH = os.getenv("OSCE_CASE_LIBRARY_PATH", os.path.join("data", "case_library.jsonl"))
+
+# Case keys added during an exam that must not be stored in the library
+_EXAM_KEYS = {"result", "transcript", "student_dx"}
+
+def _norm(value):
+    """Normalize an index term"""
+    return " ".join(str(value or "").lower().split())
+
+def _age(case):
+    """Patient age as an int, or None"""
+    try:
+        return int(case.get("patientInfo", {}).get("age"))
+    except (TypeError, ValueError):
+        return None
+
+class CaseLibrary:
+    """
+    In-memory inverted index over a JSONL case store.
+
+    Postings are sets of integer document numbers, so a query intersects the
+    posting sets of its filters starting from the smallest, and an age range is
+    two bisects into the sorted age list.
+    """
+
+    def __init__(self, path=DEFAULT_LIBRARY_PATH):
+        self.path = path
+        self._records = []      # document number -> record
+        self._by_hash = {}      # case hash -> document number
+        self._postings = {}     # (field, term) -> set of document numbers
+        self._ages = []         # sorted (age, document number)
+        self._doc_ages = []     # document number -> age or None
+        self._seen = {}         # student -> set of case hashes
+        self._lock = threading.Lock()
+        self._load()
+
+    def _seen_path(self):
+        root, ext = os.path.splitext(self.path)
+        return f"{root}_seen{ext or '.jsonl'}"
+
+    def _load(self):
+        """Read the case and seen-case files and build the index"""
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line), loading=True)
+        # One sort for the whole file rather than an insort per case
+        self._ages.sort()
+        if os.path.exists(self._seen_path()):
+            with open(self._seen_path(), encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        self._seen.setdefault(row["student"], set()).add(row["case_id"])
+
+    def _index(self, record, loading=False):
+        """
+        Add a record to the in-memory index (caller holds the lock or is loading).
+        While loading, ages are appended unsorted and _load sorts them once.
+        """
+        if record["id"] in self._by_hash:
+            return self._by_hash[record["id"]]
+        doc = len(self._records)
+        self._records.append(record)
+        self._by_hash[record["id"]] = doc
+
+        case = record["case"]
+        terms = {
+            ("lang", _norm(record.get("lang"))),
+            ("specialty", _norm(record.get("specialty"))),
+            ("chief", _norm(case.get("chiefComplaint"))),
+            ("diagnosis", _norm(case.get("answer_key", {}).get("main_diagnosis"))),
+            ("gender", _norm(case.get("patientInfo", {}).get("gender")))
+        }
+        for term in terms:
+            if term[1]:
+                self._postings.setdefault(term, set()).add(doc)
+        age = _age(case)
+        self._doc_ages.append(age)
+        if age is not None:
+            if loading:
+                self._ages.append((age, doc))
+            else:
+                bisect.insort(self._ages, (age, doc))
+        return doc
+
+    def add(self, case, lang="en", specialty=None, source="generated"):
+        """
+        Store a deep copy of a case in the library (duplicates are ignored).
+        The case must pass validate_case; repair it first (case_generator.repair_case).
+
+        Returns:
+            The case id (content hash)
+        """
+        clean = copy.deepcopy({k: v for k, v in case.items() if not k.startswith("_") and k not in _EXAM_KEYS})
+        problems = validate_case(clean)
+        if problems:
+            raise ValueError(f"Invalid case: {', '.join(f'{field} {problem}' for field, problem in problems.items())}")
+        record = {
+            "id": case_hash(clean),
+            "lang": lang,
+            "specialty": specialty or "",
+            "source": source,
+            "case": clean
+        }
+        with self._lock:
+            if record["id"] in self._by_hash:
+                return record["id"]
+            self._index(record)
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record["id"]
+
+    def mark_seen(self, student, case_ids):
+        """Remember that a student has been given these cases"""
+        if not student:
+            return
+        with self._lock:
+            seen = self._seen.setdefault(student, set())
+            new_ids = [case_id for case_id in case_ids if case_id not in seen]
+            seen.update(new_ids)
+            if new_ids:
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self._seen_path(), "a", encoding="utf-8") as f:
+                    for case_id in new_ids:
+                        f.write(json.dumps({"student": student, "case_id": case_id}) + "\n")
+
+    def find(self, n=1, lang=None, chief=None, specialty=None, diagnosis=None, gender=None,
+             min_age=None, max_age=None, student=None, exclude_ids=()):
+        """
+        Pick up to n distinct cases matching every given filter.
+
+        Args:
+            student: Exclude cases this student has already been given
+            exclude_ids: Further case ids to exclude
+
+        Returns:
+            List of (case id, case copy) tuples, chosen at random among the matches
+        """
+        filters = [("lang", lang), ("chief", chief), ("specialty", specialty),
+                   ("diagnosis", diagnosis), ("gender", gender)]
+        by_age = min_age is not None or max_age is not None
+        low_age = min_age if min_age is not None else -1
+        high_age = max_age if max_age is not None else 10**6
+        with self._lock:
+            postings = sorted((self._postings.get((field, _norm(value)), set()) for field, value in filters if value),
+                              key=len)
+            if by_age:
+                low = bisect.bisect_left(self._ages, (low_age, -1))
+                high = bisect.bisect_right(self._ages, (high_age, len(self._records)))
+
+            if postings:
+                # Intersect from the smallest set; the age range is checked per candidate
+                # unless it is the smaller side
+                if by_age and high - low < len(postings[0]):
+                    candidates = {doc for _, doc in self._ages[low:high]}.intersection(*postings)
+                else:
+                    candidates = postings[0].intersection(*postings[1:])
+                    if by_age:
+                        candidates = {doc for doc in candidates
+                                      if self._doc_ages[doc] is not None and low_age <= self._doc_ages[doc] <= high_age}
+                candidates = list(candidates)
+            elif by_age:
+                candidates = [doc for _, doc in self._ages[low:high]]
+            else:
+                candidates = range(len(self._records))
+
+            # A random sample n + len(excluded) long holds at least n allowed matches
+            # if there are that many, without filtering every candidate
+            excluded = {self._by_hash[case_id] for case_id in set(exclude_ids) | self._seen.get(student, set())
+                        if case_id in self._by_hash}
+            sample = random.sample(candidates, min(len(candidates), n + len(excluded)))
+            chosen = [doc for doc in sample if doc not in excluded][:n]
+            return [(self._records[doc]["id"], copy.deepcopy(self._records[doc]["case"])) for doc in chosen]
+
+    def take_stations(self, lang, specs, specialty=None, student=None, fallback=None, served=None):
+        """
+        Get one case per spec from the library, generating only what it can't supply.
+
+        Args:
+            specs: List of custom_case dicts (chief_complaint, optional age and gender)
+            fallback: Function (lang, missing_specs) -> list of cases used for the misses;
+                      the cases it returns are added to the library
+            served: Set of case ids already served in this session; they are excluded
+                    and the ids served now are added. Without a student ID this is what
+                    keeps repeated exams from getting the same library cases.
+
+        Returns:
+            List of case dictionaries in the same order as specs
+        """
+        cases = [None] * len(specs)
+        chosen_ids = []
+        missing = []
+        for i, spec in enumerate(specs):
+            found = self.find(1, lang=lang, chief=spec.get("chief_complaint"), specialty=specialty,
+                              gender=spec.get("gender"), student=student,
+                              exclude_ids=chosen_ids + list(served or ()))
+            if found:
+                case_id, cases[i] = found[0]
+                chosen_ids.append(case_id)
+            else:
+                missing.append(i)
+
+        if missing and fallback is not None:
+            for i, case in zip(missing, fallback(lang, [specs[i] for i in missing])):
+                chosen_ids.append(self.add(case, lang, specialty))
+                cases[i] = case
+
+        if served is not None:
+            served.update(chosen_ids)
+        self.mark_seen(student, chosen_ids)
+        return cases
+
+    def __len__(self):
+        return len(self._records)
@@ -0,0 +1,254 @@
+"""
+Pre-generated OSCE case pool.
+
+Cases are stored in a local SQLite file and bucketed by
+(lang, specialty, chief complaint, age band, gender). After the first pool miss
+a background worker keeps recently requested buckets topped up to a target
+depth, so "Start Exam" can pop a ready case instead of waiting on the LLM.
+Buckets nobody has asked for within target_ttl seconds stop being refilled, and
+at most max_targets of the most recently requested ones are kept.
+"""
+import json, os, random, sqlite3, threading, time
+from collections import OrderedDict
+from case_generator import generate_stations
+
+DEFAULT_POOL_PATH = os.getenv("OSCE_CASE_POOL_PATH", os.path.join("data", "case_pool.sqlite3"))
+
+# Age bands used as part of the bucket key: (min age, max age, label)
+AGE_BANDS = [
+    (0, 17, "0-17"),
+    (18, 39, "18-39"),
+    (40, 64, "40-64"),
+    (65, 120, "65+")
+]
+
+def age_band(age):
+    """Return the age band label for an age, or None if the age is not a number"""
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return None
+    for low, high, label in AGE_BANDS:
+        if low <= age <= high:
+            return label
+    return AGE_BANDS[-1][2]
+
+def _random_age(band):
+    """Pick a random age inside a band label (adults only when no band is given)"""
+    for low, high, label in AGE_BANDS:
+        if label == band:
+            return random.randint(low, min(high, 90))
+    return random.randint(18, 85)
+
+class CasePool:
+    """
+    SQLite-backed pool of ready-to-use OSCE cases with background refill.
+
+    A bucket filter may leave age_band or gender as None, which matches any
+    value when popping and means "random" when generating.
+    """
+
+    def __init__(self, path=DEFAULT_POOL_PATH, target_depth=3, max_concurrency=4, target_ttl=3600, max_targets=32):
+        self.path = path
+        self.target_depth = target_depth
+        self.max_concurrency = max_concurrency
+        self.target_ttl = target_ttl
+        self.max_targets = max_targets
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self._targets = OrderedDict()   # bucket -> time it was last requested, oldest first
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker = None
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cases ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "lang TEXT NOT NULL, specialty TEXT NOT NULL, chief TEXT NOT NULL, "
+                "age_band TEXT, gender TEXT, case_json TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cases_bucket "
+                "ON cases (lang, specialty, chief, age_band, gender, id)"
+            )
+
+    @staticmethod
+    def _where(lang, specialty, chief, band, gender):
+        """Build the WHERE clause and parameters for a bucket filter"""
+        clause = "lang = ? AND specialty = ? AND chief = ?"
+        params = [lang, specialty or "", chief]
+        if band is not None:
+            clause += " AND age_band = ?"
+            params.append(band)
+        if gender is not None:
+            clause += " AND gender = ?"
+            params.append(gender.lower())
+        return clause, params
+
+    def put(self, case, lang, specialty=None, chief=None):
+        """Add a generated case to the pool"""
+        patient_info = case.get("patientInfo", {})
+        chief = chief or case.get("chiefComplaint", "")
+        gender = str(patient_info.get("gender", "")).lower() or None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO cases (lang, specialty, chief, age_band, gender, case_json) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (lang, specialty or "", chief, age_band(patient_info.get("age")),
+                 gender, json.dumps(case))
+            )
+
+    def pop(self, lang, specialty, chief, band=None, gender=None):
+        """
+        Remove and return the oldest case in a bucket.
+
+        Returns:
+            The case dictionary, or None if the bucket is empty
+        """
+        clause, params = self._where(lang, specialty, chief, band, gender)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT id, case_json FROM cases WHERE {clause} ORDER BY id LIMIT 1", params
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("DELETE FROM cases WHERE id = ?", (row[0],))
+            self.hits += 1
+        return json.loads(row[1])
+
+    def depth(self, lang, specialty, chief, band=None, gender=None):
+        """Number of cases currently available in a bucket"""
+        clause, params = self._where(lang, specialty, chief, band, gender)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM cases WHERE {clause}", params).fetchone()[0]
+
+    def add_target(self, lang, specialty, chief, band=None, gender=None):
+        """Register (or renew) a bucket that the background worker should keep topped up"""
+        target = (lang, specialty or "", chief, band, gender)
+        with self._lock:
+            self._targets[target] = time.monotonic()
+            self._targets.move_to_end(target)
+            while len(self._targets) > self.max_targets:
+                self._targets.popitem(last=False)
+
+    def _live_targets(self):
+        """Drop targets not requested within target_ttl and return the rest (caller holds the lock)"""
+        cutoff = time.monotonic() - self.target_ttl
+        while self._targets and next(iter(self._targets.values())) < cutoff:
+            self._targets.popitem(last=False)
+        return list(self._targets)
+
+    def refill_once(self):
+        """
+        Top up every live registered bucket to the target depth.
+
+        Returns:
+            Number of cases generated
+        """
+        with self._lock:
+            targets = sorted(self._live_targets(), key=str)
+
+        jobs = []
+        for lang, specialty, chief, band, gender in targets:
+            missing = self.target_depth - self.depth(lang, specialty, chief, band, gender)
+            for _ in range(max(0, missing)):
+                jobs.append((lang, specialty, chief, band, gender))
+        if not jobs:
+            return 0
+
+        # Generate per language so each batch can run concurrently
+        for lang in sorted({job[0] for job in jobs}):
+            lang_jobs = [job for job in jobs if job[0] == lang]
+            specs = [
+                {
+                    "chief_complaint": chief,
+                    "age": _random_age(band),
+                    "gender": gender or random.choice(["male", "female"])
+                }
+                for _, _, chief, band, gender in lang_jobs
+            ]
+            cases = generate_stations(lang, specs, max_concurrency=self.max_concurrency)
+            for (_, specialty, chief, _, _), case in zip(lang_jobs, cases):
+                self.put(case, lang, specialty, chief)
+        self.generated += len(jobs)
+        return len(jobs)
+
+    def _refill_loop(self, interval):
+        """Background worker body"""
+        while not self._stop.is_set():
+            try:
+                self.refill_once()
+            except Exception as e:
+                print(f"Error refilling case pool: {str(e)}")
+            self._stop.wait(interval)
+
+    def start_refill_worker(self, interval=30):
+        """Start the background refill thread (no-op if it is already running)"""
+        if self._worker and self._worker.is_alive():
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._refill_loop, args=(interval,), daemon=True)
+        self._worker.start()
+
+    def stop_refill_worker(self):
+        """Stop the background refill thread"""
+        self._stop.set()
+        if self._worker:
+            self._worker.join(timeout=5)
+
+    def take_stations(self, lang, specs, specialty=None, max_concurrency=5):
+        """
+        Get one case per spec, popping from the pool and generating only the misses.
+
+        Args:
+            lang: Language for the cases
+            specs: List of custom_case dicts (chief_complaint, optional age and gender)
+            specialty: Specialty the chief complaints were drawn from
+            max_concurrency: Maximum number of live generations at the same time
+
+        Returns:
+            List of case dictionaries in the same order as specs
+        """
+        cases = []
+        missing = []
+        for i, spec in enumerate(specs):
+            chief = spec.get("chief_complaint", "")
+            band = age_band(spec["age"]) if "age" in spec else None
+            gender = spec.get("gender")
+            self.add_target(lang, specialty, chief, band, gender)
+            case = self.pop(lang, specialty, chief, band, gender)
+            if case is None:
+                missing.append(i)
+            cases.append(case)
+
+        if missing:
+            # Only a pool that has missed needs refilling
+            self.start_refill_worker()
+            generated = generate_stations(lang, [specs[i] for i in missing], max_concurrency=max_concurrency)
+            for i, case in zip(missing, generated):
+                cases[i] = case
+        return cases
+
+    def stats(self):
+        """Hit/miss counters and current bucket depths, for sizing the pool"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT lang, specialty, chief, age_band, gender, COUNT(*) FROM cases "
+                "GROUP BY lang, specialty, chief, age_band, gender"
+            ).fetchall()
+            targets = len(self._live_targets())
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "generated": self.generated,
+            "targets": targets,
+            "depths": {"/".join(str(part) for part in row[:5]): row[5] for row in rows}
+        }
@@ -0,0 +1,97 @@
+"""
+Declarative schema for generated OSCE cases.
+
+Each top-level field lists its JSON type, the keys it must contain (for objects),
+a short description reused in repair prompts, and how a missing or invalid
+value is repaired:
+- "local": filled in without calling the model (defaults, patient info, ...)
+- "llm": requested in a small targeted follow-up call, falling back to a local default
+"""
+
+CASE_SCHEMA = {
+    "patientInfo": {
+        "type": dict, "keys": ["name", "age", "gender"], "repair": "local",
+        "description": "object with name, age, gender, occupation"
+    },
+    "chiefComplaint": {
+        "type": str, "repair": "local",
+        "description": "string"
+    },
+    "historyDetails": {
+        "type": dict, "repair": "llm",
+        "description": "object with onset, duration, character, aggravating factors, relieving factors"
+    },
+    "pastMedicalHistory": {
+        "type": list, "repair": "local",
+        "description": "array of strings"
+    },
+    "familyHistory": {
+        "type": list, "repair": "local",
+        "description": "array of strings"
+    },
+    "medications": {
+        "type": list, "repair": "local",
+        "description": "array of strings"
+    },
+    "socialHistory": {
+        "type": dict, "repair": "local",
+        "description": "object with smoking, alcohol, living"
+    },
+    "reviewOfSystems": {
+        "type": dict, "repair": "llm",
+        "description": "object with relevant systems"
+    },
+    "physicalFindings": {
+        "type": list, "repair": "llm",
+        "description": "array of strings"
+    },
+    "labResults": {
+        "type": dict, "repair": "llm",
+        "description": "object with test names and values"
+    },
+    "imagingResults": {
+        "type": dict, "repair": "llm",
+        "description": "object with types and findings"
+    },
+    "keyHistoryQuestions": {
+        "type": list, "repair": "local",
+        "description": "array of strings with questions student should ask"
+    },
+    "keyExamManeuvers": {
+        "type": list, "repair": "local",
+        "description": "array of strings with exams student should perform"
+    },
+    "answer_key": {
+        "type": dict, "keys": ["main_diagnosis", "differentials", "management"], "repair": "llm",
+        "description": "object with main_diagnosis, differentials array, management array"
+    }
+}
+
+def validate_case(case):
+    """
+    Check a case against CASE_SCHEMA.
+
+    Returns:
+        Dict of field -> problem description for every field that needs repair
+        (empty if the case is valid)
+    """
+    if not isinstance(case, dict):
+        return {field: "missing" for field in CASE_SCHEMA}
+
+    problems = {}
+    for field, spec in CASE_SCHEMA.items():
+        if field not in case or case[field] is None:
+            problems[field] = "missing"
+        elif not isinstance(case[field], spec["type"]):
+            problems[field] = f"expected {spec['type'].__name__}"
+        elif spec["type"] is str and not case[field].strip():
+            problems[field] = "empty"
+        elif spec.get("keys"):
+            missing_keys = [key for key in spec["keys"] if key not in case[field]]
+            if missing_keys:
+                problems[field] = f"missing keys: {', '.join(missing_keys)}"
+    return problems
+
+def repair_strategy(field):
+    """How a field is repaired: "local" or "llm" """
+    return CASE_SCHEMA[field]["repair"]
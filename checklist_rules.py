@@ -0,0 +1,134 @@
+"""
+Keyword rules for checklist items that can be detected from the student's turns alone.
+
+Each rule maps a (section, item index) in CHECKLIST to one or more alternatives.
+An alternative is (min_matches, [patterns]): it fires when at least min_matches of
+its patterns occur in the transcript.
+
+Only the items in SETTLED_ITEMS ask for a single thing the keywords cover, so a
+firing rule scores them Well Done (5) locally. Every other rule covers just part
+of its item ("takes permission, washes hands, maintains privacy"): when it fires
+the item still goes to the LLM, with the keyword evidence as a hint.
+"""
+import re
+
+# Items a firing rule scores Well Done without asking the LLM
+SETTLED_ITEMS = {("history", 9), ("history", 10), ("history", 15), ("history", 16)}
+
+RULES = {
+    "en": {
+        # Greets the patient / introduces self
+        ("history", 0): [
+            (2, [r"\b(hello|hi|good (morning|afternoon|evening)|welcome|nice to meet you)\b",
+                 r"\b(my name is|i am dr|i'm dr|i am doctor|i'm doctor|i am (a|the) (medical student|doctor|physician)|i'm (a|the) (medical student|doctor|physician))\b"])
+        ],
+        # Drug and allergy history
+        ("history", 9): [
+            (2, [r"\ballerg",
+                 r"\b(medication|medicine|tablets?|pills?|drugs? (do you|are you) tak|taking any)"])
+        ],
+        # Family history
+        ("history", 10): [
+            (1, [r"\b(family history|anyone in (your|the) family|run(s)? in (your|the) family|your (parents|mother|father|siblings|brothers?|sisters?) (have|had|suffer))"])
+        ],
+        # Social history: at least three of its components ("drink" only about alcohol, not water)
+        ("history", 11): [
+            (3, [r"\bsmok|\bcigarette|\btobacco",
+                 r"\b(alcohol|beer|wine|spirits)\b|\b(do|did) you (ever )?drink\?",
+                 r"\b(occupation|what do you do for (a )?(living|work)|your (job|work))\b",
+                 r"\b(diet|what do you eat|eating habits)\b",
+                 r"\b(exercise|physical activity|sports?)\b",
+                 r"\b(married|marital|live with|living situation|who do you live)\b",
+                 r"\b(recreational|illicit|street) drugs\b"])
+        ],
+        # PHQ-2: both screening questions ("down" only about mood, not "lie down")
+        ("history", 15): [
+            (2, [r"\b(little interest|pleasure in doing|lost interest)",
+                 r"\b(feel|feels|feeling|felt|been|are you|mood) (so |very |a bit |at all )?(down|depressed|hopeless|low)\b|\blow mood\b"])
+        ],
+        # Vaccination and preventive health
+        ("history", 16): [
+            (2, [r"\b(vaccin|immuni[sz]|flu (shot|jab)|booster)",
+                 r"\b(screening|mammogram|pap smear|colonoscopy|check-?ups?)\b"])
+        ],
+        # Permission and hand hygiene
+        ("exam", 0): [
+            (2, [r"\b(permission|may i examine|can i examine|is it ok(ay)? if i examine|do you mind if i examine)",
+                 r"\b(wash|sanitis|sanitiz|clean) (my )?hands\b"])
+        ],
+        # Vital signs
+        ("exam", 1): [
+            (1, [r"\bvital signs\b"]),
+            (2, [r"\bblood pressure\b|\bbp\b",
+                 r"\b(pulse|heart rate)\b",
+                 r"\btemperature\b",
+                 r"\b(respiratory rate|breathing rate)\b",
+                 r"\b(oxygen saturation|o2 sat|spo2|sats)\b"])
+        ],
+        # Orders lab investigations
+        ("lab", 0): [
+            (2, [r"\b(i'?ll|i will|we'?ll|we will|let's|let me|i'?d like to|i would like to) (order|request|send|arrange|check|do|run|get)\b",
+                 r"\b(blood tests?|labs?|lab tests?|cbc|complete blood count|full blood count|urinalysis|urine test|electrolytes|renal function|liver function|troponin|crp|esr|hba1c|lipid profile)\b"])
+        ]
+    },
+    "ar": {
+        ("history", 0): [
+            (2, [r"(مرحبا|السلام عليكم|أهلا|اهلا|صباح الخير|مساء الخير)",
+                 r"(اسمي|أنا الدكتور|انا الدكتور|أنا طبيب|انا طبيب|أنا طالب|انا طالب|أنا الطبيب)"])
+        ],
+        ("history", 9): [
+            (2, [r"حساسي",
+                 r"(أدوية|ادوية|دواء|حبوب)"])
+        ],
+        # A family member alone ("do you live with your family") isn't a family history question:
+        # it needs "anyone in the family" or an illness in the same sentence
+        ("history", 10): [
+            (1, [r"(تاريخ عائلي|تاريخ مرضي في العائلة|أحد في العائلة|احد في العائلة|أحد من العائلة|أحد من أقاربك"
+                 r"|(عائلتك|العائلة|والدك|والدتك|الأهل|أقاربك)[^.؟?\n]{0,40}(مرض|أمراض|امراض|يعاني|مصاب|وراثي)"
+                 r"|(مرض|أمراض|امراض|يعاني|مصاب|وراثي)[^.؟?\n]{0,40}(عائلتك|العائلة|والدك|والدتك|الأهل|أقاربك))"])
+        ],
+        ("history", 11): [
+            (3, [r"(تدخن|التدخين|سجائر|سيجارة)",
+                 r"(كحول|الكحول)",
+                 r"(تعمل|عملك|وظيفتك|مهنتك)",
+                 r"(أكلك|اكلك|نظامك الغذائي|غذاء|طعامك)",
+                 r"(رياضة|الرياضة|تمارين)",
+                 r"(متزوج|تعيش مع|تسكن مع)",
+                 r"(مخدرات)"])
+        ],
+        ("history", 15): [
+            (2, [r"(اهتمام|متعة)",
+                 r"(حزين|مكتئب|اكتئاب|يائس|يأس)"])
+        ],
+        ("history", 16): [
+            (2, [r"(تطعيم|لقاح)",
+                 r"(فحص دوري|الكشف المبكر|ماموجرام|فحوصات دورية)"])
+        ],
+        ("exam", 0): [
+            (2, [r"(تسمح لي|بإذنك|باذنك|إذنك|اذنك)",
+                 r"(أغسل يدي|اغسل يدي|أعقم يدي|اعقم يدي|تعقيم)"])
+        ],
+        ("exam", 1): [
+            (1, [r"العلامات الحيوية"]),
+            (2, [r"ضغط الدم",
+                 r"(النبض|نبض القلب)",
+                 r"(الحرارة|درجة الحرارة)",
+                 r"(معدل التنفس)",
+                 r"(الأكسجين|الاكسجين)"])
+        ],
+        ("lab", 0): [
+            (2, [r"(سأطلب|سنطلب|نطلب|أطلب|اطلب|سنعمل|سأعمل)",
+                 r"(تحليل|تحاليل|فحص دم|فحص الدم|صورة دم|فحص البول)"])
+        ]
+    }
+}
+
+# Compile once at import time
+COMPILED_RULES = {
+    lang: {
+        item: [(min_matches, [re.compile(pattern, re.IGNORECASE) for pattern in patterns])
+               for min_matches, patterns in alternatives]
+        for item, alternatives in rules.items()
+    }
+    for lang, rules in RULES.items()
+}
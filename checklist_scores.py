@@ -0,0 +1,150 @@
+"""
+Compact checklist scores.
+
+A ChecklistScores holds one byte per CHECKLIST item in a fixed-size array('B')
+laid out section by section, with the section offsets computed once from
+CHECKLIST. Totals, section percentages and missed items are single numpy
+operations on a zero-copy view of that array, and the scores pack into
+2 bits per item (9 bytes for the 35-item checklist) for storage.
+
+unpack_many() and section_totals() work on many attempts at once, as a
+(attempts x items) uint8 matrix.
+"""
+from array import array
+from itertools import chain
+import numpy as np
+from checklist import CHECKLIST
+
+SECTIONS = list(CHECKLIST)
+SECTION_OFFSETS = {}   # section -> (first slot, end slot)
+_start = 0
+for _section, _items in CHECKLIST.items():
+    SECTION_OFFSETS[_section] = (_start, _start + len(_items))
+    _start += len(_items)
+N_ITEMS = _start
+
+_SECTION_SIZES = [len(CHECKLIST[section]) for section in SECTIONS]
+
+# Item text per slot
+ITEMS = [item for items in CHECKLIST.values() for item in items]
+_ITEMS_ARRAY = np.array(ITEMS, dtype=object)
+
+_STARTS = np.array([SECTION_OFFSETS[section][0] for section in SECTIONS])
+_SECTION_MAX = np.array([5 * len(CHECKLIST[section]) for section in SECTIONS])
+_PCT_SCALE = 100 / _SECTION_MAX
+_PCT_KEYS = [f"{section}_pct" for section in SECTIONS]
+
+# 2-bit codes of the valid scores (Not Done, Partially Done, Well Done)
+VALID_SCORES = (0, 3, 5)
+_VALID_SET = frozenset(VALID_SCORES)
+_CODE_OF_SCORE = np.zeros(6, dtype=np.uint8)
+_CODE_OF_SCORE[list(VALID_SCORES)] = [0, 1, 2]
+_SCORE_OF_CODE = np.array([0, 3, 5, 0], dtype=np.uint8)
+_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+# Bytes per packed attempt
+PACKED_SIZE = -(-N_ITEMS // 4)
+
+class ChecklistScores:
+    """Scores of every CHECKLIST item in one array('B') of N_ITEMS slots"""
+
+    __slots__ = ("values",)
+
+    def __init__(self, values=None):
+        self.values = array("B", values if values is not None else bytes(N_ITEMS))
+        if len(self.values) != N_ITEMS:
+            raise ValueError(f"expected {N_ITEMS} scores, got {len(self.values)}")
+
+    @classmethod
+    def from_raw(cls, raw_scores, strict=False):
+        """
+        Build from a raw_scores dict of section -> list of item scores.
+        Missing items score 0 and extra items are dropped. An invalid score counts
+        as Not Done, or raises ValueError when strict is set.
+        """
+        sections = [raw_scores.get(section, ()) for section in SECTIONS]
+        if [len(section_scores) for section_scores in sections] == _SECTION_SIZES:
+            flat = list(chain.from_iterable(sections))
+            if _VALID_SET.issuperset(flat):
+                # Common case: every section complete and valid
+                return cls(map(int, flat))
+
+        scores = cls()
+        for section, (start, end) in SECTION_OFFSETS.items():
+            section_scores = list(raw_scores.get(section, [])[:end - start])
+            if not _VALID_SET.issuperset(section_scores):
+                if strict:
+                    raise ValueError(f"invalid {section} scores: {section_scores!r}")
+                section_scores = [score if score in _VALID_SET else 0 for score in section_scores]
+            scores.values[start:start + len(section_scores)] = array("B", map(int, section_scores))
+        return scores
+
+    def to_raw(self):
+        """The raw_scores dict of section -> list of item scores"""
+        return {section: self.values[start:end].tolist() for section, (start, end) in SECTION_OFFSETS.items()}
+
+    def section(self, section):
+        """Item scores of one section"""
+        start, end = SECTION_OFFSETS[section]
+        return self.values[start:end].tolist()
+
+    def array(self):
+        """Zero-copy uint8 numpy view of the scores"""
+        return np.frombuffer(self.values, dtype=np.uint8)
+
+    def total(self):
+        """Sum of all item scores"""
+        return sum(self.values)
+
+    def total_pct(self):
+        return round(self.total() / (5 * N_ITEMS) * 100, 1) if N_ITEMS else 0
+
+    def section_pcts(self):
+        """Dict of "<section>_pct" -> percentage rounded to 0.1"""
+        pcts = (np.add.reduceat(self.array(), _STARTS, dtype=np.int64) * _PCT_SCALE).round(1).tolist()
+        return dict(zip(_PCT_KEYS, pcts))
+
+    def missed_mask(self):
+        """Boolean mask of the items scored 0"""
+        return self.array() == 0
+
+    def missed_items(self):
+        """Text of every item scored 0, in checklist order"""
+        return _ITEMS_ARRAY[self.missed_mask()].tolist()
+
+    def to_bytes(self):
+        """Pack to PACKED_SIZE bytes, 2 bits per item"""
+        return pack_many(self.array()[None, :])[0].tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob):
+        return cls(unpack_many([blob])[0].tobytes())
+
+    def __eq__(self, other):
+        return isinstance(other, ChecklistScores) and self.values == other.values
+
+    def __repr__(self):
+        return f"ChecklistScores({self.to_raw()})"
+
+def pack_many(matrix):
+    """Pack an (attempts x N_ITEMS) score matrix into an (attempts x PACKED_SIZE) uint8 matrix"""
+    codes = np.zeros((len(matrix), PACKED_SIZE * 4), dtype=np.uint8)
+    codes[:, :N_ITEMS] = _CODE_OF_SCORE[np.asarray(matrix)]
+    return np.bitwise_or.reduce(codes.reshape(len(matrix), PACKED_SIZE, 4) << _SHIFTS, axis=2).astype(np.uint8)
+
+def unpack_many(blobs):
+    """
+    Unpack packed scores (an iterable of PACKED_SIZE-byte blobs) into an
+    (attempts x N_ITEMS) uint8 matrix of item scores.
+    """
+    packed = np.frombuffer(b"".join(blobs), dtype=np.uint8).reshape(-1, PACKED_SIZE)
+    codes = (packed[:, :, None] >> _SHIFTS) & 3
+    return _SCORE_OF_CODE[codes.reshape(len(packed), -1)[:, :N_ITEMS]]
+
+def section_totals(matrix):
+    """(attempts x sections) sums of an (attempts x N_ITEMS) score matrix, sections in SECTIONS order"""
+    return np.add.reduceat(np.asarray(matrix, dtype=np.int64), _STARTS, axis=1)
+
+def section_pct_matrix(matrix):
+    """(attempts x sections) section percentages of an (attempts x N_ITEMS) score matrix"""
+    return section_totals(matrix) / _SECTION_MAX * 100
@@ -0,0 +1,376 @@
+"""
+Fuzzy diagnosis matching over a normalized-term index.
+
+Diagnoses are normalized (case, punctuation, Arabic letter variants), mapped
+through a synonym/abbreviation table to one canonical English term ("MI",
+"heart attack" and "احتشاء عضلة القلب" all become "myocardial infarction"),
+and embedded as hashed character n-gram vectors. Terms whose qualifiers
+conflict ("type 1" vs "type 2", "acute" vs "chronic") never match.
+
+Each pair is first compared word by word: a student diagnosis must name the
+term's head noun ("pneumonia" in "community acquired pneumonia"), naming all
+of the term's core words is a full match and naming only some of them a
+partial one. Only when the words alone cannot tell do the cosine thresholds
+decide. Term vectors are cached, so scoring a student diagnosis against every
+answer-key term is one matrix product, and score_diagnoses() grades any
+number of attempts in a few vectorized passes.
+"""
+import re, zlib
+from functools import lru_cache
+import numpy as np
+
+# Canonical term -> synonyms and abbreviations (English and Arabic)
+SYNONYMS = {
+    "myocardial infarction": ["mi", "ami", "stemi", "nstemi", "heart attack", "احتشاء عضلة القلب", "نوبة قلبية", "جلطة قلبية"],
+    "acute coronary syndrome": ["acs", "متلازمة الشريان التاجي الحادة", "متلازمة الشريان التاجي الحاده"],
+    "angina pectoris": ["ذبحة صدرية"],
+    "pulmonary embolism": ["pe", "انصمام رئوي", "جلطة رئوية"],
+    "deep vein thrombosis": ["dvt", "deep venous thrombosis", "خثار الوريد العميق", "جلطة الساق"],
+    "gastroesophageal reflux disease": ["gerd", "gord", "acid reflux disease", "gastro oesophageal reflux disease",
+                                        "gastro esophageal reflux disease", "ارتجاع المريء", "الارتجاع المعدي المريئي"],
+    "costochondritis": ["tietze syndrome", "التهاب الغضروف الضلعي"],
+    "pneumothorax": ["ptx", "collapsed lung", "استرواح الصدر"],
+    "community acquired pneumonia": ["cap", "التهاب رئوي مكتسب من المجتمع"],
+    "acute bronchitis": ["التهاب القصبات الحاد", "التهاب الشعب الهوائية الحاد"],
+    "acute asthma": ["asthma exacerbation", "asthma attack", "نوبة ربو"],
+    "chronic obstructive pulmonary disease": ["copd", "aecopd", "مرض الانسداد الرئوي المزمن"],
+    "congestive heart failure": ["chf", "ccf", "فشل القلب الاحتقاني", "قصور القلب الاحتقاني"],
+    "atrial fibrillation": ["af", "afib", "رجفان أذيني"],
+    "hypertension": ["htn", "high blood pressure", "ارتفاع ضغط الدم"],
+    "pulmonary tuberculosis": ["ptb", "السل الرئوي", "الدرن الرئوي"],
+    "acute appendicitis": ["التهاب الزائدة الدودية الحاد"],
+    "acute cholecystitis": ["التهاب المرارة الحاد"],
+    "biliary colic": ["مغص مراري"],
+    "cholelithiasis": ["gallstones", "gallstone disease", "gall stones", "حصى المرارة", "حصوات المرارة"],
+    "gastroenteritis": ["stomach flu", "التهاب المعدة والأمعاء"],
+    "renal colic": ["ureteric colic", "مغص كلوي"],
+    "nephrolithiasis": ["kidney stone", "kidney stones", "renal stone", "renal stones", "renal calculus", "renal calculi",
+                        "حصى الكلى", "حصوات الكلى"],
+    "pyelonephritis": ["kidney infection", "التهاب الحويضة والكلية"],
+    "urinary tract infection": ["uti", "التهاب المسالك البولية"],
+    "irritable bowel syndrome": ["ibs", "متلازمة القولون العصبي", "القولون العصبي"],
+    "inflammatory bowel disease": ["ibd", "مرض التهاب الأمعاء"],
+    "crohn disease": ["crohns disease", "داء كرون"],
+    "ulcerative colitis": ["uc", "التهاب القولون التقرحي"],
+    "peptic ulcer disease": ["pud", "peptic ulcer", "قرحة هضمية"],
+    "acute pancreatitis": ["التهاب البنكرياس الحاد"],
+    "ectopic pregnancy": ["حمل خارج الرحم"],
+    "miscarriage": ["spontaneous abortion", "إجهاض تلقائي"],
+    "migraine": ["شقيقة", "صداع نصفي"],
+    "tension type headache": ["tension headache", "tth", "صداع التوتر", "صداع توتري"],
+    "cluster headache": ["صداع عنقودي"],
+    "subarachnoid hemorrhage": ["sah", "subarachnoid haemorrhage", "نزف تحت العنكبوتية"],
+    "meningitis": ["التهاب السحايا"],
+    "stroke": ["cva", "cerebrovascular accident", "سكتة دماغية", "جلطة دماغية"],
+    "transient ischemic attack": ["tia", "mini stroke", "نوبة إقفارية عابرة"],
+    "sinusitis": ["rhinosinusitis", "التهاب الجيوب الأنفية"],
+    "benign paroxysmal positional vertigo": ["bppv", "دوار الوضعة الانتيابي الحميد"],
+    "vestibular neuritis": ["التهاب العصب الدهليزي"],
+    "iron deficiency anemia": ["ida", "iron deficiency anaemia", "فقر الدم بعوز الحديد", "أنيميا نقص الحديد"],
+    "type 1 diabetes mellitus": ["t1dm", "dm1", "type 1 diabetes", "type i diabetes", "السكري من النوع الأول"],
+    "type 2 diabetes mellitus": ["t2dm", "dm2", "type 2 diabetes", "type ii diabetes", "السكري من النوع الثاني"],
+    "diabetic ketoacidosis": ["dka", "الحماض الكيتوني السكري"],
+    "hypothyroidism": ["underactive thyroid", "قصور الغدة الدرقية"],
+    "hyperthyroidism": ["overactive thyroid", "فرط نشاط الغدة الدرقية"],
+    "rheumatoid arthritis": ["ra", "التهاب المفاصل الروماتويدي"],
+    "osteoarthritis": ["oa", "degenerative joint disease", "خشونة المفاصل", "الفصال العظمي"],
+    "gout": ["gouty arthritis", "النقرس"],
+    "septic arthritis": ["التهاب المفصل الإنتاني"],
+    "systemic lupus erythematosus": ["sle", "الذئبة الحمراء الجهازية"],
+    "mechanical low back pain": ["mechanical back pain", "lumbar strain", "low back strain", "ألم أسفل الظهر الميكانيكي"],
+    "lumbar disc herniation": ["slipped disc", "herniated disc", "prolapsed disc", "disc prolapse", "انزلاق غضروفي"],
+    "spinal stenosis": ["lumbar spinal stenosis", "تضيق القناة الشوكية"],
+    "influenza": ["الإنفلونزا"],
+    "viral syndrome": ["viral infection", "viral illness", "عدوى فيروسية"],
+    "cellulitis": ["التهاب النسيج الخلوي"],
+    "urticaria": ["hives", "الشرى"],
+    "atopic dermatitis": ["atopic eczema", "الأكزيما التأتبية"],
+    "psoriasis": ["الصدفية"],
+    "major depressive disorder": ["mdd", "major depression", "اضطراب الاكتئاب الشديد"],
+    "generalized anxiety disorder": ["gad", "اضطراب القلق العام"],
+    "illness anxiety disorder": ["health anxiety", "hypochondriasis", "قلق المرض"]
+}
+
+# Dimension of the hashed n-gram vectors, and the n-gram length
+VECTOR_DIM = 2048
+NGRAM = 3
+
+# Attempts scored per vectorized pass in score_diagnoses()
+BATCH_CHUNK = 4096
+
+# Qualifiers that tell apart distinct diseases spelled almost alike. Each group
+# lists mutually exclusive alternatives (regexes on the normalized term); two
+# terms with different alternatives of one group never match, whatever their
+# n-gram similarity ("chronic pancreatitis" vs "acute pancreatitis").
+QUALIFIER_GROUPS = [
+    [r"\bacute\b", r"\bchronic\b"],
+    [r"\btype (1|i)\b", r"\btype (2|ii)\b", r"\bgestational\b", r"\binsipidus\b"],
+    [r"\bhypo", r"\bhyper"],
+    [r"\bstable\b", r"\bunstable\b"],
+    [r"\bbenign\b", r"\bmalignant\b"],
+    [r"\bprimary\b", r"\bsecondary\b"],
+    [r"\bupper\b", r"\blower\b"],
+    [r"\bleft\b", r"\bright\b"],
+    [r"\biron\b", r"\b(b12|cobalamin|pernicious)\b", r"\b(folate|folic)\b"],
+    [r"\bisch(a)?emic\b", r"\bha?emorrhagic\b"],
+    [r"\bviral\b", r"\bbacterial\b", r"\bfungal\b"],
+    [r"\b(heart|cardiac)\b", r"\b(renal|kidney)\b", r"\b(liver|hepatic)\b", r"\b(lung|respiratory)\b"]
+]
+
+# Words left out when comparing the words of two terms: fillers that name no
+# disease, and descriptors of the presentation rather than of the disease.
+# A connective ends the part of a term that holds its head noun
+# ("osteoarthritis of the knee").
+FILLER_WORDS = {"disease", "disorder", "syndrome", "mellitus", "pectoris", "type", "the", "and", "in", "to"}
+DESCRIPTOR_WORDS = {"acute", "chronic", "subacute", "left", "right", "bilateral", "unilateral", "sided", "side",
+                    "upper", "lower", "mild", "moderate", "severe", "spontaneous", "recurrent", "ruptured",
+                    "perforated", "complicated", "uncomplicated", "exacerbation", "episode"}
+CONNECTIVES = {"of", "with", "due", "from", "after", "caused"}
+
+# Match levels of a student diagnosis to a term; UNDECIDED leaves it to the similarity thresholds
+FULL_MATCH, PARTIAL_MATCH, NO_MATCH, UNDECIDED = 2, 1, 0, -1
+
+# Cosine similarity thresholds for the pairs the word comparison leaves UNDECIDED,
+# calibrated on the fitting pairs in benchmarks/dx_calibration.py and checked on
+# its held-out pairs (rerun it after changing SYNONYMS, QUALIFIER_GROUPS, the word
+# lists or the vectors)
+MAIN_FULL_MATCH = 0.77
+MAIN_PARTIAL_MATCH = 0.67
+DIFFERENTIAL_MATCH = 0.76
+
+def normalize(text):
+    """Lowercase, unify Arabic letter variants and drop punctuation and diacritics"""
+    text = str(text or "").lower()
+    text = re.sub("[إأآ]", "ا", text).replace("ة", "ه").replace("ى", "ي")
+    text = re.sub("[\u064B-\u0652]", "", text)  # Arabic diacritics
+    text = text.replace("'", "")
+    return " ".join(re.findall(r"\w+", text))
+
+def _build_index():
+    """Normalized synonym -> canonical term, plus a regex for multi-word synonyms"""
+    index = {}
+    for canonical, synonyms in SYNONYMS.items():
+        canonical_norm = normalize(canonical)
+        index[canonical_norm] = canonical_norm
+        for synonym in synonyms:
+            index[normalize(synonym)] = canonical_norm
+    phrases = sorted((s for s in index if " " in s), key=len, reverse=True)
+    pattern = re.compile(r"\b(" + "|".join(re.escape(p) for p in phrases) + r")\b") if phrases else None
+    return index, pattern
+
+_TERM_INDEX, _PHRASE_PATTERN = _build_index()
+_QUALIFIER_PATTERNS = [[re.compile(alternative) for alternative in group] for group in QUALIFIER_GROUPS]
+
+@lru_cache(maxsize=65536)
+def canonical(text):
+    """
+    Canonical form of a diagnosis: the whole text if it is a known term,
+    otherwise the text with every known multi-word phrase replaced. Single
+    words are left alone, so a generic word ("diabetes") or a bare
+    abbreviation never stands in for a specific disease. A parenthetical
+    ("Renal colic (ureteric stone)") explains the term and is dropped.
+    """
+    norm = normalize(re.sub(r"\([^)]*\)", " ", str(text or ""))) or normalize(text)
+    if norm in _TERM_INDEX:
+        return _TERM_INDEX[norm]
+    if _PHRASE_PATTERN is not None:
+        norm = _PHRASE_PATTERN.sub(lambda m: _TERM_INDEX[m.group(1)], norm)
+    return norm
+
+@lru_cache(maxsize=65536)
+def _qualifiers(term):
+    """Bitmask per QUALIFIER_GROUPS entry of the alternatives found in a canonical term (read-only)"""
+    masks = np.array([sum(1 << i for i, pattern in enumerate(group) if pattern.search(term))
+                      for group in _QUALIFIER_PATTERNS], dtype=np.uint8)
+    masks.setflags(write=False)
+    return masks
+
+def _conflicts(a, b):
+    """Whether qualifier masks a and b (stacked row-wise) name different alternatives of some group"""
+    return ((a != 0) & (b != 0) & ((a & b) == 0)).any(axis=-1)
+
+@lru_cache(maxsize=65536)
+def _core_words(term):
+    """Core words of a canonical term and its head noun (the last core word before any connective)"""
+    words = term.split()
+    cut = next((i for i, word in enumerate(words) if word in CONNECTIVES and i > 0), len(words))
+    def is_core(word):
+        return word not in FILLER_WORDS and word not in DESCRIPTOR_WORDS and word not in CONNECTIVES
+    core = tuple(word for word in words if is_core(word))
+    heads = [word for word in words[:cut] if is_core(word)] or core
+    return core, (heads[-1] if heads else None)
+
+def _edit_distance(a, b):
+    """Levenshtein distance with adjacent transpositions"""
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+    return current[-1]
+
+@lru_cache(maxsize=65536)
+def _same_word(a, b):
+    """
+    Whether two words are the same up to a spelling slip or a truncation
+    ("infraction", "infarct" for "infarction"); words differing by a whole
+    syllable ("gastritis", "gastroenteritis") are not
+    """
+    if a == b:
+        return True
+    shorter, longer = sorted((a, b), key=len)
+    if len(shorter) >= 5 and len(shorter) >= 0.7 * len(longer) and longer.startswith(shorter):
+        return True
+    allowed = 0 if len(longer) <= 3 else 1 if len(longer) <= 7 else 2
+    return abs(len(a) - len(b)) <= allowed and _edit_distance(a, b) <= allowed
+
+@lru_cache(maxsize=65536)
+def _word_match(student, term):
+    """
+    Match level of two canonical terms from their words: NO_MATCH when their
+    qualifiers conflict or the student misses the term's head noun, FULL_MATCH
+    when the student names every core word of the term (detail beyond it is
+    fine), PARTIAL_MATCH when the student names only some of them and nothing
+    else, UNDECIDED otherwise
+    """
+    if _conflicts(_qualifiers(student), _qualifiers(term)):
+        return NO_MATCH
+    student_core, _ = _core_words(student)
+    term_core, head = _core_words(term)
+    if head is None or not student_core:
+        return UNDECIDED
+    def named(word, words):
+        return any(_same_word(word, other) for other in words)
+    if not named(head, student_core):
+        return NO_MATCH
+    if all(named(word, student_core) for word in term_core):
+        return FULL_MATCH
+    if all(named(word, term_core) for word in student_core):
+        return PARTIAL_MATCH
+    return UNDECIDED
+
+def word_matches(student_dx, terms):
+    """Word-comparison match level (FULL_MATCH ... UNDECIDED) of a student diagnosis to each term"""
+    student = canonical(student_dx)
+    return np.array([_word_match(student, canonical(term)) for term in terms], dtype=np.int8)
+
+def match_levels(sims, decided, full, partial):
+    """Match level per pair: the word comparison where it decides, the similarity thresholds elsewhere"""
+    return np.where(decided != UNDECIDED, decided,
+                    np.select([sims > full, sims > partial], [FULL_MATCH, PARTIAL_MATCH], default=NO_MATCH))
+
+@lru_cache(maxsize=65536)
+def _vector(term):
+    """L2-normalized hashed character n-gram vector of a canonical term (read-only)"""
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    if term:
+        padded = f" {term} "
+        # crc32 rather than hash(): vectors must be identical across processes
+        buckets = [zlib.crc32(padded[i:i + NGRAM].encode("utf-8")) % VECTOR_DIM
+                   for i in range(len(padded) - NGRAM + 1)]
+        np.add.at(vector, buckets, 1.0)
+        vector /= np.linalg.norm(vector)
+    vector.setflags(write=False)
+    return vector
+
+def _matrix(texts):
+    """Stack the vectors and the qualifier masks of the canonical forms of texts"""
+    if not texts:
+        return np.zeros((0, VECTOR_DIM), dtype=np.float32), np.zeros((0, len(QUALIFIER_GROUPS)), dtype=np.uint8)
+    terms = [canonical(text) for text in texts]
+    return np.stack([_vector(_core_text(term)) for term in terms]), np.stack([_qualifiers(term) for term in terms])
+
+def _core_text(term):
+    """The core words of a canonical term, which is what gets embedded, so shared fillers add no similarity"""
+    return " ".join(_core_words(term)[0]) or term
+
+def similarities(student_dx, terms):
+    """
+    Cosine similarity of the core words of a student diagnosis to those of each
+    term, as one matrix product; 0 for terms with a conflicting qualifier
+    """
+    vectors, qualifiers = _matrix(terms)
+    student = canonical(student_dx)
+    sims = vectors @ _vector(_core_text(student))
+    sims[_conflicts(qualifiers, _qualifiers(student))] = 0.0
+    return sims
+
+def _grade(main_level, diff_level):
+    """Score from the main-diagnosis and best-differential match levels (vectorized)"""
+    return np.select(
+        [main_level == FULL_MATCH, main_level == PARTIAL_MATCH, diff_level >= PARTIAL_MATCH],
+        [100, 75, 50],
+        default=0
+    )
+
+def score_diagnosis(student_dx, answer_key):
+    """
+    Score one student diagnosis against an answer key.
+
+    Returns:
+        Tuple of (score, correct diagnosis) with score 100 or 75 for a full or
+        partial match of the main diagnosis, 50 for a differential and 0 otherwise
+    """
+    correct = answer_key["main_diagnosis"]
+    if not normalize(student_dx):
+        return 0, correct
+    terms = [correct] + list(answer_key.get("differentials", []))
+    sims, decided = similarities(student_dx, terms), word_matches(student_dx, terms)
+    main_level = match_levels(sims[:1], decided[:1], MAIN_FULL_MATCH, MAIN_PARTIAL_MATCH)
+    diff_levels = match_levels(sims[1:], decided[1:], DIFFERENTIAL_MATCH, DIFFERENTIAL_MATCH)
+    diff_level = diff_levels.max() if len(diff_levels) else NO_MATCH
+    return int(_grade(main_level, np.array([diff_level]))[0]), correct
+
+def score_diagnoses(attempts):
+    """
+    Score many (student diagnosis, answer key) pairs.
+
+    Every distinct text is embedded once, every distinct pair is compared word
+    by word once, and each chunk of attempts is graded with a few array
+    operations, so thousands of attempts take well under a second.
+
+    Returns:
+        List of (score, correct diagnosis) tuples in the order of attempts
+    """
+    results = []
+    for start in range(0, len(attempts), BATCH_CHUNK):
+        chunk = attempts[start:start + BATCH_CHUNK]
+        texts = {}
+        def text_id(text):
+            return texts.setdefault(text, len(texts))
+
+        student_ids = np.array([text_id(dx or "") for dx, _ in chunk])
+        main_ids = np.array([text_id(key["main_diagnosis"]) for _, key in chunk])
+        diff_owner, diff_ids = [], []
+        for i, (_, key) in enumerate(chunk):
+            for diff in key.get("differentials", []):
+                diff_owner.append(i)
+                diff_ids.append(text_id(diff))
+
+        vectors, qualifiers = _matrix(list(texts))
+        terms = [canonical(text) for text in texts]
+        def decisions(pairs_student, pairs_term):
+            return np.array([_word_match(terms[s], terms[t]) for s, t in zip(pairs_student, pairs_term)],
+                            dtype=np.int8)
+
+        students = vectors[student_ids]
+        main_sim = np.einsum("ij,ij->i", students, vectors[main_ids])
+        main_sim[_conflicts(qualifiers[student_ids], qualifiers[main_ids])] = 0.0
+        main_level = match_levels(main_sim, decisions(student_ids, main_ids), MAIN_FULL_MATCH, MAIN_PARTIAL_MATCH)
+        diff_level = np.full(len(chunk), NO_MATCH, dtype=np.int8)
+        if diff_ids:
+            owner = np.array(diff_owner)
+            diff_ids = np.array(diff_ids)
+            sims = np.einsum("ij,ij->i", students[owner], vectors[diff_ids])
+            sims[_conflicts(qualifiers[student_ids[owner]], qualifiers[diff_ids])] = 0.0
+            levels = match_levels(sims, decisions(student_ids[owner], diff_ids), DIFFERENTIAL_MATCH,
+                                  DIFFERENTIAL_MATCH)
+            np.maximum.at(diff_level, owner, levels.astype(np.int8))
+
+        scores = _grade(main_level, diff_level)
+        # An empty diagnosis never scores
+        scores[[not normalize(dx) for dx, _ in chunk]] = 0
+        results.extend((int(score), key["main_diagnosis"]) for score, (_, key) in zip(scores, chunk))
+    return results
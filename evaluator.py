@@ -1,13 +1,32 @@
-import json, difflib
-from openai_utils import chat
+import json
+from concurrent.futures import ThreadPoolExecutor
+from openai_utils import chat, chat_many, route_model
+from llm_metrics import bind_session
+from case_generator import fix_json_string
+from checklist_rules import COMPILED_RULES, SETTLED_ITEMS
+from dx_matcher import score_diagnosis
 from checklist import CHECKLIST, WEIGHTS, MAX_SCORE
+from checklist_scores import ChecklistScores, ITEMS, SECTION_OFFSETS
 from prompt_templates import EVALUATION_PROMPT
 
-def checklist_score(lang, transcript, case=None):
+# Items judged on the encounter as a whole (rapport, ICEE, communication): they
+# are never scored on transcript fragments, only on the full transcript at the end
+HOLISTIC_ITEMS = {"history": [0, 14], "interaction": [0]}
+
+def _scoring_max_tokens(n_items):
+    """Completion budget for a JSON reply scoring n_items checklist items plus comments"""
+    return min(1000, 150 + 25 * n_items)
+
+def _scoring_messages(lang, transcript, case, sections, hints=None):
     """
-    Calculate scores for checklist items based on transcript and case details.
-    Now includes separate scoring for history, examination, management, lab, and interaction.
+    Build the examiner prompt for the given checklist sections.
+    
+    Args:
+        sections: Dict of section name -> list of checklist items to score
+        hints: Checklist items the keyword rules found evidence for (see rule_hints)
     """
+    section_list = ", ".join(f"'{section}'" for section in sections)
+    
     # Create a detailed system prompt
     sys = {"role":"system",
         "content":(
@@ -16,7 +35,7 @@ def checklist_score(lang, transcript, case=None):
             "For EACH checklist item, respond with a score: "
             "0 (Not Done), 3 (Partially Done), or 5 (Well Done). "
             "Return a JSON object with these sections: "
-            "'history', 'exam', 'lab', 'management', 'interaction' (each with arrays of scores), "
+            f"{section_list} (each with arrays of scores), "
             "'overall_comments' (string with brief feedback)"
         )}
     
@@ -24,10 +43,16 @@ def checklist_score(lang, transcript, case=None):
     prompt_content = f"Transcript:\n{transcript}\n\nChecklist Items:\n"
     
     # Add each section's items
-    for section, items in CHECKLIST.items():
+    for section, items in sections.items():
         prompt_content += f"\n{section.upper()}:\n"
         prompt_content += "\n".join(f"- {item}" for item in items)
     
+    # Keyword evidence for items with several parts: a hint, not a score
+    if hints:
+        prompt_content += ("\n\nKeyword checks found evidence for these items; score Well Done only if "
+                           "every part of the item is done:\n")
+        prompt_content += "\n".join(f"- {item}" for item in hints)
+    
     # Add case details if available
     if case:
         prompt_content += f"\n\nCase Information (for context):\n"
@@ -35,133 +60,398 @@ def checklist_score(lang, transcript, case=None):
         prompt_content += f"Diagnosis: {case.get('answer_key', {}).get('main_diagnosis', 'Unknown')}"
     
     usr = {"role":"user","content": prompt_content}
+    return [sys, usr]
+
+def _fit_scores(section_scores, n_items):
+    """Pad or truncate a section's score list to exactly n_items entries"""
+    if len(section_scores) < n_items:
+        return section_scores + [0] * (n_items - len(section_scores))
+    return section_scores[:n_items]
+
+def summarize_scores(raw_scores, comments=""):
+    """
+    Turn per-section raw item scores into the checklist result dictionary
+    (total and section percentages, missed items, comments).
+    """
+    scores = raw_scores if isinstance(raw_scores, ChecklistScores) else ChecklistScores.from_raw(raw_scores)
+    
+    # Combine results
+    result = {
+        "total_pct": scores.total_pct(),
+        "raw_scores": scores.to_raw(),
+        "missed_items": scores.missed_items(),
+        "comments": comments
+    }
+    
+    # Add section percentages
+    result.update(scores.section_pcts())
+    
+    return result
+
+def _error_result(comments):
+    """All-zero checklist result, flagged "error", used when scoring fails completely"""
+    return {
+        "error": True,
+        "total_pct": 0,
+        "history_pct": 0,
+        "exam_pct": 0,
+        "lab_pct": 0,
+        "management_pct": 0,
+        "interaction_pct": 0,
+        "missed_items": [item for section in CHECKLIST.values() for item in section],
+        "comments": comments
+    }
+
+def _parse_section_scores(raw, section, n_items):
+    """
+    Extract one section's scores from a model response.
+    Returns a list of n_items valid scores, or None if the response is unusable.
+    """
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(fix_json_string(raw))
+        except json.JSONDecodeError:
+            return None
+    if not isinstance(raw, dict):
+        return None
+    
+    section_scores = raw.get(section)
+    if not isinstance(section_scores, list) or not section_scores:
+        return None
+    if any(score not in (0, 3, 5) for score in section_scores):
+        return None
+    return _fit_scores(section_scores, n_items)
+
+def _fired_rules(lang, transcript):
+    """(section, item index) of every keyword rule that fires on the transcript"""
+    rules = COMPILED_RULES.get(lang, COMPILED_RULES["en"])
+    return [
+        item for item, alternatives in rules.items()
+        if any(sum(1 for pattern in patterns if pattern.search(transcript)) >= min_matches
+               for min_matches, patterns in alternatives)
+    ]
+
+def prescore_checklist(lang, transcript):
+    """
+    Score the single-criterion checklist items (SETTLED_ITEMS) the keyword rules detect.
+    
+    Returns:
+        Dict of section -> {item index: 5} for every settled item a rule fired on
+    """
+    prescored = {}
+    for section, idx in _fired_rules(lang, transcript):
+        if (section, idx) in SETTLED_ITEMS:
+            prescored.setdefault(section, {})[idx] = 5
+    return prescored
+
+def rule_hints(lang, transcript, open_items=None):
+    """
+    Checklist items with several parts whose keyword rule fires on the
+    transcript; they stay with the LLM, which gets them as hints.
+    
+    Returns:
+        List of checklist item texts, limited to open_items when given
+    """
+    return [
+        CHECKLIST[section][idx] for section, idx in _fired_rules(lang, transcript)
+        if (section, idx) not in SETTLED_ITEMS and (open_items is None or idx in open_items.get(section, []))
+    ]
+
+def _open_items(prescored):
+    """Item indices per section that still need the LLM (all of them when nothing is prescored)"""
+    open_items = {
+        section: [i for i in range(len(items)) if i not in prescored.get(section, {})]
+        for section, items in CHECKLIST.items()
+    }
+    return {section: idxs for section, idxs in open_items.items() if idxs}
+
+def _merge_scores(open_items, llm_scores, prescored):
+    """Combine LLM scores for the open items with prescored items into full raw_scores"""
+    raw_scores = {}
+    for section, items in CHECKLIST.items():
+        section_scores = [0] * len(items)
+        for i, score in prescored.get(section, {}).items():
+            section_scores[i] = score
+        for i, score in zip(open_items.get(section, []), llm_scores.get(section, [])):
+            section_scores[i] = score
+        raw_scores[section] = section_scores
+    return raw_scores
+
+def _checklist_score_by_section(lang, transcript, case, max_retries, open_items, hints=None):
+    """
+    Score each CHECKLIST section as an independent concurrent request.
+    Sections whose response can't be parsed are retried on their own; a section
+    that still fails after max_retries is scored 0 without discarding the others.
+    
+    Returns:
+        Tuple of (scores for the open items of each section, comments)
+    """
+    llm_scores = {}
+    section_comments = {}
+    pending = list(open_items.keys())
+    
+    for attempt in range(max_retries + 1):
+        requests = [
+            {
+                "messages": _scoring_messages(
+                    lang, transcript, case, {section: [CHECKLIST[section][i] for i in open_items[section]]},
+                    [item for item in hints or [] if item in CHECKLIST[section]]
+                ),
+                "model": route_model("checklist_section"),
+                "temperature": 0.1,
+                "max_tokens": 300,
+                "return_json": True,
+                # A retry must not be answered with the cached bad response
+                "use_cache": False if attempt > 0 else None,
+                "cache_if": _scores_all({section: open_items[section]}),
+                "tag": "checklist_section"
+            }
+            for section in pending
+        ]
+        responses = chat_many(requests)
+        
+        failed = []
+        for section, raw in zip(pending, responses):
+            section_scores = _parse_section_scores(raw, section, len(open_items[section]))
+            if section_scores is None:
+                failed.append(section)
+                continue
+            llm_scores[section] = section_scores
+            section_comments[section] = raw.get("overall_comments", "") if isinstance(raw, dict) else ""
+        
+        pending = failed
+        if not pending:
+            break
+        print(f"Section scoring attempt {attempt + 1} failed for: {', '.join(pending)}")
+    
+    # Sections that never produced valid scores count as not done
+    for section in pending:
+        llm_scores[section] = [0] * len(open_items[section])
+    
+    comments = " ".join(
+        f"{section.capitalize()}: {section_comments[section]}"
+        for section in CHECKLIST if section_comments.get(section)
+    )
+    if pending:
+        comments += f" (Could not score: {', '.join(pending)})"
+    
+    return llm_scores, comments.strip()
+
+def checklist_score(lang, transcript, case=None, per_section=False, max_retries=2, prescore=False):
+    """
+    Calculate scores for checklist items based on transcript and case details.
+    Now includes separate scoring for history, examination, management, lab, and interaction.
+    
+    With per_section=True each section is scored by its own concurrent request and
+    failed sections are retried individually (see _checklist_score_by_section).
+    With prescore=True single-criterion items detected by the local keyword rules
+    are scored Well Done locally and left out of the LLM prompt (see
+    prescore_checklist); rules for items with several parts only add hints.
+    """
+    prescored = prescore_checklist(lang, transcript) if prescore else {}
+    open_items = _open_items(prescored)
+    if not open_items:
+        return summarize_scores(_merge_scores(open_items, {}, prescored))
+    hints = rule_hints(lang, transcript, open_items) if prescore else None
+    
+    if per_section:
+        try:
+            llm_scores, comments = _checklist_score_by_section(lang, transcript, case, max_retries, open_items,
+                                                               hints)
+            return summarize_scores(_merge_scores(open_items, llm_scores, prescored), comments)
+        except Exception as e:
+            print(f"Error in evaluation: {str(e)}")
+            return _error_result(f"Evaluation error occurred: {str(e)}")
     
     # Using GPT-4o for scoring - low temperature for consistency and accuracy
     try:
-        raw = chat([sys, usr], model="gpt-4o", temperature=0.1, max_tokens=1000)
+        sections = {section: [CHECKLIST[section][i] for i in idxs] for section, idxs in open_items.items()}
+        raw = chat(_scoring_messages(lang, transcript, case, sections, hints), model=route_model("checklist_scoring"),
+                   temperature=0.1, max_tokens=_scoring_max_tokens(sum(len(idxs) for idxs in open_items.values())),
+                   tag="checklist_scoring", cache_if=_scores_all(open_items))
         scores = json.loads(raw)
         
         # Calculate section percentages and collect raw scores
         if isinstance(scores, dict):
-            raw_scores = {}
-            total_raw = 0
-            total_possible = 0
-            
-            for section, items in CHECKLIST.items():
-                section_scores = scores.get(section, [])
-                
-                # Ensure we have scores for each item (use 0 if missing)
-                if len(section_scores) < len(items):
-                    section_scores = section_scores + [0] * (len(items) - len(section_scores))
-                elif len(section_scores) > len(items):
-                    section_scores = section_scores[:len(items)]
-                
-                # Store raw scores
-                raw_scores[section] = section_scores
-                
-                # Calculate totals
-                section_total = sum(section_scores)
-                section_possible = len(items) * 5
-                total_raw += section_total
-                total_possible += section_possible
-            
-            # Calculate overall percentage
-            overall_pct = (total_raw / total_possible * 100) if total_possible > 0 else 0
-            
-            # Calculate section percentages
-            section_pcts = {}
-            for section, items in CHECKLIST.items():
-                section_scores = raw_scores.get(section, [])
-                section_possible = len(items) * 5
-                section_pct = (sum(section_scores) / section_possible * 100) if section_possible > 0 else 0
-                section_pcts[f"{section}_pct"] = round(section_pct, 1)
-            
-            # Identify missed items (scored 0)
-            missed_items = []
-            for section, items in CHECKLIST.items():
-                section_scores = raw_scores.get(section, [])
-                for i, score in enumerate(section_scores):
-                    if i < len(items) and score == 0:
-                        missed_items.append(items[i])
-            
-            # Combine results
-            result = {
-                "total_pct": round(overall_pct, 1),
-                "raw_scores": raw_scores,
-                "missed_items": missed_items,
-                "comments": scores.get('overall_comments', '')
+            # Ensure we have scores for each item (use 0 if missing)
+            llm_scores = {
+                section: _fit_scores(scores.get(section, []), len(idxs))
+                for section, idxs in open_items.items()
             }
-            
-            # Add section percentages
-            result.update(section_pcts)
-            
-            return result
+            return summarize_scores(_merge_scores(open_items, llm_scores, prescored), scores.get('overall_comments', ''))
             
         # Fallback to simple scoring if complex format fails
         else:
-            return {
-                "total_pct": 0,
-                "history_pct": 0,
-                "exam_pct": 0,
-                "lab_pct": 0,
-                "management_pct": 0,
-                "interaction_pct": 0,
-                "missed_items": [item for section in CHECKLIST.values() for item in section],
-                "comments": "Evaluation error occurred - could not parse scores"
-            }
+            return _error_result("Evaluation error occurred - could not parse scores")
     except Exception as e:
         print(f"Error in evaluation: {str(e)}")
         # Fallback for any parsing error
-        return {
-            "total_pct": 0,
-            "history_pct": 0,
-            "exam_pct": 0,
-            "lab_pct": 0,
-            "management_pct": 0,
-            "interaction_pct": 0,
-            "missed_items": [item for section in CHECKLIST.values() for item in section],
-            "comments": f"Evaluation error occurred: {str(e)}"
-        }
+        return _error_result(f"Evaluation error occurred: {str(e)}")
 
-def diagnosis_score(student_dx, answer_key):
+def new_checklist_state():
     """
-    Calculate score for the diagnosis accuracy.
-    Returns a percentage score (0, 50, 100) based on how well the student's
-    diagnosis matches the correct diagnosis or differentials.
+    Create an empty running checklist state for incremental scoring.
+    
+    The state holds the best score seen so far for every CHECKLIST item and how
+    much of the transcript (in characters) has already been scored.
     """
-    correct = answer_key["main_diagnosis"]
-    differentials = answer_key.get("differentials", [])
+    return {
+        "scores": {section: [0] * len(items) for section, items in CHECKLIST.items()},
+        "scored_upto": 0,
+        "comments": "",
+        "calls": 0
+    }
+
+def _scores_all(open_items):
+    """cache_if check for a scoring call: the response scores every open section"""
+    return lambda raw: all(_parse_section_scores(raw, section, len(idxs)) is not None
+                           for section, idxs in open_items.items())
+
+def _parse_open_scores(raw, open_items, kind):
+    """Scores of every open section in a model response, or None if any section is unusable"""
+    parsed = {}
+    for section, idxs in open_items.items():
+        section_scores = _parse_section_scores(raw, section, len(idxs))
+        if section_scores is None:
+            print(f"{kind} scoring failed for section: {section}")
+            return None
+        parsed[section] = section_scores
+    return parsed
+
+def update_checklist_state(lang, state, transcript, case=None, prescore=False):
+    """
+    Score only the part of the transcript added since the last update, and only
+    against items that are not yet Well Done. Item scores only ever go up.
+    HOLISTIC_ITEMS are left for finish_checklist_state().
     
-    # Check for main diagnosis match
-    sim = difflib.SequenceMatcher(None, student_dx.lower(), correct.lower()).ratio()
+    With prescore=True single-criterion items the keyword rules detect are
+    scored locally and the other rule matches are sent as hints (see
+    checklist_score).
     
-    if sim > 0.8:
-        # Excellent match with main diagnosis
-        return 100, correct
-    elif sim > 0.6:
-        # Good approximation of main diagnosis
-        return 75, correct
-    else:
-        # Check if it matches any differential diagnosis
-        for diff_dx in differentials:
-            diff_sim = difflib.SequenceMatcher(None, student_dx.lower(), diff_dx.lower()).ratio()
-            if diff_sim > 0.7:
-                return 50, correct  # Partial credit for identifying a differential
-        
-        # No matches
-        return 0, correct
+    Returns:
+        True if the state now covers the whole transcript, False if scoring failed
+        (the unscored text is kept and retried on the next update)
+    """
+    new_text = transcript[state["scored_upto"]:].strip()
+    if not new_text:
+        state["scored_upto"] = len(transcript)
+        return True
+    
+    # Single-criterion items the keyword rules settle locally never reach the model
+    if prescore:
+        for section, item_scores in prescore_checklist(lang, new_text).items():
+            for i, score in item_scores.items():
+                state["scores"][section][i] = max(state["scores"][section][i], score)
+    
+    # Items still unscored or only partially done
+    open_items = {
+        section: [i for i, score in enumerate(state["scores"][section])
+                  if score < 5 and i not in HOLISTIC_ITEMS.get(section, [])]
+        for section in CHECKLIST
+    }
+    open_items = {section: idxs for section, idxs in open_items.items() if idxs}
+    if not open_items:
+        state["scored_upto"] = len(transcript)
+        return True
+    
+    sections = {section: [CHECKLIST[section][i] for i in idxs] for section, idxs in open_items.items()}
+    raw = chat(
+        _scoring_messages(lang, new_text, case, sections, rule_hints(lang, new_text, open_items) if prescore else None),
+        model=route_model("checklist_incremental"), temperature=0.1,
+        max_tokens=_scoring_max_tokens(sum(len(idxs) for idxs in open_items.values())), return_json=True,
+        tag="checklist_incremental", cache_if=_scores_all(open_items)
+    )
+    state["calls"] += 1
+    
+    parsed = _parse_open_scores(raw, open_items, "Incremental")
+    if parsed is None:
+        return False
+    
+    # Keep the best score seen so far for every item
+    for section, idxs in open_items.items():
+        for i, score in zip(idxs, parsed[section]):
+            state["scores"][section][i] = max(state["scores"][section][i], score)
+    if isinstance(raw, dict) and raw.get("overall_comments"):
+        state["comments"] = raw["overall_comments"]
+    state["scored_upto"] = len(transcript)
+    return True
+
+def finish_checklist_state(lang, state, transcript, case=None, prescore=False):
+    """
+    Bring the state up to the end of the transcript, then score HOLISTIC_ITEMS
+    on the whole transcript (replacing, not max-merging, their scores).
+    
+    Returns:
+        True if the state is complete, False if either step failed
+    """
+    if not update_checklist_state(lang, state, transcript, case, prescore):
+        return False
+    
+    sections = {section: [CHECKLIST[section][i] for i in idxs] for section, idxs in HOLISTIC_ITEMS.items()}
+    raw = chat(
+        _scoring_messages(lang, transcript, case, sections,
+                          rule_hints(lang, transcript, HOLISTIC_ITEMS) if prescore else None),
+        model=route_model("checklist_incremental"), temperature=0.1,
+        max_tokens=_scoring_max_tokens(sum(len(idxs) for idxs in HOLISTIC_ITEMS.values())), return_json=True,
+        tag="checklist_incremental", cache_if=_scores_all(HOLISTIC_ITEMS)
+    )
+    state["calls"] += 1
+    
+    parsed = _parse_open_scores(raw, HOLISTIC_ITEMS, "Holistic")
+    if parsed is None:
+        return False
+    for section, idxs in HOLISTIC_ITEMS.items():
+        for i, score in zip(idxs, parsed[section]):
+            state["scores"][section][i] = score
+    return True
+
+# Separate pool for incremental updates, so evaluations waiting on an update
+# can never occupy every worker the update needs
+_incremental_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="incremental-scoring")
+
+def submit_checklist_update(lang, state, transcript, case=None, prescore=False):
+    """Run update_checklist_state() in the background and return its Future"""
+    return _incremental_pool.submit(bind_session(update_checklist_state), lang, state, transcript, case, prescore)
 
-def evaluate(lang, transcript, student_dx, answer_key, case=None):
+def diagnosis_score(student_dx, answer_key):
+    """
+    Calculate score for the diagnosis accuracy.
+    Returns a percentage score (0, 50, 75, 100) based on how well the student's
+    diagnosis matches the correct diagnosis or differentials, counting synonyms
+    and abbreviations ("MI" for "Myocardial infarction") as matches.
+    Use dx_matcher.score_diagnoses() to score many attempts at once.
+    """
+    return score_diagnosis(student_dx, answer_key)
+
+def evaluate(lang, transcript, student_dx, answer_key, case=None, per_section=False, state=None, prescore=False):
     """
     Evaluate the student's performance based on transcript and diagnosis.
     Returns a comprehensive evaluation object.
+    
+    If a running checklist state from incremental scoring is given, only the
+    unscored tail of the transcript and the holistic items are sent to the
+    model (see finish_checklist_state); the full checklist is scored from
+    scratch only if that fails. prescore applies to both paths.
     """
     # Get checklist scores
-    checklist_results = checklist_score(lang, transcript, case)
+    if state is not None and finish_checklist_state(lang, state, transcript, case, prescore):
+        checklist_results = summarize_scores(
+            {section: list(scores) for section, scores in state["scores"].items()},
+            state["comments"]
+        )
+    else:
+        checklist_results = checklist_score(lang, transcript, case, per_section=per_section, prescore=prescore)
     
     # Get diagnosis score
     dx_score, correct_dx = diagnosis_score(student_dx, answer_key)
     
+    return combine_scores(checklist_results, dx_score, correct_dx)
+
+def combine_scores(checklist_results, dx_score, correct_dx):
+    """
+    Combine a checklist result (see summarize_scores) and a diagnosis score into
+    the evaluation object. Needs no model call, so stored attempts can be regraded.
+    """
     # Calculate weighted total score (80% checklist, 20% diagnosis)
     # This weighting aligns with the official marking sheet where diagnosis is important
     # but doesn't override the whole performance
@@ -180,33 +470,56 @@ def evaluate(lang, transcript, student_dx, answer_key, case=None):
         "raw_scores": checklist_results.get("raw_scores", {}),
         "missed_items": checklist_results["missed_items"],
         "correct_dx": correct_dx,
-        "comments": checklist_results.get("comments", "")
+        "comments": checklist_results.get("comments", ""),
+        # Scoring failed: the checklist part is a placeholder, not the student's result
+        "error": checklist_results.get("error", False)
     }
     
     return result
 
+# Background pool so station transitions don't wait on scoring calls
+_evaluation_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="evaluation")
+
+def _evaluate_after(pending_update, *args, **kwargs):
+    """Wait for an in-flight incremental update, then run evaluate()"""
+    if pending_update is not None:
+        try:
+            pending_update.result()
+        except Exception as e:
+            print(f"Incremental scoring update failed: {str(e)}")
+    return evaluate(*args, **kwargs)
+
+def submit_evaluation(*args, pending_update=None, **kwargs):
+    """
+    Run evaluate() with the given arguments on the background evaluation pool.
+    Returns a concurrent.futures.Future whose result is the evaluation object.
+    
+    pending_update is an in-flight submit_checklist_update() future for the same
+    state; the evaluation waits for it so the state is never updated twice at once.
+    """
+    return _evaluation_pool.submit(bind_session(_evaluate_after), pending_update, *args, **kwargs)
+
+# Mark sheet rows, built once: section headings keyed by the slot of the
+# section's first item, the item part of every row, and the score part
+_SECTION_TITLES = {
+    SECTION_OFFSETS[section][0]: "**" + {"lab": "Lab and Radiology",
+                                         "interaction": "Doctor/Patient Interaction (5%)"}.get(section, section.capitalize()) + ":**"
+    for section in CHECKLIST
+}
+_ITEM_ROWS = [f"| {slot + 1}. {item} | " for slot, item in enumerate(ITEMS)]
+_SCORE_TEXT = {0: "0 (ND=0) |", 3: "3 (PD=3) |", 5: "5 (WD=5) |"}
+
 def render_mark_sheet(raw_scores, student_dx, correct_dx, dx_score, total_score, comments):
     """
     Render a formatted mark sheet for the examiner view.
     """
     md = ["### Examiner's Mark Sheet", "| Item | Score |", "|---|---|"]
-    idx = 1
+    scores = raw_scores if isinstance(raw_scores, ChecklistScores) else ChecklistScores.from_raw(raw_scores)
     
-    for section, items in CHECKLIST.items():
-        section_title = section.capitalize()
-        if section == "lab":
-            section_title = "Lab and Radiology"
-        elif section == "interaction":
-            section_title = "Doctor/Patient Interaction (5%)"
-            
-        md.append(f"**{section_title}:**")
-        
-        section_scores = raw_scores.get(section, [0] * len(items))
-        for i, item in enumerate(items):
-            score = section_scores[i] if i < len(section_scores) else 0
-            score_text = "ND=0" if score == 0 else "PD=3" if score == 3 else "WD=5"
-            md.append(f"| {idx}. {item} | {score} ({score_text}) |")
-            idx += 1
+    for slot, score in enumerate(scores.values):
+        if slot in _SECTION_TITLES:
+            md.append(_SECTION_TITLES[slot])
+        md.append(_ITEM_ROWS[slot] + _SCORE_TEXT[score])
     
     # Add diagnosis and total
     md.append("\n**Diagnosis Assessment:**")
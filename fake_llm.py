@@ -0,0 +1,274 @@
+"""
+Deterministic stand-in for the chat-completions API, for offline load tests and benchmarks.
+
+FakeLLM recognises the prompts used across the app (case generation, custom case
+extraction, checklist scoring, hints and patient turns) and returns schema-valid
+responses with configurable latency and error rates. Responses are seeded from the
+request content, so the same request always gets the same answer.
+
+Run this module to serve the same responses over HTTP:
+    python fake_llm.py --port 8765 --latency-ms 300 --error-rate 0.02
+"""
+import argparse, hashlib, json, random, re, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import openai
+
+SECTION_HEADERS = ["HISTORY", "EXAM", "LAB", "MANAGEMENT", "INTERACTION"]
+
+DIAGNOSES = {
+    "chest pain": ("Acute coronary syndrome", ["Pulmonary embolism", "GERD", "Costochondritis"]),
+    "abdominal pain": ("Acute appendicitis", ["Cholecystitis", "Gastroenteritis", "Renal colic"]),
+    "headache": ("Migraine without aura", ["Tension-type headache", "Sinusitis", "Subarachnoid hemorrhage"]),
+    "shortness of breath": ("Community-acquired pneumonia", ["Asthma exacerbation", "Heart failure", "Pulmonary embolism"]),
+    "cough": ("Acute bronchitis", ["Pneumonia", "Asthma", "GERD"]),
+    "fever": ("Urinary tract infection", ["Influenza", "Pneumonia", "Viral syndrome"]),
+    "back pain": ("Mechanical low back pain", ["Lumbar disc herniation", "Pyelonephritis", "Spinal stenosis"])
+}
+
+PATIENT_REPLIES = [
+    "It started about three days ago and it has been getting worse.",
+    "No, I haven't noticed anything like that.",
+    "I take my blood pressure tablets every morning.",
+    "I'm not allergic to anything that I know of.",
+    "My father had a heart attack when he was sixty.",
+    "I smoke about ten cigarettes a day, and I drink on weekends.",
+    "I'm worried it might be something serious, doctor.",
+    "It gets worse when I walk and better when I rest."
+]
+
+HINTS = [
+    "Ask about drug allergies.",
+    "Ask about family history of similar conditions.",
+    "Screen for red flag symptoms.",
+    "Explore the patient's ideas, concerns and expectations.",
+    "Ask about smoking and alcohol use."
+]
+
+def _approx_tokens(text):
+    """Cheap token estimate used for fake usage numbers"""
+    return max(1, len(text) // 4) if text else 0
+
+class FakeLLM:
+    """
+    Fake chat-completions model.
+
+    Args:
+        latency_ms: Mean response latency in milliseconds
+        jitter_ms: Standard deviation of the latency
+        error_rate: Probability that a call fails with an APIError
+        rate_limit_rate: Probability that a call fails with a RateLimitError
+        seed: Extra seed mixed into every response
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, rate_limit_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _rng(self, messages):
+        """Random generator seeded from the request content"""
+        digest = hashlib.sha256(json.dumps([messages, self.seed], sort_keys=True).encode("utf-8")).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def _wait_and_maybe_fail(self):
+        """Simulate network latency and injected failures"""
+        with self._lock:
+            self.calls += 1
+            call_rng = random.Random(hash((self.seed, self.calls)))
+        delay = max(0.0, call_rng.gauss(self.latency_ms, self.jitter_ms)) / 1000.0
+        if delay:
+            time.sleep(delay)
+        roll = call_rng.random()
+        if roll < self.rate_limit_rate:
+            raise openai.error.RateLimitError("Fake rate limit")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise openai.error.APIError("Fake server error")
+
+    def respond(self, messages, model="gpt-3.5-turbo", max_tokens=600):
+        """
+        Produce a response for a chat request.
+
+        Returns:
+            Tuple of (content, usage) where usage has prompt/completion token counts
+        """
+        self._wait_and_maybe_fail()
+        content = self.content_for(messages)
+        usage = {
+            "prompt_tokens": sum(_approx_tokens(m.get("content", "")) for m in messages),
+            "completion_tokens": min(_approx_tokens(content), max_tokens)
+        }
+        return content, usage
+
+    def content_for(self, messages):
+        """Pick a schema-valid response for the kind of prompt in messages"""
+        rng = self._rng(messages)
+        system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        user = messages[-1].get("content", "") if messages else ""
+
+        if "OSCE case generator" in system:
+            return json.dumps(self._case(system, rng))
+        if "OSCE case creator" in system:
+            return json.dumps({"chief_complaint": user.split(":")[-1].strip()[:60] or "Chest pain",
+                               "age": rng.randint(18, 85), "gender": rng.choice(["male", "female"])})
+        if "OSCE examiner" in system:
+            return json.dumps(self._scores(user, rng))
+        if "OSCE tutor" in system:
+            return rng.choice(HINTS)
+        if "mapping each question id" in user:
+            ids = re.findall(r"^- (\w+):", user, re.MULTILINE)
+            return json.dumps({qid: rng.choice(PATIENT_REPLIES) for qid in ids})
+        if "patient" in system.lower():
+            return rng.choice(PATIENT_REPLIES)
+        return "OK"
+
+    def _case(self, system, rng):
+        """Complete case dictionary matching CASE_GENERATION_PROMPT"""
+        match = re.search(r"involves a (\d+)-year-old (\w+) presenting with (.+?)\.", system)
+        age, gender, chief = (int(match.group(1)), match.group(2), match.group(3)) if match else (45, "male", "Chest pain")
+        diagnosis, differentials = DIAGNOSES.get(chief.lower(), ("Viral syndrome", ["Bacterial infection", "Allergic reaction"]))
+        name = rng.choice(["James Wilson", "David Lee", "John Davis"] if gender == "male"
+                          else ["Mary Williams", "Sarah Martin", "Linda Anderson"])
+        return {
+            "patientInfo": {"name": name, "age": age, "gender": gender, "occupation": rng.choice(["Teacher", "Engineer", "Driver"])},
+            "chiefComplaint": chief,
+            "historyDetails": {"onset": f"{rng.randint(1, 7)} days ago", "duration": "Intermittent",
+                               "character": "Moderate", "aggravating": "Exertion", "relieving": "Rest"},
+            "pastMedicalHistory": rng.sample(["Hypertension", "Type 2 diabetes", "Asthma", "None significant"], 2),
+            "familyHistory": ["Father: ischemic heart disease"],
+            "medications": ["Amlodipine 5 mg daily"],
+            "socialHistory": {"smoking": "10 cigarettes/day", "alcohol": "Occasional", "living": "With spouse"},
+            "reviewOfSystems": {"cardiovascular": "No palpitations", "respiratory": "No cough"},
+            "physicalFindings": ["BP 145/90, HR 92", "Mild distress"],
+            "labResults": {"CBC": "Normal", "CRP": f"{rng.randint(1, 80)} mg/L"},
+            "imagingResults": {"Chest X-ray": "No acute findings"},
+            "keyHistoryQuestions": ["Onset and character", "Associated symptoms", "Risk factors"],
+            "keyExamManeuvers": ["Vital signs", "Focused system examination"],
+            "answer_key": {"main_diagnosis": diagnosis, "differentials": differentials,
+                           "management": ["Explain diagnosis", "Start treatment", "Arrange follow-up"]}
+        }
+
+    def _scores(self, prompt, rng):
+        """Checklist scores for every section and item listed in the scoring prompt"""
+        scores = {}
+        current = None
+        for line in prompt.splitlines():
+            header = line.strip().rstrip(":")
+            if header in SECTION_HEADERS:
+                current = header.lower()
+                scores[current] = []
+            elif current and line.startswith("- "):
+                scores[current].append(rng.choice([0, 3, 5]))
+            elif not line.strip():
+                continue
+            else:
+                current = None
+        scores["overall_comments"] = "Reasonable structure; explore risk factors in more depth."
+        return scores
+
+def fake_llm_from_env():
+    """Build a FakeLLM configured by OSCE_FAKE_* environment variables"""
+    import os
+    return FakeLLM(
+        latency_ms=float(os.getenv("OSCE_FAKE_LATENCY_MS", "0")),
+        jitter_ms=float(os.getenv("OSCE_FAKE_JITTER_MS", "0")),
+        error_rate=float(os.getenv("OSCE_FAKE_ERROR_RATE", "0")),
+        rate_limit_rate=float(os.getenv("OSCE_FAKE_RATE_LIMIT_RATE", "0")),
+        seed=int(os.getenv("OSCE_FAKE_SEED", "0"))
+    )
+
+### ------------------ Local HTTP stand-in server ------------------ ###
+
+def _make_handler(fake):
+    """Request handler class bound to a FakeLLM instance"""
+
+    class ChatCompletionsHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            model = body.get("model", "gpt-3.5-turbo")
+            try:
+                content, usage = fake.respond(body.get("messages", []), model, body.get("max_tokens", 600))
+            except openai.error.RateLimitError as e:
+                self._send_json(429, {"error": {"message": str(e), "type": "rate_limit_error"}})
+                return
+            except Exception as e:
+                self._send_json(500, {"error": {"message": str(e), "type": "server_error"}})
+                return
+
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            if body.get("stream"):
+                self._send_stream(completion_id, model, content)
+                return
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_stream(self, completion_id, model, content):
+            """Send the content as server-sent events, a few characters per chunk"""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+            for i, piece in enumerate(pieces):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece},
+                                 "finish_reason": "stop" if i == len(pieces) - 1 else None}]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def log_message(self, format, *args):
+            # Keep benchmark output clean
+            pass
+
+    return ChatCompletionsHandler
+
+def serve(fake, host="127.0.0.1", port=8765):
+    """Create (but do not start) an HTTP server speaking the chat-completions protocol"""
+    return ThreadingHTTPServer((host, port), _make_handler(fake))
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeLLM(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate, args.seed)
+    server = serve(fake, args.host, args.port)
+    print(f"Fake LLM server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,196 @@
-from openai_utils import chat
+import hashlib, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from openai_utils import chat, route_model
 from checklist import CHECKLIST
+from evaluator import HOLISTIC_ITEMS
 from prompt_templates import HINT_GENERATION_PROMPT
+from persona import case_hash
+from llm_metrics import bind_session
 
-def generate_hint(lang, transcript):
+# Order in which unaddressed checklist items are suggested by local hints
+HINT_ORDER = [
+    ("history", 1), ("history", 2), ("history", 3), ("history", 4), ("history", 9),
+    ("history", 7), ("history", 10), ("history", 11), ("history", 8), ("history", 14),
+    ("history", 5), ("history", 6), ("history", 12), ("history", 13), ("history", 15),
+    ("history", 16), ("exam", 0), ("exam", 1), ("exam", 2), ("exam", 3), ("exam", 4), ("exam", 5)
+]
+
+# Hint text per checklist item
+HINT_TEXT = {
+    "en": {
+        ("history", 1): "Clarify the details of the chief complaint: onset, duration, character and severity.",
+        ("history", 2): "Ask about associated symptoms of the presenting system.",
+        ("history", 3): "Rule out emergency red flags.",
+        ("history", 4): "Ask about B symptoms: fever, night sweats and weight loss.",
+        ("history", 5): "Do a brief review of systems.",
+        ("history", 6): "Take an obstetric and gynecological history.",
+        ("history", 7): "Ask about past medical history, admissions and similar episodes.",
+        ("history", 8): "Ask about past surgical history.",
+        ("history", 9): "Ask about medications and drug allergies.",
+        ("history", 10): "Ask about family history.",
+        ("history", 11): "Take a social history: smoking, alcohol, occupation and living situation.",
+        ("history", 12): "Take a neonatal history.",
+        ("history", 13): "Ask about developmental milestones.",
+        ("history", 14): "Explore the patient's ideas, concerns and expectations.",
+        ("history", 15): "Screen for depression with the PHQ-2 questions.",
+        ("history", 16): "Ask about vaccinations and preventive health.",
+        ("exam", 0): "Ask for permission, wash your hands and maintain privacy before examining.",
+        ("exam", 1): "Measure the vital signs.",
+        ("exam", 2): "Comment on the patient's general appearance.",
+        ("exam", 3): "Examine the main system involved in the chief complaint.",
+        ("exam", 4): "Examine the related systems.",
+        ("exam", 5): "Look for specific signs that confirm your suspected diagnosis."
+    },
+    "ar": {
+        ("history", 1): "وضّح تفاصيل الشكوى الرئيسية: البداية والمدة والطبيعة والشدة.",
+        ("history", 2): "اسأل عن الأعراض المصاحبة للجهاز المعني.",
+        ("history", 3): "استبعد العلامات الحمراء الطارئة.",
+        ("history", 4): "اسأل عن الحمى والتعرق الليلي وفقدان الوزن.",
+        ("history", 5): "قم بمراجعة سريعة لأجهزة الجسم.",
+        ("history", 6): "خذ التاريخ التوليدي والنسائي.",
+        ("history", 7): "اسأل عن التاريخ المرضي السابق ودخول المستشفى والنوبات المشابهة.",
+        ("history", 8): "اسأل عن العمليات الجراحية السابقة.",
+        ("history", 9): "اسأل عن الأدوية والحساسية الدوائية.",
+        ("history", 10): "اسأل عن التاريخ العائلي.",
+        ("history", 11): "خذ التاريخ الاجتماعي: التدخين والكحول والعمل والسكن.",
+        ("history", 12): "خذ تاريخ حديثي الولادة.",
+        ("history", 13): "اسأل عن مراحل النمو.",
+        ("history", 14): "استكشف أفكار المريض ومخاوفه وتوقعاته.",
+        ("history", 15): "تحرّ عن الاكتئاب بأسئلة PHQ-2.",
+        ("history", 16): "اسأل عن التطعيمات والفحوصات الوقائية.",
+        ("exam", 0): "استأذن واغسل يديك وحافظ على الخصوصية قبل الفحص.",
+        ("exam", 1): "قس العلامات الحيوية.",
+        ("exam", 2): "صف المظهر العام للمريض.",
+        ("exam", 3): "افحص الجهاز الرئيسي المتعلق بالشكوى.",
+        ("exam", 4): "افحص الأجهزة ذات الصلة.",
+        ("exam", 5): "ابحث عن العلامات التي تؤكد التشخيص المتوقع."
+    }
+}
+
+# Hints kept in memory, keyed by station, language and transcript
+HINT_CACHE_SIZE = 512
+
+# A model hint is prefetched at most once per this many seconds per station
+HINT_PREFETCH_INTERVAL_S = 30
+
+def _item_applies(section, idx, case):
+    """False for items that don't fit the patient (obstetric history for men, pediatric items for adults)"""
+    patient_info = (case or {}).get("patientInfo", {})
+    if (section, idx) == ("history", 6):
+        return str(patient_info.get("gender", "")).lower() not in ["male", "ذكر"]
+    if (section, idx) in [("history", 12), ("history", 13)]:
+        try:
+            return int(patient_info.get("age")) < 18
+        except (TypeError, ValueError):
+            return False
+    return True
+
+def _snapshot(state):
     """
-    Generate a helpful hint for the student based on their transcript and the OSCE checklist.
-    Returns a relevant hint for an important aspect they may have missed in their examination.
+    Copy of the parts of a running checklist state a hint reads, so it isn't read
+    while the incremental-update thread writes it
     """
+    if not state:
+        return None
+    # Read first: an update writes the scores before advancing scored_upto
+    scored_upto = state.get("scored_upto", 0)
+    return {"scored_upto": scored_upto, "scores": {section: list(scores) for section, scores in state["scores"].items()}}
+
+def local_hint(lang, transcript, state, case=None):
+    """
+    Hint derived from a running checklist state (see evaluator.new_checklist_state)
+    without calling the model.
+
+    Returns:
+        The hint for the first unaddressed item in HINT_ORDER, or None if the state
+        doesn't cover the whole transcript yet or every item has been addressed
+    """
+    state = _snapshot(state)
+    if not state or state["scored_upto"] < len(transcript):
+        return None
+    texts = HINT_TEXT.get(lang, HINT_TEXT["en"])
+    for section, idx in HINT_ORDER:
+        # Holistic items are only scored once the station ends
+        if idx in HOLISTIC_ITEMS.get(section, []):
+            continue
+        if state["scores"][section][idx] == 0 and _item_applies(section, idx, case):
+            return texts[(section, idx)]
+    return None
+
+def _llm_hint(lang, transcript):
+    """Ask the model for a hint"""
     system = {"role": "system", "content": HINT_GENERATION_PROMPT.format(lang=lang)}
     user = {"role": "user", "content": transcript}
-    
-    # Using GPT-4o for medical education hints - moderate temperature for balanced suggestions
-    return chat([system, user], model="gpt-4o", temperature=0.3) 
\ No newline at end of file
+
+    # GPT-4o unless routing degrades to a faster model - moderate temperature for balanced suggestions
+    return chat([system, user], model=route_model("hint"), temperature=0.3, tag="hint")
+
+_hint_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hint")
+_hints = OrderedDict()   # (station, lang, transcript hash) -> future of the hint
+_hints_lock = threading.Lock()
+_last_prefetch = {}      # station -> time of its last model hint prefetch
+
+def _hint_key(lang, transcript, case):
+    station = case_hash(case) if case else ""
+    return (station, lang, hashlib.sha256(transcript.encode("utf-8")).hexdigest())
+
+def _submit_hint(lang, transcript, case=None, state=None):
+    """Future of the hint for this transcript, computed in the background unless cached or in flight"""
+    key = _hint_key(lang, transcript, case)
+    with _hints_lock:
+        future = _hints.get(key)
+        if future is None or (future.done() and future.exception() is not None):
+            future = _hint_pool.submit(bind_session(_compute_hint), lang, transcript, case, _snapshot(state))
+            _hints[key] = future
+        _hints.move_to_end(key)
+        while len(_hints) > HINT_CACHE_SIZE:
+            _hints.popitem(last=False)
+    return future
+
+def prefetch_hint(lang, transcript, case=None, state=None, likely=True):
+    """
+    Start computing the hint for this transcript in the background, when it
+    would need the model and the student is likely to ask for it.
+
+    Nothing is prefetched if a local hint is available (generate_hint answers
+    those at once), if likely is False (e.g. the student hasn't used a hint at
+    this station yet), or if this station had a model hint prefetched in the
+    last HINT_PREFETCH_INTERVAL_S seconds.
+
+    Returns:
+        concurrent.futures.Future whose result is the hint, or None
+    """
+    if not likely or local_hint(lang, transcript, state, case):
+        return None
+    station = case_hash(case) if case else ""
+    now = time.monotonic()
+    with _hints_lock:
+        if now - _last_prefetch.get(station, float("-inf")) < HINT_PREFETCH_INTERVAL_S:
+            return None
+        _last_prefetch[station] = now
+        while len(_last_prefetch) > HINT_CACHE_SIZE:
+            _last_prefetch.pop(next(iter(_last_prefetch)))
+    return _submit_hint(lang, transcript, case, state)
+
+def _compute_hint(lang, transcript, case, state):
+    return local_hint(lang, transcript, state, case) or _llm_hint(lang, transcript)
+
+def generate_hint(lang, transcript, case=None, state=None):
+    """
+    Generate a helpful hint for the student based on their transcript and the OSCE checklist.
+    Returns a relevant hint for an important aspect they may have missed in their examination.
+
+    With a running checklist state the hint is picked locally when possible;
+    otherwise the model is asked. Hints are cached per station and transcript,
+    so a hint precomputed with prefetch_hint() is returned at once.
+    """
+    hint = local_hint(lang, transcript, state, case)
+    if hint:
+        return hint
+    hint = _submit_hint(lang, transcript, case, state).result()
+    if isinstance(hint, str) and hint.startswith("Error:"):
+        # Don't keep a failed hint; the next click asks again
+        with _hints_lock:
+            _hints.pop(_hint_key(lang, transcript, case), None)
+    return hint
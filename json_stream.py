@@ -0,0 +1,127 @@
+"""
+Incremental parser for a JSON object that arrives in pieces (e.g. a streamed completion).
+
+The parser tracks nesting and string state character by character and reports
+each top-level member as soon as its value is complete, so callers can use the
+first keys of a large object while the rest is still being generated. It also
+notices output that can no longer become a valid object (so the stream can be
+abandoned early) and keeps the completed members of a truncated object.
+"""
+import json
+
+# Give up if this many characters arrive before the opening brace
+MAX_PREAMBLE_CHARS = 2000
+
+class IncrementalJSONObjectParser:
+    """
+    Feed text with feed(); read completed members from .members.
+
+    Attributes:
+        members: Dict of top-level keys whose values are complete
+        complete: True once the closing brace of the object was seen
+        failed: Reason string if the text can't be a JSON object any more
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.members = {}
+        self.complete = False
+        self.failed = None
+        self._pos = 0            # next character to scan
+        self._start = None       # index of the opening brace
+        self._member_start = None
+        self._depth = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def truncated(self):
+        """True if an object was started but never closed"""
+        return self._start is not None and not self.complete
+
+    def _try_member(self, end):
+        """Try to parse buffer[member_start:end] as one "key": value member"""
+        text = self.buffer[self._member_start:end].strip()
+        if not text:
+            return None
+        try:
+            member = json.loads("{" + text + "}")
+        except json.JSONDecodeError:
+            return None
+        new = [(key, value) for key, value in member.items() if key not in self.members]
+        self.members.update(member)
+        return new
+
+    def feed(self, text):
+        """
+        Add more text.
+
+        Returns:
+            List of (key, value) pairs for top-level members completed by this text
+        """
+        completed = []
+        if self.complete or self.failed:
+            return completed
+        self.buffer += text
+
+        while self._pos < len(self.buffer):
+            i = self._pos
+            ch = self.buffer[i]
+            self._pos += 1
+
+            if self._start is None:
+                if ch == "{":
+                    self._start = i
+                    self._depth = 1
+                    self._stack = ["{"]
+                    self._member_start = i + 1
+                elif i >= MAX_PREAMBLE_CHARS:
+                    self.failed = "no JSON object in output"
+                    return completed
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    # A string value at depth 1 may have just completed a member
+                    if self._depth == 1:
+                        completed.extend(self._try_member(self._pos) or [])
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._stack.append(ch)
+                self._depth += 1
+            elif ch in "}]":
+                opener = "{" if ch == "}" else "["
+                if not self._stack or self._stack[-1] != opener:
+                    self.failed = f"unexpected '{ch}' at offset {i - self._start}"
+                    return completed
+                self._stack.pop()
+                self._depth -= 1
+                if self._depth == 1:
+                    # An object/array value just closed
+                    completed.extend(self._try_member(self._pos) or [])
+                elif self._depth == 0:
+                    completed.extend(self._try_member(i) or [])
+                    self.complete = True
+                    return completed
+            elif ch == "," and self._depth == 1:
+                completed.extend(self._try_member(i) or [])
+                self._member_start = i + 1
+        return completed
+
+    def result(self):
+        """The parsed object if complete, otherwise the members completed so far"""
+        if self.complete:
+            try:
+                return json.loads(self.buffer[self._start:self._pos])
+            except json.JSONDecodeError:
+                pass
+        return dict(self.members)
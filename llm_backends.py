@@ -0,0 +1,121 @@
+"""
+LLM backends behind openai_utils.chat / chat_stream / achat.
+
+Every backend exposes the same three methods:
+- complete(messages, model, temperature, max_tokens) -> (content, usage)
+- stream(messages, model, temperature, max_tokens) -> iterator of text pieces
+- acomplete(messages, model, temperature, max_tokens) -> awaitable (content, usage)
+
+The backend is chosen with OSCE_LLM_BACKEND:
+- "openai" (default): the real OpenAI API
+- "fake": in-process FakeLLM (see fake_llm.py), no network at all
+- "http": a local chat-completions server such as `python fake_llm.py`,
+  reached at OSCE_LLM_BASE_URL (default http://127.0.0.1:8765/v1)
+"""
+import asyncio, os
+import openai
+from fake_llm import fake_llm_from_env
+
+def _usage_dict(response):
+    """Token usage from an API response, or None if the server did not report it"""
+    usage = response.get("usage") if hasattr(response, "get") else None
+    if not usage:
+        return None
+    return {
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0)
+    }
+
+class OpenAIBackend:
+    """OpenAI chat-completions API (or any server speaking the same protocol)"""
+
+    # acomplete() goes through openai.aiosession, so it benefits from a pooled HTTP session
+    uses_aiosession = True
+
+    def __init__(self, api_base=None, api_key=None):
+        self.api_base = api_base
+        self.api_key = api_key
+
+    @property
+    def requires_api_key(self):
+        # Only the real API needs the user's key; local servers accept anything
+        return self.api_key is None
+
+    def _request_args(self):
+        args = {}
+        if self.api_base:
+            args["api_base"] = self.api_base
+        if self.api_key:
+            args["api_key"] = self.api_key
+        return args
+
+    def complete(self, messages, model, temperature, max_tokens):
+        # Use the old-style API for compatibility with openai==0.28.1
+        response = openai.ChatCompletion.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **self._request_args()
+        )
+        return response.choices[0].message.content, _usage_dict(response)
+
+    def stream(self, messages, model, temperature, max_tokens):
+        response = openai.ChatCompletion.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **self._request_args()
+        )
+        for chunk in response:
+            choices = chunk.get("choices") or [{}]
+            piece = choices[0].get("delta", {}).get("content")
+            if piece:
+                yield piece
+
+    async def acomplete(self, messages, model, temperature, max_tokens):
+        response = await openai.ChatCompletion.acreate(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **self._request_args()
+        )
+        return response.choices[0].message.content, _usage_dict(response)
+
+class FakeBackend:
+    """In-process fake model with configurable latency and error rates"""
+
+    requires_api_key = False
+    uses_aiosession = False
+
+    def __init__(self, fake=None):
+        self.fake = fake or fake_llm_from_env()
+
+    def complete(self, messages, model, temperature, max_tokens):
+        return self.fake.respond(messages, model, max_tokens)
+
+    def stream(self, messages, model, temperature, max_tokens):
+        content, _ = self.fake.respond(messages, model, max_tokens)
+        for i, word in enumerate(content.split(" ")):
+            yield word if i == 0 else " " + word
+
+    async def acomplete(self, messages, model, temperature, max_tokens):
+        # FakeLLM sleeps to simulate latency, so keep it off the event loop
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.fake.respond, messages, model, max_tokens
+        )
+
+def backend_from_env():
+    """Build the backend selected by OSCE_LLM_BACKEND"""
+    kind = os.getenv("OSCE_LLM_BACKEND", "openai").strip().lower()
+    if kind == "fake":
+        return FakeBackend()
+    if kind == "http":
+        return OpenAIBackend(
+            api_base=os.getenv("OSCE_LLM_BASE_URL", "http://127.0.0.1:8765/v1"),
+            api_key=os.getenv("OSCE_LLM_LOCAL_KEY", "sk-local")
+        )
+    return OpenAIBackend()
@@ -0,0 +1,169 @@
+"""
+Content-addressed response cache for LLM chat calls.
+
+Responses are keyed by a stable hash of (model, messages, temperature, max_tokens).
+Two backends are provided: an in-memory LRU bounded by entry count and bytes,
+and a SQLite-backed disk store with a time-to-live. Both expose the same
+get/set/stats interface, so any object with those methods can be plugged in.
+"""
+import hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+
+def cache_key(model, messages, temperature, max_tokens):
+    """Stable SHA-256 hash of everything that determines a chat response"""
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": [{"role": m.get("role"), "content": m.get("content")} for m in messages],
+            "temperature": round(float(temperature), 4),
+            "max_tokens": max_tokens
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class _CacheStats:
+    """Hit, miss and byte counters shared by the cache backends"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    def _record(self, value):
+        """Count a lookup result (None is a miss)"""
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.bytes_read += len(value.encode("utf-8"))
+
+    def stats(self):
+        """Counters as a plain dict"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written
+        }
+
+class MemoryCache(_CacheStats):
+    """In-memory LRU cache bounded by number of entries and total bytes"""
+
+    def __init__(self, max_entries=512, max_bytes=16 * 1024 * 1024):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return the cached text for key, or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            self._record(value)
+            return value
+
+    def set(self, key, value):
+        """Store text for key, evicting least recently used entries as needed"""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size_bytes -= len(old.encode("utf-8"))
+            self._entries[key] = value
+            self.size_bytes += size
+            self.bytes_written += size
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted.encode("utf-8"))
+
+    def stats(self):
+        result = super().stats()
+        result.update({"entries": len(self._entries), "size_bytes": self.size_bytes})
+        return result
+
+class DiskCache(_CacheStats):
+    """SQLite-backed cache whose entries expire after ttl seconds"""
+
+    def __init__(self, path=os.path.join("data", "llm_cache.sqlite3"), ttl=7 * 24 * 3600):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+
+    def get(self, key):
+        """Return the cached text for key, or None if missing or expired"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            value = None
+            if row is not None:
+                if time.time() - row[1] <= self.ttl:
+                    value = row[0]
+                else:
+                    with self._conn:
+                        self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._record(value)
+            return value
+
+    def set(self, key, value):
+        """Store text for key with the current time as its creation time"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                (key, value, time.time())
+            )
+            self.bytes_written += len(value.encode("utf-8"))
+
+    def purge_expired(self):
+        """Delete every expired entry and return how many were removed"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)
+            )
+            return cursor.rowcount
+
+    def stats(self):
+        result = super().stats()
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(value AS BLOB))), 0) FROM responses"
+            ).fetchone()
+        result.update({"entries": entries, "size_bytes": size})
+        return result
+
+def cache_from_env():
+    """
+    Build the cache selected by the OSCE_LLM_CACHE environment variable.
+
+    Accepted values are "memory", "disk" or empty (no cache).
+    """
+    kind = os.getenv("OSCE_LLM_CACHE", "").strip().lower()
+    if kind == "memory":
+        return MemoryCache(max_entries=int(os.getenv("OSCE_LLM_CACHE_ENTRIES", "512")))
+    if kind == "disk":
+        return DiskCache(
+            path=os.getenv("OSCE_LLM_CACHE_PATH", os.path.join("data", "llm_cache.sqlite3")),
+            ttl=int(os.getenv("OSCE_LLM_CACHE_TTL", str(7 * 24 * 3600)))
+        )
+    return None
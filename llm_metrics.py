@@ -0,0 +1,284 @@
+"""
+Per-call instrumentation for LLM requests.
+
+openai_utils records one dict per chat()/achat()/chat_stream() call:
+
+    {"ts", "session", "tag", "model", "stream", "prompt_tokens", "completion_tokens",
+     "latency_ms", "ttft_ms", "retries", "cache", "error", "cost_usd"}
+
+- tag: the feature that made the call (case_generation, patient_turn, hint, ...)
+- cache: "hit", "miss", or "off" when the call did not use the response cache
+- error: exception class name, or None
+
+Every record goes to the installed sinks (an in-memory ring buffer and a
+Prometheus-style aggregate by default, plus a JSONL file when
+OSCE_LLM_METRICS_PATH is set) and into a per-session cost/latency summary.
+"""
+import bisect, contextvars, functools, json, os, threading, time
+from collections import OrderedDict, deque
+
+# Approximate list prices in USD per 1M tokens: (prompt, completion)
+MODEL_PRICES = {
+    "gpt-4o": (5.00, 15.00),
+    "gpt-3.5-turbo": (0.50, 1.50)
+}
+
+# Latency histogram buckets of the Prometheus sink, in seconds
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60]
+
+# Session summaries kept in memory (oldest dropped first)
+MAX_SESSIONS = 1000
+
+_session = contextvars.ContextVar("llm_session", default=None)
+
+def set_session(session_id):
+    """Attribute the LLM calls made from the current context to a session"""
+    _session.set(session_id)
+
+def current_session():
+    """Session id of the current context, or None"""
+    return _session.get()
+
+def bind_session(fn):
+    """
+    Wrap fn so it runs in the caller's current session.
+    Use when handing work to a thread pool, which does not inherit the context.
+    """
+    session_id = _session.get()
+
+    @functools.wraps(fn)
+    def bound(*args, **kwargs):
+        token = _session.set(session_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _session.reset(token)
+    return bound
+
+def call_cost(model, prompt_tokens, completion_tokens):
+    """Approximate cost of a call in USD (0 for unknown models)"""
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+### ------------------ Sinks ------------------ ###
+
+class RingBufferSink:
+    """Keeps the most recent records in memory"""
+
+    def __init__(self, size=1000):
+        self._records = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self._records.append(record)
+
+    def records(self, n=None):
+        """The last n records (all kept records if n is None), oldest first"""
+        with self._lock:
+            records = list(self._records)
+        return records[-n:] if n else records
+
+class JsonlSink:
+    """Appends every record as one JSON line to a file"""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class PrometheusSink:
+    """Aggregates records into counters and a latency histogram in Prometheus text format"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self._calls = {}       # (tag, model, cache, error) -> count
+        self._tokens = {}      # (tag, model, kind) -> count
+        self._retries = {}     # (tag, model) -> count
+        self._cost = {}        # (tag, model) -> USD
+        self._latency = {}     # (tag, model) -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        key = (record["tag"], record["model"])
+        with self._lock:
+            call_key = key + (record["cache"], record["error"] or "")
+            self._calls[call_key] = self._calls.get(call_key, 0) + 1
+            for kind in ("prompt", "completion"):
+                token_key = key + (kind,)
+                self._tokens[token_key] = self._tokens.get(token_key, 0) + record[f"{kind}_tokens"]
+            self._retries[key] = self._retries.get(key, 0) + record["retries"]
+            self._cost[key] = self._cost.get(key, 0.0) + record["cost_usd"]
+
+            hist = self._latency.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            seconds = record["latency_ms"] / 1000
+            hist[bisect.bisect_left(self.buckets, seconds)] += 1
+            hist[-1] += seconds
+
+    @staticmethod
+    def _labels(**labels):
+        return "{" + ",".join(f'{k}="{str(v)}"' for k, v in labels.items()) + "}"
+
+    def render(self):
+        """Current values in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append("# TYPE osce_llm_calls_total counter")
+            for (tag, model, cache, error), count in sorted(self._calls.items()):
+                lines.append(f"osce_llm_calls_total{self._labels(tag=tag, model=model, cache=cache, error=error)} {count}")
+            lines.append("# TYPE osce_llm_tokens_total counter")
+            for (tag, model, kind), count in sorted(self._tokens.items()):
+                lines.append(f"osce_llm_tokens_total{self._labels(tag=tag, model=model, kind=kind)} {count}")
+            lines.append("# TYPE osce_llm_retries_total counter")
+            for (tag, model), count in sorted(self._retries.items()):
+                lines.append(f"osce_llm_retries_total{self._labels(tag=tag, model=model)} {count}")
+            lines.append("# TYPE osce_llm_cost_usd_total counter")
+            for (tag, model), cost in sorted(self._cost.items()):
+                lines.append(f"osce_llm_cost_usd_total{self._labels(tag=tag, model=model)} {cost:.6f}")
+            lines.append("# TYPE osce_llm_latency_seconds histogram")
+            for (tag, model), hist in sorted(self._latency.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ["+Inf"], hist[:-1]):
+                    cumulative += count
+                    lines.append(f"osce_llm_latency_seconds_bucket{self._labels(tag=tag, model=model, le=bound)} {cumulative}")
+                lines.append(f"osce_llm_latency_seconds_sum{self._labels(tag=tag, model=model)} {hist[-1]:.6f}")
+                lines.append(f"osce_llm_latency_seconds_count{self._labels(tag=tag, model=model)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+recent_calls = RingBufferSink()
+prometheus = PrometheusSink()
+_sinks = [recent_calls, prometheus]
+if os.getenv("OSCE_LLM_METRICS_PATH"):
+    _sinks.append(JsonlSink(os.getenv("OSCE_LLM_METRICS_PATH")))
+_sinks_lock = threading.Lock()
+
+def add_sink(sink):
+    """Send every future record to sink (any object with an emit(record) method)"""
+    with _sinks_lock:
+        _sinks.append(sink)
+
+def remove_sink(sink):
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+### ------------------ Recording and session summaries ------------------ ###
+
+_sessions = OrderedDict()   # session id -> {tag -> totals}
+_sessions_lock = threading.Lock()
+
+def record_call(tag, model, prompt_tokens, completion_tokens, latency_ms, retries=0,
+                cache="off", error=None, stream=False, ttft_ms=None):
+    """Build the record of one LLM call and hand it to every sink"""
+    record = {
+        "ts": round(time.time(), 3),
+        "session": _session.get(),
+        "tag": tag,
+        "model": model,
+        "stream": stream,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "latency_ms": round(latency_ms, 1),
+        "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+        "retries": retries,
+        "cache": cache,
+        "error": error,
+        "cost_usd": round(call_cost(model, prompt_tokens, completion_tokens), 6)
+    }
+
+    with _sinks_lock:
+        sinks = list(_sinks)
+    for sink in sinks:
+        try:
+            sink.emit(record)
+        except Exception as e:
+            print(f"Error in LLM metrics sink {type(sink).__name__}: {str(e)}")
+
+    if record["session"] is not None:
+        with _sessions_lock:
+            tags = _sessions.setdefault(record["session"], {})
+            _sessions.move_to_end(record["session"])
+            while len(_sessions) > MAX_SESSIONS:
+                _sessions.popitem(last=False)
+            totals = tags.setdefault(tag, {"calls": 0, "errors": 0, "retries": 0, "cache_hits": 0,
+                                           "prompt_tokens": 0, "completion_tokens": 0,
+                                           "cost_usd": 0.0, "latencies_ms": []})
+            totals["calls"] += 1
+            totals["errors"] += error is not None
+            totals["retries"] += retries
+            totals["cache_hits"] += cache == "hit"
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["cost_usd"] += record["cost_usd"]
+            bisect.insort(totals["latencies_ms"], record["latency_ms"])
+    return record
+
+def session_summary(session_id=None):
+    """
+    Cost and latency of a session's LLM calls, per tag and in total.
+
+    Returns:
+        Dict of tag -> {calls, errors, retries, cache_hits, prompt_tokens,
+        completion_tokens, cost_usd, p50_ms, p95_ms, total_ms}, with a "total" entry
+    """
+    session_id = session_id if session_id is not None else _session.get()
+    with _sessions_lock:
+        tags = {tag: dict(totals, latencies_ms=list(totals["latencies_ms"]))
+                for tag, totals in _sessions.get(session_id, {}).items()}
+
+    summary = {}
+    all_latencies = []
+    for tag, totals in tags.items():
+        latencies = totals.pop("latencies_ms")
+        all_latencies.extend(latencies)
+        summary[tag] = dict(totals, **_latency_summary(latencies))
+    if summary:
+        total = {key: sum(entry[key] for entry in summary.values())
+                 for key in ("calls", "errors", "retries", "cache_hits", "prompt_tokens",
+                             "completion_tokens", "cost_usd")}
+        summary["total"] = dict(total, **_latency_summary(sorted(all_latencies)))
+    for entry in summary.values():
+        entry["cost_usd"] = round(entry["cost_usd"], 6)
+    return summary
+
+def _latency_summary(sorted_latencies):
+    if not sorted_latencies:
+        return {"p50_ms": None, "p95_ms": None, "total_ms": 0.0}
+    def pct(p):
+        return sorted_latencies[min(len(sorted_latencies) - 1, int(len(sorted_latencies) * p / 100))]
+    return {"p50_ms": pct(50), "p95_ms": pct(95), "total_ms": round(sum(sorted_latencies), 1)}
+
+def serve_metrics(port=9108, host="127.0.0.1"):
+    """Serve prometheus.render() at /metrics from a background thread; returns the server"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
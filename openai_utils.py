@@ -1,93 +1,538 @@
-import os, json, backoff
+import os, json, asyncio, atexit, threading, time, weakref, backoff
+from collections import deque
 import openai
 from dotenv import load_dotenv
+from llm_cache import cache_key, cache_from_env
+from llm_backends import backend_from_env
+from persona import persona_prompt
+import llm_metrics
 
 load_dotenv()
 # Set the OpenAI API key directly on the openai module (old style)
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-@backoff.on_exception(backoff.expo, openai.error.RateLimitError, max_tries=5, max_time=60)
-def chat(messages, model="gpt-3.5-turbo", temperature=0.2, max_tokens=600, return_json=False):
+# Backend that actually serves completions (see llm_backends.py)
+_backend = backend_from_env()
+
+def get_backend():
+    """The LLM backend currently used by chat(), chat_stream() and achat()"""
+    return _backend
+
+def set_backend(backend):
+    """Install the LLM backend used by chat(), chat_stream() and achat()"""
+    global _backend
+    _backend = backend
+
+def requires_api_key():
+    """True if the active backend talks to the real OpenAI API and needs a key"""
+    return _backend.requires_api_key
+
+def _missing_api_key():
+    """True if the active backend needs an OpenAI API key and none is configured"""
+    return _backend.requires_api_key and not openai.api_key
+
+# Optional response cache (see llm_cache.py); disabled unless OSCE_LLM_CACHE is set
+_cache = cache_from_env()
+
+# Calls above this temperature are only cached when the caller forces use_cache=True
+CACHE_MAX_TEMPERATURE = 0.2
+
+def set_cache(cache):
+    """Install a response cache backend for chat(), or None to disable caching"""
+    global _cache
+    _cache = cache
+
+def cache_stats():
+    """Hit/miss/byte counters of the active response cache, or None if disabled"""
+    return _cache.stats() if _cache is not None else None
+
+def _cache_key_for(model, messages, temperature, max_tokens, use_cache):
+    """Cache key for a call, or None if the call should not use the cache"""
+    if _cache is None:
+        return None
+    if use_cache is None:
+        use_cache = temperature <= CACHE_MAX_TEMPERATURE
+    return cache_key(model, messages, temperature, max_tokens) if use_cache else None
+
+def _parse_result(result, return_json):
+    """Apply the return_json contract shared by chat() and achat()"""
+    if return_json:
+        try:
+            # Try to parse as JSON
+            return json.loads(result)
+        except json.JSONDecodeError:
+            # If not valid JSON, return the raw response
+            return result
+    return result
+
+def _cacheable(result, parsed, return_json, cache_if):
+    """
+    Whether a fresh response may be cached: it must be non-empty, parse as a
+    JSON value other than an error object when return_json is set, and pass the
+    caller's cache_if check (called with what chat() returns)
+    """
+    if not result:
+        return False
+    if return_json and (isinstance(parsed, str) or (isinstance(parsed, dict) and "error" in parsed)):
+        return False
+    return cache_if is None or bool(cache_if(parsed))
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """
+    Count the tokens in a piece of text.
+    Uses tiktoken when it is installed, otherwise a ~4 characters per token estimate.
+    """
+    if not text:
+        return 0
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return len(encoding.encode(text))
+    except ImportError:
+        return max(1, len(text) // 4)
+
+### ------------------ Model routing ------------------ ###
+
+# Candidate models per task in order of preference, and the task's latency SLO
+# for the full reply; ttft_slo_ms is the SLO for streamed calls of the task,
+# which are judged on the time to the first piece. Streamed and non-streamed
+# calls are tracked in separate windows, so the two latencies never mix.
+MODEL_ROUTES = {
+    "case_generation": {"models": ["gpt-3.5-turbo"], "slo_ms": 30000, "ttft_slo_ms": 5000},
+    "case_repair": {"models": ["gpt-3.5-turbo"], "slo_ms": 15000},
+    "custom_case_params": {"models": ["gpt-3.5-turbo"], "slo_ms": 10000},
+    "patient_turn": {"models": ["gpt-4o", "gpt-3.5-turbo"], "slo_ms": 6000, "ttft_slo_ms": 3000},
+    "patient_prefetch": {"models": ["gpt-4o", "gpt-3.5-turbo"], "slo_ms": 20000},
+    "hint": {"models": ["gpt-4o", "gpt-3.5-turbo"], "slo_ms": 6000},
+    "checklist_scoring": {"models": ["gpt-4o"], "slo_ms": 60000},
+    "checklist_section": {"models": ["gpt-4o"], "slo_ms": 20000},
+    "checklist_incremental": {"models": ["gpt-4o"], "slo_ms": 20000}
+}
+
+# Model for tasks without a route
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+# Routing looks at the last ROUTING_WINDOW calls of a task/model pair within
+# ROUTING_WINDOW_S seconds; older observations expire, so a degraded primary
+# model gets traffic again once its samples have aged out
+ROUTING_WINDOW = 50
+ROUTING_WINDOW_S = 300
+ROUTING_MIN_SAMPLES = 8
+ROUTING_TAIL_PERCENTILE = 95
+ROUTING_MAX_ERROR_RATE = 0.2
+
+_route_stats = {}            # (task, model, streamed) -> deque of (time, latency ms, failed)
+_route_current = {}          # (task, streamed) -> model chosen last
+_route_log = deque(maxlen=1000)
+_route_lock = threading.Lock()
+_route_log_file = llm_metrics.JsonlSink(os.getenv("OSCE_LLM_ROUTING_LOG")) if os.getenv("OSCE_LLM_ROUTING_LOG") else None
+
+def _observe_route(task, model, latency_ms, failed, stream=False):
+    """Feed one finished call into the routing statistics (time to first piece for a streamed call)"""
+    if task not in MODEL_ROUTES:
+        return
+    with _route_lock:
+        _route_stats.setdefault((task, model, stream), deque(maxlen=ROUTING_WINDOW)).append(
+            (time.monotonic(), latency_ms, failed)
+        )
+
+def _route_window(task, model, stream=False):
+    """(tail latency ms, error rate, samples) of a task/model pair's streamed or non-streamed calls"""
+    cutoff = time.monotonic() - ROUTING_WINDOW_S
+    with _route_lock:
+        samples = [s for s in _route_stats.get((task, model, stream), ()) if s[0] >= cutoff]
+    if not samples:
+        return None, 0.0, 0
+    latencies = sorted(latency for _, latency, failed in samples if not failed)
+    error_rate = sum(failed for _, _, failed in samples) / len(samples)
+    tail = latencies[min(len(latencies) - 1, len(latencies) * ROUTING_TAIL_PERCENTILE // 100)] if latencies else None
+    return tail, error_rate, len(samples)
+
+def route_model(task, stream=False):
+    """
+    Pick the model for a task from MODEL_ROUTES.
+    
+    The first candidate is used unless its recent tail latency exceeds the task's
+    SLO or its error rate exceeds ROUTING_MAX_ERROR_RATE; then the next candidate
+    that is within budget (or has too few samples to judge) is used. If none
+    is, the candidate with the lowest tail latency wins.
+    With stream=True only the task's streamed calls are looked at, against
+    ttft_slo_ms (slo_ms if the route has none).
+    Every decision is kept in routing_log() and written to OSCE_LLM_ROUTING_LOG.
+    """
+    route = MODEL_ROUTES.get(task)
+    if route is None:
+        return DEFAULT_MODEL
+    slo_ms = route.get("ttft_slo_ms", route["slo_ms"]) if stream else route["slo_ms"]
+    
+    chosen = None
+    skipped = []
+    observed = {}
+    for model in route["models"]:
+        tail, error_rate, samples = _route_window(task, model, stream)
+        observed[model] = {"tail_ms": tail, "error_rate": round(error_rate, 3), "samples": samples}
+        if samples >= ROUTING_MIN_SAMPLES and error_rate > ROUTING_MAX_ERROR_RATE:
+            skipped.append(f"{model} error rate {error_rate:.0%}")
+        elif samples >= ROUTING_MIN_SAMPLES and tail is not None and tail > slo_ms:
+            skipped.append(f"{model} p{ROUTING_TAIL_PERCENTILE} {tail:.0f}ms > SLO {slo_ms}ms")
+        else:
+            chosen = model
+            break
+    if chosen is None:
+        chosen = min(route["models"], key=lambda m: observed[m]["tail_ms"] or float("inf"))
+        skipped.append("all candidates over budget")
+    reason = "; ".join(skipped) or "primary within budget"
+    
+    decision = {
+        "ts": round(time.time(), 3), "task": task, "model": chosen, "reason": reason,
+        "stream": stream, "primary": route["models"][0], "slo_ms": slo_ms, "observed": observed
+    }
+    with _route_lock:
+        previous = _route_current.get((task, stream))
+        _route_current[(task, stream)] = chosen
+        _route_log.append(decision)
+    if previous is not None and previous != chosen:
+        print(f"Routing {task} from {previous} to {chosen} ({reason})")
+    if _route_log_file is not None:
+        try:
+            _route_log_file.emit(decision)
+        except Exception as e:
+            print(f"Error writing routing log: {str(e)}")
+    return chosen
+
+def routing_log(n=None):
+    """The last n routing decisions (all kept ones if n is None), oldest first"""
+    with _route_lock:
+        decisions = list(_route_log)
+    return decisions[-n:] if n else decisions
+
+# Errors worth retrying with exponential backoff
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.Timeout,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError
+)
+
+def _count_retry(details):
+    """backoff handler: count retries in the stats dict of the call"""
+    details["kwargs"]["stats"]["retries"] += 1
+
+def _usage_or_estimate(messages, result, usage, model):
+    """Token usage reported by the backend, or an estimate from the text"""
+    if usage:
+        return usage["prompt_tokens"], usage["completion_tokens"]
+    prompt_tokens = sum(count_tokens(m.get("content", ""), model) for m in messages)
+    return prompt_tokens, count_tokens(result if isinstance(result, str) else "", model)
+
+def _record(tag, model, messages, result, usage, start, stats, cache_status, error, stream=False, first_piece=None):
+    """Record one call with llm_metrics"""
+    if cache_status == "hit" or (result is None and usage is None):
+        # Nothing was billed: served from the cache, or the request never succeeded
+        prompt_tokens = completion_tokens = 0
+    else:
+        prompt_tokens, completion_tokens = _usage_or_estimate(messages, result, usage, model)
+    now = time.perf_counter()
+    if cache_status != "hit":
+        # Streamed replies are judged on how soon the first piece arrives
+        latency = first_piece if stream and first_piece is not None else now
+        _observe_route(tag, model, (latency - start) * 1000, error is not None, stream)
+    llm_metrics.record_call(
+        tag, model, prompt_tokens, completion_tokens, (now - start) * 1000,
+        retries=stats["retries"], cache=cache_status, error=error, stream=stream,
+        ttft_ms=(first_piece - start) * 1000 if first_piece is not None else None
+    )
+
+@backoff.on_exception(backoff.expo, RETRYABLE_ERRORS, max_tries=5, max_time=60, on_backoff=_count_retry)
+def _complete(messages, model, temperature, max_tokens, stats):
+    return _backend.complete(messages, model, temperature, max_tokens)
+
+def chat(messages, model="gpt-3.5-turbo", temperature=0.2, max_tokens=600, return_json=False, use_cache=None, tag="chat",
+         cache_if=None):
     """
     Send a request to the OpenAI API and return the response.
-    Uses exponential backoff for rate limit and other errors.
+    Uses exponential backoff for rate limit and other transient errors.
+    
+    When a response cache is installed, low-temperature calls are served from it.
+    Pass use_cache=False to bypass the cache or use_cache=True to force it.
+    A fresh response is only cached if it is usable (see _cacheable): pass
+    cache_if, a check on the returned value, so a response the caller would
+    reject is asked for again on the next call instead of replayed.
+    
+    tag names the feature making the call in the llm_metrics records.
     """
-    if not openai.api_key:
+    if _missing_api_key():
         return "Error: OpenAI API key not found"
-        
+    
+    key = _cache_key_for(model, messages, temperature, max_tokens, use_cache)
+    stats = {"retries": 0}
+    start = time.perf_counter()
+    cache_status = "miss" if key else "off"
+    result = usage = error = None
+    
     try:
-        # Use the old-style API for compatibility with openai==0.28.1
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
-        result = response.choices[0].message.content
+        result = _cache.get(key) if key else None
+        if result is not None:
+            cache_status = "hit"
+        else:
+            result, usage = _complete(messages, model, temperature, max_tokens, stats=stats)
+            parsed = _parse_result(result, return_json)
+            if key and _cacheable(result, parsed, return_json, cache_if):
+                _cache.set(key, result)
+            return parsed
         
-        if return_json:
-            try:
-                # Try to parse as JSON
-                return json.loads(result)
-            except json.JSONDecodeError:
-                # If not valid JSON, return the raw response
-                return result
-        return result
+        return _parse_result(result, return_json)
     except Exception as e:
+        error = type(e).__name__
         print(f"Error in chat function: {str(e)}")
         if return_json:
             return {}
         return f"Error: {str(e)}"
+    finally:
+        _record(tag, model, messages, result, usage, start, stats, cache_status, error)
 
-def patient_simulation(patient_case, user_message, chat_history, model="gpt-3.5-turbo"):
+def chat_stream(messages, model="gpt-3.5-turbo", temperature=0.2, max_tokens=600, tag="chat"):
     """
-    Simulate a patient response based on the case details and chat history.
+    Send a streaming request to the OpenAI API and yield the response text piece by piece.
+    Errors are yielded as a single "Error: ..." piece, mirroring chat().
     """
-    # Extract relevant patient details
-    patient_info = patient_case.get("patientInfo", {})
-    name = patient_info.get("name", "Patient")
-    age = patient_info.get("age", "Unknown")
-    gender = patient_info.get("gender", "Unknown")
-    chief = patient_case.get("chiefComplaint", "Unknown complaint")
-    
-    # Construct the system prompt
-    system_prompt = {
-        "role": "system", 
-        "content": (
-            f"You are simulating a patient named {name}, {age} years old, {gender}, "
-            f"who has come to the doctor with: {chief}. "
-            "Respond as the patient would based on the medical case details provided. "
-            "Be natural, realistic, and consistent with the case details. "
-            "The user is a medical student practicing for their OSCE exam. "
-            "Do not volunteer all information at once - make the student ask appropriate questions. "
-            "Correct information is important but the student must elicit it through proper questioning."
-        )
-    }
+    if _missing_api_key():
+        yield "Error: OpenAI API key not found"
+        return
     
-    # Add case details to help guide the AI
-    context = {
-        "role": "system",
-        "content": (
-            "Case details (not to be directly revealed unless asked):\n" +
-            f"- History: {patient_case.get('historyDetails', {})}\n" +
-            f"- Past medical history: {patient_case.get('pastMedicalHistory', [])}\n" +
-            f"- Medications: {patient_case.get('medications', [])}\n" +
-            f"- Social history: {patient_case.get('socialHistory', {})}\n" +
-            f"- Review of systems: {patient_case.get('reviewOfSystems', {})}\n" +
-            f"- Physical findings: {patient_case.get('physicalFindings', [])}"
-        )
-    }
+    start = time.perf_counter()
+    first_piece = None
+    pieces = []
+    error = None
+    try:
+        for piece in _backend.stream(messages, model, temperature, max_tokens):
+            if first_piece is None:
+                first_piece = time.perf_counter()
+            pieces.append(piece)
+            yield piece
+    except Exception as e:
+        error = type(e).__name__
+        print(f"Error in chat_stream function: {str(e)}")
+        yield f"Error: {str(e)}"
+    finally:
+        # Also runs when the caller stops reading early
+        _record(tag, model, messages, "".join(pieces) if first_piece is not None else None, None,
+                start, {"retries": 0}, "off", error, stream=True, first_piece=first_piece)
+
+### ------------------ Async client ------------------ ###
+
+# Maximum number of requests in flight at once on an event loop
+MAX_CONCURRENT_REQUESTS = int(os.getenv("OSCE_LLM_MAX_CONCURRENCY", "16"))
+
+# Per-model rate limits: requests per minute and tokens per minute
+MODEL_RATE_LIMITS = {
+    "gpt-4o": {"rpm": 500, "tpm": 30000},
+    "gpt-3.5-turbo": {"rpm": 3500, "tpm": 90000},
+    "default": {"rpm": 500, "tpm": 30000}
+}
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at rate_per_minute.
+    reserve() takes tokens immediately and returns how long the caller must wait.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Take amount tokens and return the seconds to wait before using them"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def _model_buckets(model):
+    """Request and token buckets for a model, created on first use"""
+    with _buckets_lock:
+        if model not in _buckets:
+            limits = MODEL_RATE_LIMITS.get(model, MODEL_RATE_LIMITS["default"])
+            _buckets[model] = (TokenBucket(limits["rpm"]), TokenBucket(limits["tpm"]))
+        return _buckets[model]
+
+# Pooled HTTP session and concurrency semaphore for each running event loop
+_loop_resources = weakref.WeakKeyDictionary()
+
+def _get_loop_resources():
+    """
+    Semaphore for the running loop, plus a shared aiohttp session (keep-alive
+    connection pool) created on first use by a backend that sends HTTP requests
+    """
+    loop = asyncio.get_running_loop()
+    resources = _loop_resources.get(loop)
+    if resources is None:
+        resources = {"session": None, "semaphore": asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)}
+        _loop_resources[loop] = resources
+    if resources["session"] is None and getattr(_backend, "uses_aiosession", False):
+        import aiohttp  # installed with openai
+        connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS, keepalive_timeout=30)
+        resources["session"] = aiohttp.ClientSession(connector=connector)
+    return resources
+
+async def aclose_session():
+    """Close the pooled HTTP session of the running event loop"""
+    resources = _loop_resources.pop(asyncio.get_running_loop(), None)
+    if resources is not None and resources["session"] is not None:
+        await resources["session"].close()
+
+@backoff.on_exception(backoff.expo, RETRYABLE_ERRORS, max_tries=5, max_time=60, on_backoff=_count_retry)
+async def _acomplete(messages, model, temperature, max_tokens, stats):
+    resources = _get_loop_resources()
     
-    # Format the chat history
-    messages = [system_prompt, context]
+    # Wait for both the request and the token budget of this model
+    request_bucket, token_bucket = _model_buckets(model)
+    estimate = sum(count_tokens(m.get("content", ""), model) for m in messages) + max_tokens
+    wait = max(request_bucket.reserve(1), token_bucket.reserve(estimate))
+    if wait > 0:
+        await asyncio.sleep(wait)
     
-    # Add chat history
-    for msg in chat_history:
-        if msg["role"] in ["user", "assistant"]:
-            messages.append(msg)
+    async with resources["semaphore"]:
+        if resources["session"] is None:
+            return await _backend.acomplete(messages, model, temperature, max_tokens)
+        session_token = openai.aiosession.set(resources["session"])
+        try:
+            return await _backend.acomplete(messages, model, temperature, max_tokens)
+        finally:
+            openai.aiosession.reset(session_token)
+
+async def achat(messages, model="gpt-3.5-turbo", temperature=0.2, max_tokens=600, return_json=False, use_cache=None, tag="chat",
+                cache_if=None):
+    """
+    Asyncio-native version of chat() with the same arguments and return contract.
+    Requests share a pooled keep-alive HTTP session, a concurrency semaphore and
+    per-model request/token rate-limit buckets.
+    """
+    if _missing_api_key():
+        return "Error: OpenAI API key not found"
+    
+    key = _cache_key_for(model, messages, temperature, max_tokens, use_cache)
+    stats = {"retries": 0}
+    start = time.perf_counter()
+    cache_status = "miss" if key else "off"
+    result = usage = error = None
+    
+    try:
+        result = _cache.get(key) if key else None
+        if result is not None:
+            cache_status = "hit"
+        else:
+            result, usage = await _acomplete(messages, model, temperature, max_tokens, stats=stats)
+            parsed = _parse_result(result, return_json)
+            if key and _cacheable(result, parsed, return_json, cache_if):
+                _cache.set(key, result)
+            return parsed
+        
+        return _parse_result(result, return_json)
+    except Exception as e:
+        error = type(e).__name__
+        print(f"Error in achat function: {str(e)}")
+        if return_json:
+            return {}
+        return f"Error: {str(e)}"
+    finally:
+        _record(tag, model, messages, result, usage, start, stats, cache_status, error)
+
+# One background event loop shared by every synchronous caller, so the
+# semaphore and connection pool are global across Streamlit sessions
+_shared_loop = None
+_shared_loop_lock = threading.Lock()
+
+def _get_shared_loop():
+    """Start (once) and return the shared background event loop"""
+    global _shared_loop
+    with _shared_loop_lock:
+        if _shared_loop is None:
+            _shared_loop = asyncio.new_event_loop()
+            threading.Thread(target=_shared_loop.run_forever, daemon=True).start()
+        return _shared_loop
+
+def _close_shared_session():
+    """Close the shared loop's pooled HTTP session at interpreter exit"""
+    loop = _shared_loop
+    if loop is None or not loop.is_running():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(aclose_session(), loop).result(timeout=5)
+    except Exception as e:
+        print(f"Error closing HTTP session: {str(e)}")
+
+atexit.register(_close_shared_session)
+
+def run_async(coro):
+    """
+    Run a coroutine on the shared background loop and block until it finishes.
+    LLM calls it makes are attributed to the caller's llm_metrics session.
+    """
+    session_id = llm_metrics.current_session()
+    
+    async def _in_session():
+        llm_metrics.set_session(session_id)
+        return await coro
+    return asyncio.run_coroutine_threadsafe(_in_session(), _get_shared_loop()).result()
+
+def chat_many(requests):
+    """
+    Run several chat requests concurrently through achat().
+    
+    Args:
+        requests: List of dicts of achat() keyword arguments (messages, model, ...)
+    
+    Returns:
+        List of results in the same order as requests
+    """
+    async def _gather():
+        return await asyncio.gather(*(achat(**request) for request in requests))
+    return run_async(_gather())
+
+def _patient_messages(patient_case, user_message, chat_history, model):
+    """
+    Build the message list sent to the model for one simulated patient turn.
+    """
+    # One compiled persona prompt per case, identical on every turn so the
+    # provider's prompt cache can reuse it
+    messages = [{"role": "system", "content": persona_prompt(patient_case)}]
+    
+    # Add chat history, trimmed to the model's token budget (older turns are summarized)
+    from patient_context import build_patient_context  # imported here to avoid a circular import
+    messages.extend(build_patient_context(chat_history, model))
     
     # Add the current user message
     messages.append({"role": "user", "content": user_message})
+    return messages
+
+def patient_simulation(patient_case, user_message, chat_history, model=None):
+    """
+    Simulate a patient response based on the case details and chat history.
+    The model is chosen by route_model("patient_turn") unless one is given.
+    """
+    model = model or route_model("patient_turn")
+    messages = _patient_messages(patient_case, user_message, chat_history, model)
     
     # Get response using the main chat function
-    return chat(messages, model=model, temperature=0.4) 
\ No newline at end of file
+    return chat(messages, model=model, temperature=0.4, tag="patient_turn")
+
+def patient_simulation_stream(patient_case, user_message, chat_history, model=None):
+    """
+    Streaming variant of patient_simulation: yields the reply piece by piece.
+    """
+    model = model or route_model("patient_turn", stream=True)
+    messages = _patient_messages(patient_case, user_message, chat_history, model)
+    yield from chat_stream(messages, model=model, temperature=0.4, tag="patient_turn")
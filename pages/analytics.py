@@ -0,0 +1,76 @@
+import streamlit as st, time
+from datetime import datetime
+from analytics import Cohort, PASS_MARK
+from checklist_scores import SECTIONS
+
+# Setup page config
+st.set_page_config("OSCE Analytics", layout="wide", page_icon="📈")
+
+@st.cache_resource
+def get_cohort():
+    """Shared cohort view of the attempt store; each render only loads new evaluations"""
+    return Cohort()
+
+render_start = time.perf_counter()
+cohort = get_cohort()
+new_evaluations = cohort.refresh()
+
+st.title("📈 Cohort Analytics")
+
+overview = cohort.overview()
+if not overview["attempts"]:
+    st.info("No evaluated attempts yet. Results appear here once students finish stations.")
+    st.stop()
+
+# Headline numbers
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Evaluated attempts", f"{overview['attempts']:,}")
+col2.metric("Mean overall score", f"{overview['mean_overall_pct']:.1f}%")
+col3.metric(f"Pass rate (≥{PASS_MARK}%)", f"{overview['pass_rate_pct']:.1f}%")
+col4.metric("Mean diagnosis score", f"{overview['mean_diagnosis_pct']:.1f}%")
+
+st.subheader("Section averages")
+st.bar_chart({"section": SECTIONS, "mean %": [overview[f"{section}_pct"] for section in SECTIONS]},
+             x="section", y="mean %")
+
+by_specialty, by_chief, items, students = st.tabs(
+    ["By specialty", "By chief complaint", "Item difficulty", "Student trends"]
+)
+
+with by_specialty:
+    rows = cohort.group_table("specialty")
+    st.bar_chart({"specialty": [r["specialty"] or "Custom / uploaded" for r in rows],
+                  "pass rate %": [r["pass_rate_pct"] for r in rows]}, x="specialty", y="pass rate %")
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+with by_chief:
+    min_attempts = st.number_input("Minimum attempts", 1, 10000, 5)
+    rows = [r for r in cohort.group_table("chief") if r["attempts"] >= min_attempts]
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+with items:
+    group = st.selectbox("Cohort", ["All attempts"] + [f"Specialty: {label}" for label in
+                                                       sorted(r["specialty"] for r in cohort.group_table("specialty"))])
+    if group == "All attempts":
+        rows = cohort.item_difficulty()
+    else:
+        rows = cohort.item_difficulty("specialty", group[len("Specialty: "):])
+    st.caption("Facility is the mean item score as a percentage of Well Done; the hardest items come first.")
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+with students:
+    student_rows = [r for r in cohort.group_table("student") if r["student"]]
+    if not student_rows:
+        st.info("No attempts with a student ID yet.")
+    else:
+        student = st.selectbox("Student", [r["student"] for r in student_rows])
+        trend = cohort.student_trend(student)
+        for row in trend:
+            row["started_at"] = datetime.fromtimestamp(row["started_at"]).strftime("%Y-%m-%d %H:%M")
+        st.line_chart({"attempt": list(range(1, len(trend) + 1)),
+                       "overall %": [r["overall_pct"] for r in trend],
+                       "moving average %": [r["moving_avg_pct"] for r in trend]},
+                      x="attempt", y=["overall %", "moving average %"])
+        st.dataframe(trend, use_container_width=True, hide_index=True)
+
+st.caption(f"Rendered in {time.perf_counter() - render_start:.2f}s ({new_evaluations} new evaluations loaded)")
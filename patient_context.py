@@ -0,0 +1,145 @@
+"""
+Token-budgeted rolling context for simulated patient turns.
+
+The chat history sent with each patient turn is capped at a per-model token
+budget. The most recent messages are kept verbatim; older exchanges are folded
+into one compact system message listing what the patient has already revealed.
+The first exchanges (chief complaint, onset) always stay in that summary.
+"""
+import os, threading
+from openai_utils import count_tokens
+
+# Token budget for the chat history of a patient turn, per model
+CONTEXT_BUDGETS = {
+    "gpt-4o": 1200,
+    "gpt-3.5-turbo": 800,
+    "default": 800
+}
+
+# Always keep at least this many of the latest messages verbatim
+MIN_RECENT_MESSAGES = 4
+
+# Share of the budget reserved for the summary once older turns are folded
+SUMMARY_SHARE = 0.25
+
+# Older turns are folded in blocks of this many messages, so the summary and the
+# start of the verbatim window stay the same for several turns (prompt-cache friendly)
+FOLD_BLOCK_MESSAGES = 6
+
+# Folded exchanges at the start of the consultation that always stay in the summary;
+# an over-budget summary drops lines from just after them instead
+SUMMARY_PINNED_LINES = 2
+
+# Longest question and answer snippets kept in the summary, in words
+SUMMARY_QUESTION_WORDS = 12
+SUMMARY_ANSWER_WORDS = 30
+
+_stats = {"turns": 0, "history_tokens": 0, "sent_tokens": 0, "folded_messages": 0}
+_stats_lock = threading.Lock()
+
+def context_budget(model):
+    """History token budget for a model (OSCE_CONTEXT_BUDGET overrides the table)"""
+    override = os.getenv("OSCE_CONTEXT_BUDGET")
+    if override:
+        return int(override)
+    return CONTEXT_BUDGETS.get(model, CONTEXT_BUDGETS["default"])
+
+def _shorten(text, n_words):
+    """First n_words of text, with an ellipsis if it was cut"""
+    words = text.split()
+    return " ".join(words[:n_words]) + (" ..." if len(words) > n_words else "")
+
+def _summary_lines(messages):
+    """One line per folded exchange: the student's question and the patient's answer"""
+    lines = []
+    question = None
+    for msg in messages:
+        if msg["role"] == "user":
+            question = _shorten(msg["content"], SUMMARY_QUESTION_WORDS)
+        elif msg["role"] == "assistant":
+            answer = _shorten(msg["content"], SUMMARY_ANSWER_WORDS)
+            if question:
+                lines.append(f"- Asked: {question} | You said: {answer}")
+            else:
+                lines.append(f"- You said: {answer}")
+            question = None
+    if question:
+        lines.append(f"- Asked: {question}")
+    return lines
+
+def build_patient_context(chat_history, model, budget=None):
+    """
+    Fit the chat history into the model's token budget.
+
+    Args:
+        chat_history: List of {"role", "content"} messages (user/assistant only)
+        model: Model name used to pick the budget and tokenizer
+        budget: Optional explicit token budget
+
+    Returns:
+        List of messages to send: an optional summary system message followed by
+        the most recent messages verbatim
+    """
+    budget = budget or context_budget(model)
+    history = [m for m in chat_history if m["role"] in ["user", "assistant"]]
+    sizes = [count_tokens(m["content"], model) for m in history]
+    history_tokens = sum(sizes)
+
+    # Everything fits: send the history unchanged
+    if history_tokens <= budget:
+        keep_from = 0
+        used = history_tokens
+    else:
+        # Walk back from the newest message while the recent-turns share of the budget allows
+        recent_budget = int(budget * (1 - SUMMARY_SHARE))
+        keep_from = len(history)
+        used = 0
+        while keep_from > 0:
+            size = sizes[keep_from - 1]
+            if used + size > recent_budget and len(history) - keep_from >= MIN_RECENT_MESSAGES:
+                break
+            used += size
+            keep_from -= 1
+
+        # Round the fold point up to a block boundary while enough recent messages remain
+        aligned = -(-keep_from // FOLD_BLOCK_MESSAGES) * FOLD_BLOCK_MESSAGES
+        if keep_from and len(history) - aligned >= MIN_RECENT_MESSAGES:
+            used -= sum(sizes[keep_from:aligned])
+            keep_from = aligned
+
+    messages = []
+    if keep_from > 0:
+        # Fold the older turns into a compact summary. If it is over budget, lines are
+        # dropped from the middle: the opening exchanges and the latest folded ones stay
+        lines = _summary_lines(history[:keep_from])
+        summary_budget = max(budget - used, int(budget * SUMMARY_SHARE) // 2)
+        header = "Earlier in this consultation (stay consistent with it):\n"
+        pinned = max(0, min(SUMMARY_PINNED_LINES, len(lines) - 1))
+        dropped = False
+        def summary_text():
+            shown = lines[:pinned] + ["- ..."] + lines[pinned:] if dropped else lines
+            return header + "\n".join(shown)
+        while len(lines) > pinned + 1 and count_tokens(summary_text(), model) > summary_budget:
+            lines.pop(pinned)
+            dropped = True
+        summary = {"role": "system", "content": summary_text()}
+        messages.append(summary)
+        used += count_tokens(summary["content"], model)
+    messages.extend(history[keep_from:])
+
+    with _stats_lock:
+        _stats["turns"] += 1
+        _stats["history_tokens"] += history_tokens
+        _stats["sent_tokens"] += used
+        _stats["folded_messages"] += keep_from
+    return messages
+
+def context_stats():
+    """Totals of history tokens before and after budgeting across all turns"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["saved_tokens"] = max(0, stats["history_tokens"] - stats["sent_tokens"])
+    stats["saved_pct"] = (
+        round(100 * stats["saved_tokens"] / stats["history_tokens"], 1) if stats["history_tokens"] else 0.0
+    )
+    return stats
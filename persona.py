@@ -0,0 +1,60 @@
+"""
+Compiled patient persona prompts.
+
+A case is turned into a single compact system prompt the first time it is
+simulated. The prompt is cached on the case under "_persona" together with a
+hash of the case content, so every later turn reuses the exact same text.
+Keeping that first message byte-identical lets the provider's prompt caching
+reuse the prefix across turns.
+"""
+import hashlib, json
+from prompt_templates import PATIENT_SIMULATION_PROMPT
+
+# Case keys that are added during an exam and don't describe the patient
+_NON_CASE_KEYS = {"result", "transcript", "student_dx", "generated_timestamp"}
+
+def case_hash(case):
+    """Stable hash of the clinical content of a case (runtime and result keys excluded)"""
+    content = {k: v for k, v in case.items() if not k.startswith("_") and k not in _NON_CASE_KEYS}
+    payload = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def _compact(value):
+    """Render a case value as short plain text instead of a Python repr"""
+    if isinstance(value, dict):
+        parts = [f"{k}: {_compact(v)}" for k, v in value.items() if v not in (None, "", [], {})]
+        return "; ".join(parts) or "none"
+    if isinstance(value, (list, tuple)):
+        parts = [_compact(v) for v in value if v not in (None, "", [], {})]
+        return ", ".join(parts) or "none"
+    return str(value) if value not in (None, "") else "none"
+
+def compile_persona(case):
+    """Build the patient system prompt for a case"""
+    patient_info = case.get("patientInfo", {})
+    return PATIENT_SIMULATION_PROMPT.format(
+        name=patient_info.get("name", "Patient"),
+        age=patient_info.get("age", "Unknown"),
+        gender=patient_info.get("gender", "Unknown"),
+        occupation=patient_info.get("occupation", "Unknown"),
+        chief_complaint=case.get("chiefComplaint", "Unknown complaint"),
+        history_details=_compact(case.get("historyDetails", {})),
+        past_medical_history=_compact(case.get("pastMedicalHistory", [])),
+        family_history=_compact(case.get("familyHistory", [])),
+        medications=_compact(case.get("medications", [])),
+        social_history=_compact(case.get("socialHistory", {})),
+        review_of_systems=_compact(case.get("reviewOfSystems", {})),
+        physical_findings=_compact(case.get("physicalFindings", []))
+    )
+
+def persona_prompt(case):
+    """
+    Cached patient system prompt for a case.
+    Compiled on first use and recompiled only if the case content changes.
+    """
+    digest = case_hash(case)
+    cached = case.get("_persona")
+    if not cached or cached.get("hash") != digest:
+        cached = {"hash": digest, "prompt": compile_persona(case)}
+        case["_persona"] = cached
+    return cached["prompt"]
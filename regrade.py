@@ -0,0 +1,183 @@
+"""
+Offline regrading of stored attempts.
+
+After a change to CHECKLIST, the diagnosis matcher or the weighting in
+evaluator.combine_scores, past results can be recomputed from the stored item
+scores without calling the model: each attempt's raw_scores are fitted to the
+current checklist and re-summarized, and its diagnosis is rescored.
+
+Attempts are read from a JSONL file, one object per line:
+
+    {"id": "...", "case": {"answer_key": {...}, ...}, "transcript": "...",
+     "student_dx": "...", "raw_scores": {"history": [5, 0, ...], ...},
+     "overall_pct": 72.4}
+
+(overall_pct, the previous total, is optional and only used to report changes),
+or from the evaluated attempts of a SQLite attempt store (attempt_store.py).
+Attempts are streamed in chunks to a process pool, so memory stays flat on
+archives of any size.
+
+Usage:
+    python regrade.py attempts.jsonl [--output regraded.jsonl] [--workers 4] [--chunk-size 2000]
+    python regrade.py data/attempts.sqlite3 --output regraded.jsonl
+"""
+import argparse, json, os, sqlite3, time
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+
+# Successfully evaluated attempts of a SQLite attempt store (see attempt_store.py),
+# in the column order _parse_row expects
+SQLITE_QUERY = (
+    "SELECT a.id, c.case_json, a.student_dx, e.raw_scores, e.overall_pct "
+    "FROM attempts a JOIN cases c ON c.id = a.case_id JOIN evaluations e ON e.attempt_id = a.id "
+    "WHERE e.status = 'ok' ORDER BY a.rowid"
+)
+
+SQLITE_EXTENSIONS = (".sqlite3", ".sqlite", ".db")
+
+# Attempts per chunk handed to a worker
+DEFAULT_CHUNK_SIZE = 2000
+
+def _parse_line(line):
+    """(id, case, student_dx, raw_scores, previous overall_pct) from a JSONL line"""
+    record = json.loads(line)
+    raw_scores = record.get("raw_scores") or record.get("result", {}).get("raw_scores")
+    previous = record.get("overall_pct", record.get("result", {}).get("overall_pct"))
+    return record.get("id"), record["case"], record.get("student_dx", ""), raw_scores, previous
+
+def _parse_row(row):
+    """(id, case, student_dx, raw_scores, previous overall_pct) from a SQLITE_QUERY row"""
+    attempt_id, case_json, student_dx, raw_scores, previous = row
+    return attempt_id, json.loads(case_json), student_dx or "", json.loads(raw_scores or "null"), previous
+
+def regrade_chunk(items, sqlite_rows=False):
+    """
+    Regrade a chunk of raw JSONL lines (or SQLITE_QUERY rows).
+
+    Returns:
+        List of {"id", "result", "previous_overall_pct"} dicts, or {"id", "error"}
+        for attempts that can't be regraded, in input order
+    """
+    from evaluator import summarize_scores, combine_scores
+    from checklist_scores import ChecklistScores
+    from dx_matcher import score_diagnoses
+
+    parsed, output = [], []
+    for item in items:
+        attempt_id = item[0] if sqlite_rows else None
+        try:
+            attempt_id, case, student_dx, raw_scores, previous = _parse_row(item) if sqlite_rows else _parse_line(item)
+            if not isinstance(raw_scores, dict):
+                raise ValueError("no raw_scores")
+            scores = ChecklistScores.from_raw(raw_scores, strict=True)
+            parsed.append((attempt_id, case["answer_key"], student_dx, scores, previous))
+            output.append(None)
+        except (ValueError, KeyError, TypeError) as e:
+            output.append({"id": attempt_id, "error": f"{type(e).__name__}: {str(e)}"})
+
+    dx_scores = iter(score_diagnoses([(student_dx, answer_key) for _, answer_key, student_dx, _, _ in parsed]))
+    attempts = iter(parsed)
+    for i, entry in enumerate(output):
+        if entry is not None:
+            continue
+        attempt_id, _, _, scores, previous = next(attempts)
+        dx_score, correct_dx = next(dx_scores)
+        output[i] = {
+            "id": attempt_id,
+            "result": combine_scores(summarize_scores(scores), dx_score, correct_dx),
+            "previous_overall_pct": previous
+        }
+    return output
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def read_attempts(path):
+    """
+    Stream raw attempts from a JSONL file or SQLite store.
+
+    Returns:
+        Tuple of (iterator of raw items, whether they are SQLite rows)
+    """
+    if path.endswith(SQLITE_EXTENSIONS):
+        def rows():
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                yield from conn.execute(SQLITE_QUERY)
+            finally:
+                conn.close()
+        return rows(), True
+
+    def lines():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield line
+    return lines(), False
+
+def regrade(path, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Regrade every attempt in a store on a process pool.
+    At most two chunks per worker are in flight, and results come back in input order.
+
+    Yields:
+        One output dict per attempt (see regrade_chunk)
+    """
+    items, sqlite_rows = read_attempts(path)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in _chunks(items, chunk_size):
+            pending.append(pool.submit(regrade_chunk, chunk, sqlite_rows))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute stored OSCE results without calling the model")
+    parser.add_argument("input", help="JSONL file or SQLite store (.sqlite3/.sqlite/.db) of attempts")
+    parser.add_argument("--output", help="Write one JSON line per regraded attempt to this file")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Attempts per worker task")
+    args = parser.parse_args()
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else None
+    start = time.perf_counter()
+    attempts = errors = compared = changed = 0
+    delta_sum = 0.0
+    try:
+        for entry in regrade(args.input, workers=args.workers, chunk_size=args.chunk_size):
+            attempts += 1
+            if "error" in entry:
+                errors += 1
+            elif entry["previous_overall_pct"] is not None:
+                delta = entry["result"]["overall_pct"] - entry["previous_overall_pct"]
+                compared += 1
+                changed += abs(delta) >= 0.05
+                delta_sum += delta
+            if out:
+                out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    finally:
+        if out:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "attempts": attempts,
+        "errors": errors,
+        "changed": changed,
+        "mean_delta_pct": round(delta_sum / compared, 2) if compared else None,
+        "elapsed_s": round(elapsed, 2),
+        "attempts_per_s": round(attempts / elapsed, 1) if elapsed else None
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Speculative patient replies for predictable history questions.
+
+Most history-taking questions (allergies, medications, smoking, family
+history, ...) correspond to one CHECKLIST["history"] item and have an answer
+that only depends on the case. When a station is loaded, the patient's answers
+to the top-K canonical questions are generated in one background batch call.
+A student message that clearly asks one of those questions is then answered
+from that batch in milliseconds instead of waiting for a model reply.
+"""
+import math, re, threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from openai_utils import chat, route_model
+from persona import case_hash, persona_prompt
+from prompt_templates import PATIENT_PREFETCH_PROMPT
+from llm_metrics import bind_session
+
+# Canonical questions by intent, in prefetch priority order.
+# "item" is the index of the matching CHECKLIST["history"] item; the first
+# phrasing of each language is the one sent to the model. "anchors" are regexes
+# (on the lowercased message, Arabic letter variants unified) that must all
+# match for a message to be answered as that intent, so a question that merely
+# shares words with a canonical one ("Does it start when you walk?") isn't.
+CANONICAL_QUESTIONS = OrderedDict([
+    ("presenting", {"item": 1,
+        "en": ["What brings you in today?", "What seems to be the problem?", "How can I help you today?"],
+        "ar": ["ما الذي أتى بك اليوم؟", "ما هي المشكلة؟", "كيف يمكنني مساعدتك اليوم؟"],
+        "anchors": {"en": [r"\b(brings? you|brought you|the problem|help you( today)?\s*\?|what('s| is) wrong)"],
+                    "ar": [r"أتى بك|جاء بك|المشكلة\s*؟|مساعدتك|تشكو"]}}),
+    ("onset", {"item": 1,
+        "en": ["When did it start?", "How long have you had it?", "When did this begin?"],
+        "ar": ["متى بدأ؟", "منذ متى تعاني من ذلك؟"],
+        "anchors": {"en": [r"^\W*(when (did|was)|how long)\b|\bsince when\b",
+                           r"\b(start|started|begin|began|begun|had (it|this|the)|been going on|first notice)"],
+                    "ar": [r"^\W*(متى|منذ متى|كم من الوقت|كم مدة)", r"بدأ|بدأت|تعاني|عندك|لديك"]}}),
+    ("allergies", {"item": 9,
+        "en": ["Do you have any allergies?", "Are you allergic to anything?", "Any drug allergies?"],
+        "ar": ["هل لديك حساسية من أي شيء؟", "هل لديك حساسية من أي دواء؟"],
+        "anchors": {"en": [r"\ballerg"], "ar": [r"حساسية"]}}),
+    ("medications", {"item": 9,
+        "en": ["Are you taking any medications?", "What medicines do you take?", "Do you take any regular medication?",
+               "Are you on any medication?"],
+        "ar": ["هل تتناول أي أدوية؟", "ما هي الأدوية التي تأخذها؟", "هل تأخذ أي دواء؟"],
+        "anchors": {"en": [r"\b(medications?|medicines?|tablets|pills|prescri)"],
+                    "ar": [r"أدوية|الأدوية|دواء|حبوب"]}}),
+    ("past_medical", {"item": 7,
+        "en": ["Do you have any medical conditions?", "Any previous illnesses or hospital admissions?",
+               "Do you have any chronic diseases?"],
+        "ar": ["هل لديك أي أمراض مزمنة؟", "هل دخلت المستشفى من قبل؟"],
+        "anchors": {"en": [r"\b(medical (conditions?|problems?|history)|illness|chronic|hospital|admitted|diseases?)"],
+                    "ar": [r"أمراض|مرض|المستشفى|مزمن"]}}),
+    ("family_history", {"item": 10,
+        "en": ["Does anyone in your family have any medical problems?", "Is there any family history of illness?",
+               "Any illnesses that run in your family?"],
+        "ar": ["هل أحد في العائلة لديه أمراض؟", "هل يوجد تاريخ مرضي في العائلة؟"],
+        "anchors": {"en": [r"\b(family|relatives?|parents|mother|father|siblings?|brothers?|sisters?)\b",
+                           r"\b(history|problems?|illness|diseases?|conditions?|run in|runs in|suffer)"],
+                    "ar": [r"العائلة|عائلتك|الأهل|أهلك|أقاربك|والدك|والدتك",
+                           r"أمراض|مرض|تاريخ|يعاني|مصاب"]}}),
+    ("smoking", {"item": 11,
+        "en": ["Do you smoke?", "Have you ever smoked?", "How many cigarettes do you smoke?"],
+        "ar": ["هل تدخن؟", "كم سيجارة تدخن في اليوم؟"],
+        "anchors": {"en": [r"\b(smoke|smoked|smoking|smoker|cigarettes?|tobacco|vape|vaping)\b"],
+                    "ar": [r"تدخن|التدخين|سجائر|سيجارة|شيشة"]}}),
+    ("alcohol", {"item": 11,
+        "en": ["Do you drink alcohol?", "How much alcohol do you drink?"],
+        "ar": ["هل تشرب الكحول؟"],
+        "anchors": {"en": [r"\b(alcohol|beer|wine|spirits|units)\b|\bdo you drink\s*\?"],
+                    "ar": [r"الكحول|كحول|خمر"]}}),
+    ("surgical", {"item": 8,
+        "en": ["Have you had any operations?", "Any previous surgery?"],
+        "ar": ["هل أجريت أي عمليات جراحية؟"],
+        "anchors": {"en": [r"\b(operations?|surgery|surgeries|surgical|operated)\b"],
+                    "ar": [r"عمليات|عملية|جراح"]}}),
+    ("occupation", {"item": 11,
+        "en": ["What do you do for work?", "What is your job?", "What is your occupation?",
+               "What do you do for a living?"],
+        "ar": ["ما هي وظيفتك؟", "ماذا تعمل؟"],
+        "anchors": {"en": [r"\b(do you do for (work|a living)|your (job|work|occupation|profession)|employed)\b"],
+                    "ar": [r"وظيفتك|ماذا تعمل|عملك|مهنتك"]}}),
+    ("living", {"item": 11,
+        "en": ["Who do you live with?", "What are your living arrangements?", "Who lives at home with you?"],
+        "ar": ["مع من تعيش؟"],
+        "anchors": {"en": [r"\b(who do you live|who lives|living arrangements?|live alone)\b"],
+                    "ar": [r"مع من تعيش|مع من تسكن|تعيش وحدك"]}}),
+    ("concerns", {"item": 14,
+        "en": ["What are you worried it might be?", "Do you have any concerns?", "What do you think is causing it?"],
+        "ar": ["ما الذي يقلقك؟", "ما الذي تعتقد أنه يسبب ذلك؟"],
+        "anchors": {"en": [r"\b(worried|worries|concerns?|concerned|think (is|it is|might be) causing)"],
+                    "ar": [r"يقلقك|قلق|تعتقد|تظن"]}})
+])
+
+# Number of canonical questions answered per case
+PREFETCH_TOP_K = 10
+
+# Minimum similarity for a message to be answered from the prefetched replies,
+# and how far ahead of the second-best intent it must be (see benchmarks/prefetch_matching.py)
+PREFETCH_MATCH_THRESHOLD = 0.7
+PREFETCH_MATCH_MARGIN = 0.15
+
+# In a message joining clauses ("Do you smoke or drink?") a second intent scoring
+# this high means it asks about two topics, which one prefetched reply can't answer
+PREFETCH_SECOND_INTENT = 0.4
+_CONJUNCTION = re.compile(r"\b(and|or|also)\b|,|\s(و|أو)\s?", re.IGNORECASE)
+
+# Longer messages usually ask several things at once; leave them to the model
+PREFETCH_MAX_WORDS = 14
+
+# Prefetched cases kept in memory
+PREFETCH_MAX_CASES = 256
+
+_STOPWORDS = {
+    "en": {"a", "an", "the", "and", "or", "do", "does", "did", "you", "your", "have", "has", "had", "any",
+           "are", "is", "to", "of", "in", "on", "me", "can", "could", "would", "please", "tell", "i", "ok",
+           "okay", "so", "there", "ever", "that", "this", "it", "about", "some", "all", "what", "who",
+           "how", "for", "with", "be", "been", "might", "think", "at", "moment", "right", "now"},
+    "ar": {"هل", "أي", "من", "في", "على", "عن", "لديك", "ما", "هو", "هي", "و", "أو"}
+}
+
+def _unify(text):
+    """Lowercase and unify Arabic letter variants and diacritics"""
+    text = text.lower()
+    text = re.sub("[إأآ]", "ا", text).replace("ة", "ه").replace("ى", "ي")
+    return re.sub("[\u064B-\u0652]", "", text)  # Arabic diacritics
+
+def _normalize(text, lang):
+    """Lowercase, unify Arabic letter variants, drop punctuation and stopwords"""
+    words = re.findall(r"\w+", _unify(text))
+    stopwords = _STOPWORDS.get(lang, set())
+    return " ".join(w for w in words if w not in stopwords)
+
+def _trigrams(text):
+    padded = f" {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+def _cosine(a, b):
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    return dot / math.sqrt(sum(v * v for v in a.values()) * sum(v * v for v in b.values()))
+
+# Trigram vectors of every canonical phrasing, built once per language
+_phrasing_vectors = {}
+
+def _vectors(lang):
+    if lang not in _phrasing_vectors:
+        _phrasing_vectors[lang] = {
+            intent: [_trigrams(_normalize(q, lang)) for q in spec.get(lang) or spec["en"]]
+            for intent, spec in CANONICAL_QUESTIONS.items()
+        }
+    return _phrasing_vectors[lang]
+
+# Compiled anchors of every intent, built once per language
+_anchor_patterns = {}
+
+def _anchors(lang):
+    if lang not in _anchor_patterns:
+        _anchor_patterns[lang] = {
+            intent: [re.compile(_unify(anchor)) for anchor in spec["anchors"].get(lang) or spec["anchors"]["en"]]
+            for intent, spec in CANONICAL_QUESTIONS.items()
+        }
+    return _anchor_patterns[lang]
+
+def match_intent(message, lang="en"):
+    """
+    The canonical intent a student message asks about, or None.
+
+    A message matches when its best similarity to an intent's phrasings reaches
+    PREFETCH_MATCH_THRESHOLD, clearly beats every other intent and every anchor
+    of that intent is found in the message. Messages that join clauses and also
+    match a second intent are left to the model.
+
+    Returns:
+        Tuple of (intent, similarity) or None
+    """
+    if len(message.split()) > PREFETCH_MAX_WORDS:
+        return None
+    vector = _trigrams(_normalize(message, lang))
+    scores = sorted(
+        ((max(_cosine(vector, v) for v in vectors), intent) for intent, vectors in _vectors(lang).items()),
+        reverse=True
+    )
+    best, intent = scores[0]
+    runner_up = scores[1][0] if len(scores) > 1 else 0.0
+    if _CONJUNCTION.search(message) and runner_up >= PREFETCH_SECOND_INTENT:
+        return None
+    if best < PREFETCH_MATCH_THRESHOLD or best - runner_up < PREFETCH_MATCH_MARGIN:
+        return None
+    unified = _unify(message)
+    if not all(anchor.search(unified) for anchor in _anchors(lang)[intent]):
+        return None
+    return intent, round(best, 3)
+
+def _prefetch_messages(case, lang, intents):
+    """Batch request: the case's persona prompt plus every question to answer"""
+    questions = "\n".join(
+        f"- {intent}: {(CANONICAL_QUESTIONS[intent].get(lang) or CANONICAL_QUESTIONS[intent]['en'])[0]}"
+        for intent in intents
+    )
+    return [
+        {"role": "system", "content": persona_prompt(case)},
+        {"role": "user", "content": PATIENT_PREFETCH_PROMPT.format(lang=lang, questions=questions)}
+    ]
+
+def _fetch_replies(case, lang, intents):
+    """Run the batch call and return {intent: reply} for the answers that came back"""
+    raw = chat(_prefetch_messages(case, lang, intents), model=route_model("patient_prefetch"),
+               temperature=0.4, max_tokens=60 * len(intents), return_json=True, tag="patient_prefetch")
+    if not isinstance(raw, dict):
+        print("Patient reply prefetch returned no JSON object")
+        return {}
+    return {intent: str(raw[intent]).strip() for intent in intents
+            if isinstance(raw.get(intent), (str, int, float)) and str(raw[intent]).strip()}
+
+_prefetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="reply-prefetch")
+_prefetched = OrderedDict()   # (case hash, lang) -> future of {intent: reply}
+_prefetched_lock = threading.Lock()
+
+def prefetch_replies(case, lang="en", top_k=PREFETCH_TOP_K):
+    """
+    Start generating the case's answers to the top-K canonical questions in the background.
+    Safe to call on every rerun: each case and language is fetched only once.
+
+    Returns:
+        concurrent.futures.Future whose result is {intent: reply}
+    """
+    key = (case_hash(case), lang)
+    with _prefetched_lock:
+        future = _prefetched.get(key)
+        if future is None or (future.done() and future.exception() is not None):
+            intents = list(CANONICAL_QUESTIONS)[:top_k]
+            # Compile the persona prompt here so the worker doesn't write to a case the UI is reading
+            persona_prompt(case)
+            future = _prefetch_pool.submit(bind_session(_fetch_replies), case, lang, intents)
+            _prefetched[key] = future
+        _prefetched.move_to_end(key)
+        while len(_prefetched) > PREFETCH_MAX_CASES:
+            _prefetched.popitem(last=False)
+    return future
+
+def prefetched_reply(case, message, lang="en", exclude=()):
+    """
+    Answer a student message from the prefetched replies without waiting.
+
+    Args:
+        exclude: Intents already answered this way (a repeated question goes to the model)
+
+    Returns:
+        Tuple of (intent, reply), or None if the message doesn't clearly match an
+        intent or its reply isn't ready
+    """
+    match = match_intent(message, lang)
+    if match is None or match[0] in exclude:
+        return None
+    with _prefetched_lock:
+        future = _prefetched.get((case_hash(case), lang))
+    if future is None or not future.done() or future.exception() is not None:
+        return None
+    reply = future.result().get(match[0])
+    return (match[0], reply) if reply else None
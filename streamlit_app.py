@@ -1,12 +1,17 @@
-import streamlit as st, time, json, os, random
-from case_generator import generate_station, custom_case_generator
-from evaluator import evaluate, render_mark_sheet
+import streamlit as st, time, json, os, random, uuid
+from case_generator import custom_case_generator, repair_case
+from case_pool import CasePool
+from case_library import CaseLibrary
+from attempt_store import AttemptStore
+from evaluator import evaluate, submit_evaluation, render_mark_sheet, new_checklist_state, submit_checklist_update
 from timer_utils import start_timer, remaining
-from hint_engine import generate_hint
-from openai_utils import chat, patient_simulation
+from hint_engine import generate_hint, prefetch_hint
+from openai_utils import chat, patient_simulation_stream, requires_api_key
 from categories import CATEGORIES
 from prompt_templates import CANDIDATE_INSTRUCTIONS
 from checklist import CHECKLIST, MAX_SCORE
+from llm_metrics import set_session, session_summary, serve_metrics
+from reply_prefetch import prefetch_replies, prefetched_reply
 
 # Setup page config
 st.set_page_config("OSCE Chat Simulator", layout="wide", page_icon="🩺")
@@ -15,6 +20,11 @@ st.set_page_config("OSCE Chat Simulator", layout="wide", page_icon="🩺")
 if "phase" not in st.session_state:
     st.session_state.phase = "setup"
 
+# Attribute this session's LLM calls to it in the usage metrics
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+set_session(st.session_state.session_id)
+
 # Make sure API key is properly set up
 def get_api_key():
     """Get API key from environment or secrets"""
@@ -27,6 +37,77 @@ def get_api_key():
         
     return api_key
 
+@st.cache_resource
+def get_case_pool():
+    """Shared pre-generated case pool, refilled in the background once it has missed"""
+    return CasePool()
+
+@st.cache_resource
+def get_case_library():
+    """Shared searchable library of previously generated and uploaded cases"""
+    return CaseLibrary()
+
+@st.cache_resource
+def get_attempt_store():
+    """Shared durable store of attempts, written in the background"""
+    return AttemptStore()
+
+@st.cache_resource
+def start_metrics_server():
+    """Serve LLM metrics in Prometheus text format at /metrics when OSCE_METRICS_PORT is set"""
+    port = os.getenv("OSCE_METRICS_PORT")
+    return serve_metrics(int(port)) if port else None
+
+start_metrics_server()
+
+# Score the transcript in the background after every N student turns
+INCREMENTAL_SCORING_TURNS = 3
+
+def user_transcript(runtime):
+    """Transcript of the student's turns only, as sent to the scorer and hint engine"""
+    return "\n".join(m["content"] for m in runtime["msgs"] if m["role"] == "user")
+
+def finish_station(station, runtime):
+    """
+    Queue the current station for background evaluation and move to the next one.
+    The evaluation future is stored in st.session_state.eval_futures by station index.
+    """
+    transcript = user_transcript(runtime)
+    station["transcript"] = transcript
+    station["student_dx"] = runtime.get("dx", "")
+    
+    store = get_attempt_store()
+    attempt_id = runtime.get("attempt_id")
+    if attempt_id:
+        store.finish_attempt(attempt_id, transcript, runtime.get("msgs", []), runtime.get("dx", ""),
+                             runtime.get("ddx", ""), runtime.get("turn_timing", []))
+    
+    if "eval_futures" not in st.session_state:
+        st.session_state.eval_futures = {}
+    future = st.session_state.eval_futures[st.session_state.current] = submit_evaluation(
+        st.session_state.lang,
+        transcript,
+        runtime.get("dx", ""),
+        station["answer_key"],
+        station,
+        per_section=True,
+        prescore=True,
+        state=runtime.get("checklist_state"),
+        pending_update=runtime.get("score_future")
+    )
+    if attempt_id:
+        # Store the evaluation as soon as it finishes, from the evaluation thread
+        future.add_done_callback(
+            lambda f: store.record_evaluation(attempt_id, f.result()) if f.exception() is None else None
+        )
+    
+    # Prepare for next station
+    st.session_state.current += 1
+    
+    # If all stations complete, move to results phase
+    if st.session_state.current >= len(st.session_state.stations):
+        st.session_state.phase = "results"
+
 # OSCE marking criteria constants
 HISTORY_CRITERIA = [
     "Greets patient / introduces self and establishes rapport",
@@ -84,7 +165,7 @@ if st.session_state.phase == "setup":
     
     # Show API key warning if missing
     api_key = get_api_key()
-    if not api_key:
+    if not api_key and requires_api_key():
         st.error("⚠️ No OpenAI API key found. Please set the OPENAI_API_KEY environment variable or in Streamlit secrets.")
         st.stop()
     
@@ -94,6 +175,7 @@ if st.session_state.phase == "setup":
     with col1:
         st.subheader("Exam Settings")
         lang = st.selectbox("Language", {"en": "English", "ar": "Arabic"})
+        student_id = st.text_input("Student ID (optional)", help="Used to avoid repeating cases you have already seen")
         exam_mode = st.radio("Exam Mode", ["Random Cases", "Custom Cases", "Upload JSON Case"])
         
         if exam_mode == "Random Cases":
@@ -143,28 +225,47 @@ if st.session_state.phase == "setup":
         """)
         
         st.info("During the exam, take a complete history, perform appropriate examinations, and formulate a diagnosis.")
+        
+        pool_stats = get_case_pool().stats()
+        st.caption(
+            f"Case pool: {pool_stats['hits']} hits / {pool_stats['misses']} misses "
+            f"(hit rate {pool_stats['hit_rate']:.0%}), {sum(pool_stats['depths'].values())} cases ready"
+        )
     
     if st.button("Start Exam", type="primary"):
         st.session_state.lang = lang
+        st.session_state.student_id = student_id.strip()
+        st.session_state.specialty = specialty if exam_mode == "Random Cases" else ""
+        st.session_state.exam_id = uuid.uuid4().hex
         st.session_state.duration = 60 * t_min  # Store duration in seconds
         
         # Generate stations based on user's choice
         with st.spinner("Generating exam cases... This may take a moment"):
             if exam_mode == "Random Cases":
-                # Generate unique cases for each station
-                st.session_state.stations = []
+                # Build one spec per station, then generate them all concurrently
+                specs = []
                 for i in range(n_stn):
                     # Use selected chief complaint if specified
                     if chief_selection == "Choose Specific":
-                        custom_case = {"chief_complaint": selected_chief}
-                        new_case = generate_station(lang, custom_case)
+                        specs.append({"chief_complaint": selected_chief})
                     else:
                         # Use a random chief complaint from the selected specialty
-                        chief = random.choice(chief_options)
-                        custom_case = {"chief_complaint": chief}
-                        new_case = generate_station(lang, custom_case)
-                    
-                    # Initialize runtime state for this station
+                        specs.append({"chief_complaint": random.choice(chief_options)})
+                
+                # Serve unseen cases from the library, then the pre-generated pool;
+                # only what neither can supply is generated live
+                # Cases served earlier in this browser session are excluded too, so
+                # repeated exams without a student ID don't get the same cases
+                st.session_state.stations = get_case_library().take_stations(
+                    lang, specs, specialty=specialty, student=student_id.strip(),
+                    fallback=lambda lang, missing: get_case_pool().take_stations(
+                        lang, missing, specialty=specialty, max_concurrency=5
+                    ),
+                    served=st.session_state.setdefault("served_case_ids", set())
+                )
+                
+                # Initialize runtime state for each station
+                for new_case in st.session_state.stations:
                     new_case["_runtime"] = {
                         "timer_started": False,
                         "diagnosis_popup": False,
@@ -172,14 +273,33 @@ if st.session_state.phase == "setup":
                         "lab_results_viewed": False
                     }
                     
-                    st.session_state.stations.append(new_case)
-                    
             elif exam_mode == "Custom Cases":
                 if not custom_case_desc.strip():
                     st.error("Please provide a description for your custom case")
                     st.stop()
                 
-                case = custom_case_generator(lang, custom_case_desc)
+                # Preview the candidate instructions as soon as those fields have streamed in
+                preview = st.empty()
+                preview_fields = {}
+                def show_field(key, value):
+                    if key not in ["patientInfo", "chiefComplaint"]:
+                        return
+                    preview_fields[key] = value
+                    info = preview_fields.get("patientInfo") or {}
+                    if isinstance(info, dict) and "chiefComplaint" in preview_fields:
+                        preview.info(CANDIDATE_INSTRUCTIONS.format(
+                            minutes=t_min,
+                            name=info.get("name", ""),
+                            age=info.get("age", ""),
+                            gender=info.get("gender", ""),
+                            chief=preview_fields["chiefComplaint"]
+                        ))
+                
+                case = custom_case_generator(lang, custom_case_desc, on_field=show_field)
+                preview.empty()
+                case_id = get_case_library().add(case, lang, source="custom")
+                get_case_library().mark_seen(student_id.strip(), [case_id])
+                st.session_state.setdefault("served_case_ids", set()).add(case_id)
                 case["_runtime"] = {
                     "timer_started": False,
                     "diagnosis_popup": False,
@@ -195,6 +315,17 @@ if st.session_state.phase == "setup":
                     
                 try:
                     case = json.load(uploaded_file)
+                    if not isinstance(case, dict):
+                        raise ValueError("the file must contain one case object")
+                    # Uploaded cases get the same validation and repair as generated ones
+                    info = case.get("patientInfo") if isinstance(case.get("patientInfo"), dict) else {}
+                    problems = repair_case(case, str(case.get("chiefComplaint") or "Unspecified complaint"),
+                                           info.get("age", 40), str(info.get("gender", "male")), lang)
+                    if problems:
+                        st.warning(f"Repaired fields in the uploaded case: {', '.join(problems)}")
+                    case_id = get_case_library().add(case, lang, source="uploaded")
+                    get_case_library().mark_seen(student_id.strip(), [case_id])
+                    st.session_state.setdefault("served_case_ids", set()).add(case_id)
                     case["_runtime"] = {
                         "timer_started": False,
                         "diagnosis_popup": False,
@@ -223,6 +354,15 @@ elif st.session_state.phase == "exam":
         runtime["timer_started"] = True
         # Initialize message history for this station
         runtime["msgs"] = []
+        # Running checklist state, scored incrementally during the encounter
+        runtime["checklist_state"] = new_checklist_state()
+        runtime["attempt_id"] = get_attempt_store().start_attempt(
+            station, st.session_state.lang, st.session_state.get("student_id", ""),
+            st.session_state.get("specialty", ""), st.session_state.get("exam_id"), s_idx
+        )
+    
+    # Precompute the patient's answers to common history questions in the background
+    prefetch_replies(station, st.session_state.lang)
     
     # Get session data
     if runtime.get("timer") is None:
@@ -246,9 +386,13 @@ elif st.session_state.phase == "exam":
         
         # Hint button
         if st.button("💡 Hint"):
-            transcript = "\n".join(m["content"] for m in runtime["msgs"] if m["role"] == "user")
-            hint = generate_hint(st.session_state.lang, transcript)
+            transcript = user_transcript(runtime)
+            hint = generate_hint(st.session_state.lang, transcript, station, runtime.get("checklist_state"))
+            runtime["hints_used"] = runtime.get("hints_used", 0) + 1
             st.info(f"**Hint:** {hint}")
+            if runtime.get("attempt_id"):
+                get_attempt_store().record_hint(runtime["attempt_id"], hint,
+                                                sum(1 for m in runtime["msgs"] if m["role"] == "user"))
         
         # Show Case Details (collapse by default)
         with st.expander("📑 Patient Basic Info", expanded=False):
@@ -279,7 +423,6 @@ elif st.session_state.phase == "exam":
     st.header(f"Station {s_idx+1}")
     
     # Progress indicator
-    progress_text = f"Station {s_idx+1}/{len(st.session_state.stations)}"
     st.progress(s_idx / len(st.session_state.stations))
     
     # Chief complaint as initial context
@@ -323,22 +466,58 @@ elif st.session_state.phase == "exam":
             for m in runtime["msgs"][:-1]  # Exclude the just-added message
         ]
         
-        # Extract patient details for better simulation
-        patient_info = station.get("patientInfo", {})
-        history_details = station.get("historyDetails", {})
-        past_medical_history = station.get("pastMedicalHistory", [])
-        medications = station.get("medications", [])
-        social_history = station.get("socialHistory", {})
+        # Stream the reply into the chat container as it is generated
+        with chat_container:
+            st.chat_message("user").write(prompt)
+            reply_placeholder = st.chat_message("assistant").empty()
         
-        reply = patient_simulation(
-            patient_case=station,
-            user_message=prompt,
-            chat_history=chat_history,
-            model="gpt-4o"
-        )
+        turn_start = time.time()
+        first_token = None
+        reply = ""
+        
+        # A common history question is answered from the prefetched replies (once per intent)
+        prefetched = prefetched_reply(station, prompt, st.session_state.lang,
+                                      exclude=runtime.setdefault("prefetch_served", []))
+        if prefetched:
+            runtime["prefetch_served"].append(prefetched[0])
+            reply = prefetched[1]
+            first_token = time.time() - turn_start
+        else:
+            for piece in patient_simulation_stream(
+                patient_case=station,
+                user_message=prompt,
+                chat_history=chat_history
+            ):
+                if first_token is None:
+                    first_token = time.time() - turn_start
+                reply += piece
+                reply_placeholder.markdown(reply + "▌")
+        reply_placeholder.markdown(reply)
+        
+        # Record time-to-first-token and total generation time for this turn
+        runtime.setdefault("turn_timing", []).append({
+            "turn": len(runtime["msgs"]),
+            "ttft": round(first_token if first_token is not None else time.time() - turn_start, 3),
+            "total": round(time.time() - turn_start, 3),
+            "prefetched": bool(prefetched)
+        })
         
         # Add AI response to history
         runtime["msgs"].append({"role": "assistant", "content": reply})
+        
+        # Score the new turns in the background every few student turns
+        n_user_turns = sum(1 for m in runtime["msgs"] if m["role"] == "user")
+        pending_update = runtime.get("score_future")
+        if n_user_turns % INCREMENTAL_SCORING_TURNS == 0 and (pending_update is None or pending_update.done()):
+            if "checklist_state" not in runtime:
+                runtime["checklist_state"] = new_checklist_state()
+            runtime["score_future"] = submit_checklist_update(
+                st.session_state.lang, runtime["checklist_state"], user_transcript(runtime), station, prescore=True
+            )
+        
+        # Have the next hint ready before a student who has been using hints asks again
+        prefetch_hint(st.session_state.lang, user_transcript(runtime), station, runtime.get("checklist_state"),
+                      likely=runtime.get("hints_used", 0) > 0)
         st.rerun()
 
     ### ---- Diagnosis input unlocks near end of time ----
@@ -380,25 +559,7 @@ elif st.session_state.phase == "exam":
                 if submit_dx and runtime["dx"]:
                     runtime["diagnosis_submitted"] = True
                     if secs == 0:
-                        # Function to handle moving to next station
-                        transcript = "\n".join(m["content"] for m in runtime["msgs"] if m["role"] == "user")
-                        result = evaluate(
-                            st.session_state.lang, 
-                            transcript,
-                            runtime.get("dx", ""), 
-                            station["answer_key"],
-                            station
-                        )
-                        station["result"] = result
-                        station["transcript"] = transcript
-                        station["student_dx"] = runtime.get("dx", "")
-                        
-                        # Prepare for next station
-                        st.session_state.current += 1
-                        
-                        # If all stations complete, move to results phase
-                        if st.session_state.current >= len(st.session_state.stations):
-                            st.session_state.phase = "results"
+                        finish_station(station, runtime)
                     st.rerun()
 
     # Auto-submit when timer hits zero
@@ -408,32 +569,49 @@ elif st.session_state.phase == "exam":
             runtime["diagnosis_popup"] = True
             st.error("⚠️ Time's up! You must submit a diagnosis to continue.")
         else:
-            # Function to handle moving to next station
-            transcript = "\n".join(m["content"] for m in runtime["msgs"] if m["role"] == "user")
-            result = evaluate(
-                st.session_state.lang, 
-                transcript,
-                runtime.get("dx", ""), 
-                station["answer_key"],
-                station
-            )
-            station["result"] = result
-            station["transcript"] = transcript
-            station["student_dx"] = runtime.get("dx", "")
-            
-            # Prepare for next station
-            st.session_state.current += 1
-            
-            # If all stations complete, move to results phase
-            if st.session_state.current >= len(st.session_state.stations):
-                st.session_state.phase = "results"
-            
+            finish_station(station, runtime)
             st.rerun()
 
 ### ------------------ 3. RESULTS DASHBOARD ------------------ ###
 else:
     st.title("📊 OSCE Examination Results")
     
+    # Collect finished background evaluations; poll until every station is scored
+    eval_futures = st.session_state.get("eval_futures", {})
+    pending = []
+    for i, s in enumerate(st.session_state.stations):
+        future = eval_futures.get(i)
+        if "result" in s or future is None:
+            continue
+        if not future.done():
+            pending.append(i)
+            continue
+        try:
+            s["result"] = future.result()
+        except Exception as e:
+            print(f"Background evaluation failed for station {i+1}: {str(e)}")
+            # Score it again in the foreground rather than losing the station
+            s["result"] = evaluate(
+                st.session_state.lang,
+                s.get("transcript", ""),
+                s.get("student_dx", ""),
+                s["answer_key"],
+                s,
+                per_section=True,
+                prescore=True
+            )
+            if s.get("_runtime", {}).get("attempt_id"):
+                get_attempt_store().record_evaluation(s["_runtime"]["attempt_id"], s["result"])
+    
+    if pending:
+        n_total = len(st.session_state.stations)
+        st.progress((n_total - len(pending)) / n_total, text=f"Scoring stations... {n_total - len(pending)}/{n_total} complete")
+        for i, s in enumerate(st.session_state.stations):
+            status = "⏳ Scoring in progress" if i in pending else "✅ Scored"
+            st.write(f"**Station {i+1}: {s.get('chiefComplaint', '')}** - {status}")
+        time.sleep(1)
+        st.rerun()
+    
     # Calculate overall score
     total_score = 0
     max_score = 0
@@ -542,7 +720,6 @@ else:
                 st.markdown(mark_sheet)
                 
                 # Add download button for the mark sheet
-                mark_sheet_pdf = f"osce_mark_sheet_station_{i+1}.pdf"
                 st.download_button(
                     "Download Mark Sheet",
                     mark_sheet,
@@ -558,7 +735,7 @@ else:
             # Create an expandable section for each station
             with st.expander(f"Station {i+1}: {s['chiefComplaint']}", expanded=i==0):
                 # Remove system/internal data for cleaner display
-                display_data = {k: v for k, v in s.items() if k not in ['result', 'transcript', 'student_dx', 'generated_timestamp', '_runtime']}
+                display_data = {k: v for k, v in s.items() if k not in ['result', 'transcript', 'student_dx', 'generated_timestamp'] and not k.startswith('_')}
                 st.json(display_data)
     
     # Final recommendations
@@ -577,6 +754,18 @@ else:
     
     st.write(overall_feedback)
     
+    # Cost and latency of this session's LLM calls, per feature
+    usage = session_summary(st.session_state.session_id)
+    if usage:
+        with st.expander("LLM usage for this session"):
+            st.table([
+                {"feature": tag, "calls": u["calls"], "errors": u["errors"], "retries": u["retries"],
+                 "cache hits": u["cache_hits"], "prompt tokens": u["prompt_tokens"],
+                 "completion tokens": u["completion_tokens"], "p50 ms": u["p50_ms"],
+                 "p95 ms": u["p95_ms"], "cost (USD)": u["cost_usd"]}
+                for tag, u in usage.items()
+            ])
+    
     # Restart button
     if st.button("Start New Exam", type="primary"):
         for key in list(st.session_state.keys()):